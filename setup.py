@@ -16,7 +16,7 @@ install_requires = [
     'setuptools>=19.0',
     'ecdsa>=0.9',
     'mnemonic>=0.17',
-    'requests>=2.4.0',
+    'requests>=2.16.0',
     'click>=6.2',
     'pyblake2>=0.9.3',
     'libusb1>=1.6.4',
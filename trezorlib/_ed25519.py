@@ -1,10 +1,14 @@
 # orignal version downloaded from https://ed25519.cr.yp.to/python/ed25519.py
 # modified for Python 3 by Jochen Hoenicke <hoenicke@gmail.com>
+# point arithmetic in extended coordinates with a precomputed table for B
 
 import hashlib
-from typing import Tuple, NewType
+import os
+from typing import Iterable, List, Optional, Sequence, Tuple, NewType
 
 Point = NewType("Point", Tuple[int, int])
+# extended coordinates (X, Y, Z, T) with x = X/Z, y = Y/Z, x*y = T/Z
+ExtendedPoint = Tuple[int, int, int, int]
 
 b = 256
 q = 2 ** 255 - 19
@@ -18,19 +22,15 @@ def H(m: bytes) -> bytes:
 def expmod(b: int, e: int, m: int) -> int:
     if e < 0:
         raise ValueError('negative exponent')
-    if e == 0:
-        return 1
-    t = expmod(b, e >> 1, m) ** 2 % m
-    if e & 1:
-        t = (t * b) % m
-    return t
+    return pow(b, e, m)
 
 
 def inv(x: int) -> int:
-    return expmod(x, q - 2, q)
+    return pow(x, q - 2, q)
 
 
-d = -121665 * inv(121666)
+d = -121665 * inv(121666) % q
+d2 = 2 * d % q
 I = expmod(2, (q - 1) >> 2, q)
 
 
@@ -44,63 +44,204 @@ def xrecover(y: int) -> int:
     return x
 
 
-By = 4 * inv(5)
+By = 4 * inv(5) % q
 Bx = xrecover(By)
 B = Point((Bx % q, By % q))
 
+IDENTITY = (0, 1, 1, 0)
+
+
+def to_extended(P: Point) -> ExtendedPoint:
+    return (P[0], P[1], 1, P[0] * P[1] % q)
+
+
+def to_affine(P: ExtendedPoint) -> Point:
+    zi = inv(P[2])
+    return Point((P[0] * zi % q, P[1] * zi % q))
+
+
+def _batch_to_affine(points: List[ExtendedPoint]) -> List[Point]:
+    # Montgomery's trick: one inversion for the whole batch
+    acc = 1
+    prefix = []
+    for P in points:
+        prefix.append(acc)
+        acc = acc * P[2] % q
+    acc = inv(acc)
+    result = [None] * len(points)
+    for i in range(len(points) - 1, -1, -1):
+        X, Y, Z, _ = points[i]
+        zi = acc * prefix[i] % q
+        acc = acc * Z % q
+        result[i] = Point((X * zi % q, Y * zi % q))
+    return result
+
+
+def add_extended(P: ExtendedPoint, Q: ExtendedPoint) -> ExtendedPoint:
+    # unified addition, also valid for P == Q
+    X1, Y1, Z1, T1 = P
+    X2, Y2, Z2, T2 = Q
+    A = (Y1 - X1) * (Y2 - X2) % q
+    B_ = (Y1 + X1) * (Y2 + X2) % q
+    C = T1 * d2 * T2 % q
+    D = 2 * Z1 * Z2 % q
+    E = B_ - A
+    F = D - C
+    G = D + C
+    H_ = B_ + A
+    return (E * F % q, G * H_ % q, F * G % q, E * H_ % q)
+
+
+def _add_cached(P: ExtendedPoint, Q: Tuple[int, int, int]) -> ExtendedPoint:
+    # Q as (y - x, y + x, 2*d*x*y) of an affine point
+    X1, Y1, Z1, T1 = P
+    A = (Y1 - X1) * Q[0] % q
+    B_ = (Y1 + X1) * Q[1] % q
+    C = T1 * Q[2] % q
+    D = 2 * Z1
+    E = B_ - A
+    F = D - C
+    G = D + C
+    H_ = B_ + A
+    return (E * F % q, G * H_ % q, F * G % q, E * H_ % q)
+
+
+def double_extended(P: ExtendedPoint) -> ExtendedPoint:
+    X1, Y1, Z1, _ = P
+    A = X1 * X1 % q
+    B_ = Y1 * Y1 % q
+    C = 2 * Z1 * Z1 % q
+    E = ((X1 + Y1) * (X1 + Y1) - A - B_) % q
+    G = B_ - A
+    F = G - C
+    H_ = -A - B_
+    return (E * F % q, G * H_ % q, F * G % q, E * H_ % q)
+
+
+def scalarmult_extended(P: ExtendedPoint, e: int) -> ExtendedPoint:
+    # 4-bit fixed window, `e` is not reduced so that any point can be used
+    if e < 0:
+        raise ValueError('negative scalar')
+    multiples = [P]
+    for _ in range(14):
+        multiples.append(add_extended(multiples[-1], P))
+    Q = IDENTITY
+    for shift in range(((e.bit_length() + 3) & ~3) - 4, -4, -4):
+        Q = double_extended(double_extended(double_extended(double_extended(Q))))
+        digit = (e >> shift) & 15
+        if digit:
+            Q = add_extended(Q, multiples[digit - 1])
+    return Q
+
+
+_WINDOW = 8
+_B_TABLE = None  # type: Optional[List[List[Tuple[int, int, int]]]]
+
+
+def _b_table() -> List[List[Tuple[int, int, int]]]:
+    # row k holds j * 2**(8k) * B for j = 1..255
+    global _B_TABLE
+    if _B_TABLE is None:
+        rows = []
+        base = to_extended(B)
+        for _ in range(0, b, _WINDOW):
+            row = [base]
+            for _ in range(2, 1 << _WINDOW):
+                row.append(add_extended(row[-1], base))
+            rows.append(row)
+            base = double_extended(row[(1 << (_WINDOW - 1)) - 1])
+        flat = _batch_to_affine([P for row in rows for P in row])
+        cached = [((y - x) % q, (y + x) % q, d2 * x * y % q) for x, y in flat]
+        size = (1 << _WINDOW) - 1
+        _B_TABLE = [cached[i:i + size] for i in range(0, len(cached), size)]
+    return _B_TABLE
+
+
+def scalarmult_B(e: int) -> ExtendedPoint:
+    e %= l
+    mask = (1 << _WINDOW) - 1
+    Q = IDENTITY
+    for row in _b_table():
+        digit = e & mask
+        if digit:
+            Q = _add_cached(Q, row[digit - 1])
+        e >>= _WINDOW
+    return Q
+
+
+def multiscalarmult(points: Sequence[ExtendedPoint], scalars: Sequence[int]) -> ExtendedPoint:
+    """Compute the sum of scalars[i] * points[i] with the bucket method."""
+    if not points:
+        return IDENTITY
+    window = max(1, min(12, len(points).bit_length() - 2))
+    mask = (1 << window) - 1
+    top = max(e.bit_length() for e in scalars)
+    Q = IDENTITY
+    for shift in range((top + window - 1) // window * window - window, -window, -window):
+        for _ in range(window):
+            Q = double_extended(Q)
+        buckets = [None] * mask
+        for P, e in zip(points, scalars):
+            digit = (e >> shift) & mask
+            if digit:
+                bucket = buckets[digit - 1]
+                buckets[digit - 1] = P if bucket is None else add_extended(bucket, P)
+        # sum of j * buckets[j - 1]
+        running = None
+        for bucket in reversed(buckets):
+            if bucket is not None:
+                running = bucket if running is None else add_extended(running, bucket)
+            if running is not None:
+                Q = add_extended(Q, running)
+    return Q
+
 
 def edwards(P: Point, Q: Point) -> Point:
-    x1 = P[0]
-    y1 = P[1]
-    x2 = Q[0]
-    y2 = Q[1]
-    x3 = (x1 * y2 + x2 * y1) * inv(1 + d * x1 * x2 * y1 * y2)
-    y3 = (y1 * y2 + x1 * x2) * inv(1 - d * x1 * x2 * y1 * y2)
-    return Point((x3 % q, y3 % q))
+    return to_affine(add_extended(to_extended(P), to_extended(Q)))
 
 
 def scalarmult(P: Point, e: int) -> Point:
     if e == 0:
         return Point((0, 1))
-    Q = scalarmult(P, e >> 1)
-    Q = edwards(Q, Q)
-    if e & 1:
-        Q = edwards(Q, P)
-    return Q
+    if P == B:
+        return to_affine(scalarmult_B(e))
+    return to_affine(scalarmult_extended(to_extended(P), e))
 
 
 def encodeint(y: int) -> bytes:
-    bits = [(y >> i) & 1 for i in range(b)]
-    return bytes([sum([bits[i * 8 + j] << j for j in range(8)]) for i in range(b >> 3)])
+    return (y & ((1 << b) - 1)).to_bytes(b >> 3, 'little')
 
 
 def encodepoint(P: Point) -> bytes:
     x = P[0]
     y = P[1]
-    bits = [(y >> i) & 1 for i in range(b - 1)] + [x & 1]
-    return bytes([sum([bits[i * 8 + j] << j for j in range(8)]) for i in range(b >> 3)])
+    return ((y & ((1 << (b - 1)) - 1)) | ((x & 1) << (b - 1))).to_bytes(b >> 3, 'little')
 
 
 def bit(h: bytes, i: int) -> int:
     return (h[i >> 3] >> (i & 7)) & 1
 
 
+def secret_scalar(h: bytes) -> int:
+    # bits 3..253 of the hash, with bit 254 set
+    return int.from_bytes(h[:b >> 3], 'little') & ((1 << (b - 2)) - 8) | (1 << (b - 2))
+
+
 def publickey(sk: bytes) -> bytes:
     h = H(sk)
-    a = 2 ** (b - 2) + sum(2 ** i * bit(h, i) for i in range(3, b - 2))
+    a = secret_scalar(h)
     A = scalarmult(B, a)
     return encodepoint(A)
 
 
 def Hint(m: bytes) -> int:
-    h = H(m)
-    return sum(2 ** i * bit(h, i) for i in range(2 * b))
+    return int.from_bytes(H(m), 'little')
 
 
 def signature(m: bytes, sk: bytes, pk: bytes) -> bytes:
     h = H(sk)
-    a = 2 ** (b - 2) + sum(2 ** i * bit(h, i) for i in range(3, b - 2))
-    r = Hint(bytes([h[i] for i in range(b >> 3, b >> 2)]) + m)
+    a = secret_scalar(h)
+    r = Hint(h[b >> 3:b >> 2] + m)
     R = scalarmult(B, r)
     S = (r + Hint(encodepoint(R) + pk + m) * a) % l
     return encodepoint(R) + encodeint(S)
@@ -113,11 +254,11 @@ def isoncurve(P: Point) -> bool:
 
 
 def decodeint(s: bytes) -> int:
-    return sum(2 ** i * bit(s, i) for i in range(0, b))
+    return int.from_bytes(s[:b >> 3], 'little')
 
 
 def decodepoint(s: bytes) -> Point:
-    y = sum(2 ** i * bit(s, i) for i in range(0, b - 1))
+    y = int.from_bytes(s[:b >> 3], 'little') & ((1 << (b - 1)) - 1)
     x = xrecover(y)
     if x & 1 != bit(s, b - 1):
         x = q - x
@@ -127,6 +268,10 @@ def decodepoint(s: bytes) -> Point:
     return P
 
 
+def _equal_extended(P: ExtendedPoint, Q: ExtendedPoint) -> bool:
+    return (P[0] * Q[2] - Q[0] * P[2]) % q == 0 and (P[1] * Q[2] - Q[1] * P[2]) % q == 0
+
+
 def checkvalid(s: bytes, m: bytes, pk: bytes) -> None:
     if len(s) != b >> 2:
         raise ValueError('signature length is wrong')
@@ -136,5 +281,40 @@ def checkvalid(s: bytes, m: bytes, pk: bytes) -> None:
     A = decodepoint(pk)
     S = decodeint(s[b >> 3:b >> 2])
     h = Hint(encodepoint(R) + pk + m)
-    if scalarmult(B, S) != edwards(R, scalarmult(A, h)):
+    left = scalarmult_B(S)
+    right = add_extended(to_extended(R), scalarmult_extended(to_extended(A), h))
+    if not _equal_extended(left, right):
         raise ValueError('signature does not pass verification')
+
+
+def checkvalid_batch(items: Iterable[Tuple[bytes, bytes, bytes]]) -> bool:
+    """Check many (signature, message, public key) triples at once.
+
+    Uses a random linear combination of the verification equations,
+    multiplied by the cofactor. Returns False if any signature is
+    invalid, without telling which one.
+    """
+    s_sum = 0
+    points = []
+    scalars = []
+    for s, m, pk in items:
+        if len(s) != b >> 2 or len(pk) != b >> 3:
+            return False
+        try:
+            R = decodepoint(s[0:b >> 3])
+            A = decodepoint(pk)
+        except ValueError:
+            return False
+        S = decodeint(s[b >> 3:b >> 2])
+        h = Hint(encodepoint(R) + pk + m)
+        z = int.from_bytes(os.urandom(16), 'little')
+        s_sum += z * S
+        points += [to_extended(R), to_extended(A)]
+        scalars += [z, z * h % l]
+
+    left = scalarmult_B(s_sum)
+    right = multiscalarmult(points, scalars)
+    diff = add_extended(left, (-right[0] % q, right[1], right[2], -right[3] % q))
+    for _ in range(3):
+        diff = double_extended(diff)
+    return _equal_extended(diff, IDENTITY)
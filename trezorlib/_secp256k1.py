@@ -0,0 +1,229 @@
+# This file is part of the Trezor project.
+#
+# Copyright (C) 2012-2018 SatoshiLabs and contributors
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the License along with this library.
+# If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
+
+'''
+secp256k1 arithmetic for public key operations.
+
+Points are kept in Jacobian coordinates (X, Y, Z), representing the affine
+point (X / Z^2, Y / Z^3), so that additions need no modular inversion.
+Z == 0 is the point at infinity. Affine points are (x, y) tuples.
+
+Multiples of the generator use a precomputed table of 32 windows of 8 bits,
+built on first use. Not constant time, do not use with secret scalars.
+'''
+
+from typing import List, Optional, Sequence, Tuple
+
+P = 2 ** 256 - 2 ** 32 - 977
+N = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+G = (0x79BE667EF9DCBBAC55A06295CE870B07029BFCDB2DCE28D959F2815B16F81798,
+     0x483ADA7726A3C4655DA4FBFC0E1108A8FD17B448A68554199C47D08FFB10D4B8)
+
+Affine = Tuple[int, int]
+Jacobian = Tuple[int, int, int]
+
+INFINITY = (0, 1, 0)
+
+_WINDOW = 8
+_G_TABLE = None  # type: Optional[List[List[Affine]]]
+
+
+def inv(x: int, m: int = P) -> int:
+    return pow(x, m - 2, m)
+
+
+def to_jacobian(p: Affine) -> Jacobian:
+    return (p[0], p[1], 1)
+
+
+def to_affine(p: Jacobian) -> Affine:
+    X, Y, Z = p
+    if not Z:
+        raise ValueError('Point at infinity')
+    zi = inv(Z)
+    zi2 = zi * zi % P
+    return (X * zi2 % P, Y * zi2 * zi % P)
+
+
+def batch_to_affine(points: Sequence[Jacobian]) -> List[Affine]:
+    # Montgomery's trick: one inversion for the whole batch
+    if not points:
+        return []
+    acc = 1
+    prefix = []
+    for X, Y, Z in points:
+        if not Z:
+            raise ValueError('Point at infinity')
+        prefix.append(acc)
+        acc = acc * Z % P
+    acc = inv(acc)
+    result = [None] * len(points)
+    for i in range(len(points) - 1, -1, -1):
+        X, Y, Z = points[i]
+        zi = acc * prefix[i] % P
+        acc = acc * Z % P
+        zi2 = zi * zi % P
+        result[i] = (X * zi2 % P, Y * zi2 * zi % P)
+    return result
+
+
+def double(p: Jacobian) -> Jacobian:
+    X1, Y1, Z1 = p
+    if not Z1 or not Y1:
+        return INFINITY
+    A = X1 * X1 % P
+    B = Y1 * Y1 % P
+    C = B * B % P
+    D = 2 * ((X1 + B) * (X1 + B) - A - C) % P
+    E = 3 * A
+    X3 = (E * E - 2 * D) % P
+    Y3 = (E * (D - X3) - 8 * C) % P
+    Z3 = 2 * Y1 * Z1 % P
+    return (X3, Y3, Z3)
+
+
+def add(p: Jacobian, q: Jacobian) -> Jacobian:
+    X1, Y1, Z1 = p
+    X2, Y2, Z2 = q
+    if not Z1:
+        return q
+    if not Z2:
+        return p
+    Z1Z1 = Z1 * Z1 % P
+    Z2Z2 = Z2 * Z2 % P
+    U1 = X1 * Z2Z2 % P
+    U2 = X2 * Z1Z1 % P
+    S1 = Y1 * Z2 * Z2Z2 % P
+    S2 = Y2 * Z1 * Z1Z1 % P
+    H = (U2 - U1) % P
+    r = (S2 - S1) % P
+    if not H:
+        return double(p) if not r else INFINITY
+    HH = H * H % P
+    HHH = H * HH % P
+    V = U1 * HH % P
+    X3 = (r * r - HHH - 2 * V) % P
+    Y3 = (r * (V - X3) - S1 * HHH) % P
+    Z3 = H * Z1 * Z2 % P
+    return (X3, Y3, Z3)
+
+
+def add_affine(p: Jacobian, q: Affine) -> Jacobian:
+    # mixed addition, q has Z == 1
+    X1, Y1, Z1 = p
+    x2, y2 = q
+    if not Z1:
+        return (x2, y2, 1)
+    Z1Z1 = Z1 * Z1 % P
+    U2 = x2 * Z1Z1 % P
+    S2 = y2 * Z1 * Z1Z1 % P
+    H = (U2 - X1) % P
+    r = (S2 - Y1) % P
+    if not H:
+        return double(p) if not r else INFINITY
+    HH = H * H % P
+    HHH = H * HH % P
+    V = X1 * HH % P
+    X3 = (r * r - HHH - 2 * V) % P
+    Y3 = (r * (V - X3) - Y1 * HHH) % P
+    Z3 = Z1 * H % P
+    return (X3, Y3, Z3)
+
+
+def neg(p: Jacobian) -> Jacobian:
+    return (p[0], -p[1] % P, p[2])
+
+
+def _g_table() -> List[List[Affine]]:
+    global _G_TABLE
+    if _G_TABLE is None:
+        rows = []
+        base = G
+        for _ in range(0, 256, _WINDOW):
+            row = [to_jacobian(base)]
+            for _ in range(2, 1 << _WINDOW):
+                row.append(add_affine(row[-1], base))
+            rows.append(row)
+            # 2**WINDOW * base = 2 * (2**(WINDOW - 1) * base)
+            base = to_affine(double(row[(1 << (_WINDOW - 1)) - 1]))
+        flat = batch_to_affine([p for row in rows for p in row])
+        size = (1 << _WINDOW) - 1
+        _G_TABLE = [flat[i:i + size] for i in range(0, len(flat), size)]
+    return _G_TABLE
+
+
+def mul_g(k: int) -> Jacobian:
+    """Multiply the generator by `k`."""
+    k %= N
+    table = _g_table()
+    mask = (1 << _WINDOW) - 1
+    result = INFINITY
+    for row in table:
+        digit = k & mask
+        if digit:
+            result = add_affine(result, row[digit - 1])
+        k >>= _WINDOW
+    return result
+
+
+def mul(p: Affine, k: int) -> Jacobian:
+    """Multiply an arbitrary point by `k`, with 4-bit windows."""
+    k %= N
+    if not k:
+        return INFINITY
+    multiples = [to_jacobian(p)]
+    for _ in range(14):
+        multiples.append(add_affine(multiples[-1], p))
+    multiples = batch_to_affine(multiples)
+
+    result = INFINITY
+    for shift in range(((k.bit_length() + 3) & ~3) - 4, -4, -4):
+        result = double(double(double(double(result))))
+        digit = (k >> shift) & 15
+        if digit:
+            result = add_affine(result, multiples[digit - 1])
+    return result
+
+
+def mul_add_g(a: int, p: Affine, b: int) -> Jacobian:
+    """Compute a * G + b * p."""
+    return add(mul_g(a), mul(p, b))
+
+
+def is_on_curve(p: Affine) -> bool:
+    x, y = p
+    return (y * y - x * x * x - 7) % P == 0
+
+
+def decompress(public_key: bytes) -> Affine:
+    """Decode a compressed or uncompressed SEC public key."""
+    if len(public_key) == 65 and public_key[0] == 4:
+        point = (int.from_bytes(public_key[1:33], 'big'), int.from_bytes(public_key[33:], 'big'))
+    elif len(public_key) == 33 and public_key[0] in (2, 3):
+        x = int.from_bytes(public_key[1:], 'big')
+        y = pow((x * x * x + 7) % P, (P + 1) // 4, P)
+        if (y & 1) != (public_key[0] & 1):
+            y = P - y
+        point = (x, y)
+    else:
+        raise ValueError('Invalid public key')
+    if point[0] >= P or not is_on_curve(point):
+        raise ValueError('Public key is not on the curve')
+    return point
+
+
+def compress(p: Affine) -> bytes:
+    return bytes((2 + (p[1] & 1),)) + p[0].to_bytes(32, 'big')
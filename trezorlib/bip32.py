@@ -0,0 +1,226 @@
+# This file is part of the Trezor project.
+#
+# Copyright (C) 2012-2018 SatoshiLabs and contributors
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the License along with this library.
+# If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
+
+'''
+Host-side BIP32 public derivation.
+
+Derives watch-only children of a node obtained once with `get_public_node`,
+without further round trips to the device:
+
+>>> node = client.get_public_node(parse_path("m/44h/0h/0h")).node
+>>> for address in bip32.derive_addresses(node, 'Bitcoin', range(1000000), chain=0):
+...     print(address)
+
+Intermediate nodes are kept in an LRU cache, so deriving many paths below
+the same account only pays for the shared part once.
+'''
+
+import hashlib
+import hmac
+import itertools
+import struct
+from collections import OrderedDict
+from typing import Iterable, Iterator, List
+
+from . import _secp256k1 as secp256k1
+from . import messages as proto
+from . import tools
+from .coins import by_name as coins_by_name
+
+# number of children converted to affine coordinates at once
+BATCH_SIZE = 256
+
+
+class NodeCache(object):
+    """LRU cache of derived nodes, keyed by parent key and child index."""
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._nodes = OrderedDict()
+
+    def __len__(self):
+        return len(self._nodes)
+
+    @staticmethod
+    def _key(parent, index):
+        # the fingerprint alone is only 32 bits, use the whole parent key
+        return parent.public_key, parent.chain_code, index
+
+    def get(self, parent, index):
+        key = self._key(parent, index)
+        node = self._nodes.get(key)
+        if node is not None:
+            self._nodes.move_to_end(key)
+        return node
+
+    def put(self, parent, index, node):
+        self._nodes[self._key(parent, index)] = node
+        if len(self._nodes) > self.maxsize:
+            self._nodes.popitem(last=False)
+
+    def clear(self):
+        self._nodes.clear()
+
+
+cache = NodeCache()
+
+
+def fingerprint(public_key: bytes) -> int:
+    return int.from_bytes(tools.hash_160(public_key)[:4], 'big')
+
+
+def _ckd(public_key, point, chain_code, index):
+    # returns (child point in Jacobian coordinates, child chain code)
+    if index & tools.HARDENED_FLAG:
+        raise ValueError("Prime derivation not supported")
+    I64 = hmac.new(chain_code, public_key + struct.pack('>L', index), hashlib.sha512).digest()
+    il = int.from_bytes(I64[:32], 'big')
+    if il >= secp256k1.N:
+        raise ValueError("Invalid child index")
+    child = secp256k1.add_affine(secp256k1.mul_g(il), point)
+    if not child[2]:
+        raise ValueError("Point cannot be INFINITY")
+    return child, I64[32:]
+
+
+def get_subnode(node: proto.HDNodeType, index: int, cache: NodeCache = cache) -> proto.HDNodeType:
+    """Derive a non-hardened child of `node`."""
+    if cache is not None:
+        cached = cache.get(node, index)
+        if cached is not None:
+            return cached
+
+    point = secp256k1.decompress(node.public_key)
+    child, chain_code = _ckd(node.public_key, point, node.chain_code, index)
+    node_out = proto.HDNodeType(
+        depth=node.depth + 1,
+        fingerprint=fingerprint(node.public_key),
+        child_num=index,
+        chain_code=chain_code,
+        public_key=secp256k1.compress(secp256k1.to_affine(child)),
+    )
+    if cache is not None:
+        cache.put(node, index, node_out)
+    return node_out
+
+
+def public_ckd(node: proto.HDNodeType, path: List[int], cache: NodeCache = cache) -> proto.HDNodeType:
+    """Derive `node` along `path`, using cached intermediate nodes."""
+    for index in path:
+        node = get_subnode(node, index, cache)
+    return node
+
+
+def _derive_public_keys(node, indices):
+    # generate (index, chain_code, public_key) of children in batches
+    point = secp256k1.decompress(node.public_key)
+    indices = iter(indices)
+    while True:
+        batch = list(itertools.islice(indices, BATCH_SIZE))
+        if not batch:
+            return
+        children = [_ckd(node.public_key, point, node.chain_code, index) for index in batch]
+        points = secp256k1.batch_to_affine([child for child, _ in children])
+        for index, (_, chain_code), p in zip(batch, children, points):
+            yield index, chain_code, secp256k1.compress(p)
+
+
+def derive_children(node: proto.HDNodeType, indices: Iterable[int]) -> Iterator[proto.HDNodeType]:
+    """Derive many children of `node`. Results are not cached."""
+    parent_fingerprint = fingerprint(node.public_key)
+    for index, chain_code, public_key in _derive_public_keys(node, indices):
+        yield proto.HDNodeType(
+            depth=node.depth + 1,
+            fingerprint=parent_fingerprint,
+            child_num=index,
+            chain_code=chain_code,
+            public_key=public_key,
+        )
+
+
+def _address_type_bytes(address_type):
+    # same prefix length rule as the firmware
+    length = max(1, (address_type.bit_length() + 7) // 8)
+    return address_type.to_bytes(length, 'big')
+
+
+def public_key_to_address(public_key: bytes, coin_name: str, script_type=proto.InputScriptType.SPENDADDRESS) -> str:
+    """Return the address `get_address` shows for a single-signature public key."""
+    coin = coins_by_name[coin_name]
+    if coin['curve_name'] != 'secp256k1' or coin['decred']:
+        raise ValueError("Address derivation not supported for {}".format(coin_name))
+    if coin['cashaddr_prefix']:
+        raise ValueError("Cashaddr addresses are not supported")
+
+    h160 = tools.hash_160(public_key)
+    if script_type == proto.InputScriptType.SPENDADDRESS:
+        data = _address_type_bytes(coin['address_type']) + h160
+    elif script_type == proto.InputScriptType.SPENDP2SHWITNESS and coin['segwit']:
+        data = _address_type_bytes(coin['address_type_p2sh']) + tools.hash_160(b'\x00\x14' + h160)
+    elif script_type == proto.InputScriptType.SPENDWITNESS and coin['segwit'] and coin['bech32_prefix']:
+        return tools.bech32_encode_address(coin['bech32_prefix'], 0, h160)
+    else:
+        raise ValueError("Unsupported script type for {}".format(coin_name))
+    return tools.b58check_encode(data)
+
+
+def get_address(node: proto.HDNodeType, coin_name: str, script_type=proto.InputScriptType.SPENDADDRESS) -> str:
+    return public_key_to_address(node.public_key, coin_name, script_type)
+
+
+def derive_addresses(node: proto.HDNodeType, coin_name: str, indices: Iterable[int],
+                     script_type=proto.InputScriptType.SPENDADDRESS, chain: int = None) -> Iterator[str]:
+    """Generate addresses of children of `node`, in the order of `indices`.
+
+    With `chain`, children of `node/chain` are derived instead, e.g. chain=0
+    for receive and chain=1 for change addresses of an account node.
+    """
+    if chain is not None:
+        node = get_subnode(node, chain)
+    for _, _, public_key in _derive_public_keys(node, indices):
+        yield public_key_to_address(public_key, coin_name, script_type)
+
+
+def serialize(node: proto.HDNodeType, version=0x0488B21E) -> str:
+    s = b''
+    s += struct.pack('>I', version)
+    s += struct.pack('>B', node.depth)
+    s += struct.pack('>I', node.fingerprint)
+    s += struct.pack('>I', node.child_num)
+    s += node.chain_code
+    if node.private_key:
+        s += b'\x00' + node.private_key
+    else:
+        s += node.public_key
+    return tools.b58check_encode(s)
+
+
+def deserialize(xpub: str) -> proto.HDNodeType:
+    data = tools.b58check_decode(xpub)
+
+    node = proto.HDNodeType()
+    node.depth = struct.unpack('>B', data[4:5])[0]
+    node.fingerprint = struct.unpack('>I', data[5:9])[0]
+    node.child_num = struct.unpack('>I', data[9:13])[0]
+    node.chain_code = data[13:45]
+
+    key = data[45:]
+    if key[0] == 0:
+        node.private_key = key[1:]
+    else:
+        node.public_key = key
+
+    return node
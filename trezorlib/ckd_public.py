@@ -16,6 +16,6 @@
 
 import warnings
 
-warnings.warn("ckd_public module is deprecated and will be removed", DeprecationWarning)
+warnings.warn("ckd_public module is deprecated and will be removed, use bip32 instead", DeprecationWarning)
 
 from .tests.support.ckd_public import *  # noqa
@@ -16,14 +16,18 @@
 
 import functools
 import logging
+import mmap
 import os
 import sys
+import threading
 import time
 import binascii
 import hashlib
 import unicodedata
 import getpass
 import warnings
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 
 from mnemonic import Mnemonic
 
@@ -34,6 +38,8 @@ from . import nem
 from . import protobuf
 from . import stellar
 from .debuglink import DebugLink
+from .transport import Encoded
+from .tx_api import submit_txs, wait_txs
 
 if sys.version_info.major < 3:
     raise Exception("Trezorlib does not support Python 2 anymore.")
@@ -161,7 +167,11 @@ class BaseClient(object):
     @session
     def call_raw(self, msg):
         __tracebackhide__ = True  # pytest traceback hiding - this function won't appear in tracebacks
-        self.transport.write(msg)
+        # `msg` may also be pre-encoded by `transport.encode`
+        if isinstance(msg, Encoded):
+            self.transport.write_encoded(msg)
+        else:
+            self.transport.write(msg)
         return self.transport.read()
 
     @session
@@ -437,10 +447,14 @@ class DebugLinkMixin(object):
 
 class ProtocolMixin(object):
     VENDORS = ('bitcointrezor.com', 'trezor.io')
+    # Maximum number of previous transactions fetched from tx_api at once
+    TX_API_WORKERS = 8
 
-    def __init__(self, state=None, *args, **kwargs):
+    def __init__(self, state=None, features_cache=None, *args, **kwargs):
         super(ProtocolMixin, self).__init__(*args, **kwargs)
         self.state = state
+        self.features_cache = features_cache
+        self.features = None
         self.init_device()
         self.tx_api = None
 
@@ -454,6 +468,14 @@ class ProtocolMixin(object):
         self.features = expect(proto.Features)(self.call)(init_msg)
         if str(self.features.vendor) not in self.VENDORS:
             raise RuntimeError("Unsupported device")
+        if self.features_cache is not None:
+            self.features_cache.set(self.transport.get_path(), self.state, self.features)
+
+    def _invalidate_features(self):
+        # Called before operations that change the device. The cache is
+        # filled again by the next Initialize, no extra round trip is made.
+        if self.features_cache is not None:
+            self.features_cache.invalidate(self.transport.get_path())
 
     def _get_local_entropy(self):
         return os.urandom(32)
@@ -482,6 +504,37 @@ class ProtocolMixin(object):
         else:
             return self.call(proto.GetAddress(address_n=n, coin_name=coin_name, show_display=show_display, script_type=script_type))
 
+    def _iter_paths(self, paths):
+        if isinstance(paths, str):
+            return tools.parse_path_template(paths)
+        return (tools.parse_path(n) if isinstance(n, str) else self._convert_prime(n) for n in paths)
+
+    def get_public_nodes(self, paths, ecdsa_curve_name=None, coin_name=None):
+        '''
+        Generate (address_n, PublicKey) pairs for many paths in one session.
+        `paths` is a path template string (see `tools.parse_path_template`)
+        or an iterable of paths.
+        '''
+        self.transport.session_begin()
+        try:
+            for n in self._iter_paths(paths):
+                yield n, self.get_public_node(n, ecdsa_curve_name=ecdsa_curve_name, coin_name=coin_name)
+        finally:
+            self.transport.session_end()
+
+    def get_addresses(self, coin_name, paths, multisig=None, script_type=proto.InputScriptType.SPENDADDRESS):
+        '''
+        Generate (address_n, address) pairs for many paths in one session.
+        `paths` is a path template string (see `tools.parse_path_template`)
+        or an iterable of paths.
+        '''
+        self.transport.session_begin()
+        try:
+            for n in self._iter_paths(paths):
+                yield n, self.get_address(coin_name, n, multisig=multisig, script_type=script_type)
+        finally:
+            self.transport.session_end()
+
     @field('address')
     @expect(proto.EthereumAddress)
     def ethereum_get_address(self, n, show_display=False, multisig=None):
@@ -633,6 +686,7 @@ class ProtocolMixin(object):
     @field('message')
     @expect(proto.Success)
     def apply_settings(self, label=None, language=None, use_passphrase=None, homescreen=None, passphrase_source=None, auto_lock_delay_ms=None):
+        self._invalidate_features()
         settings = proto.ApplySettings()
         if label is not None:
             settings.label = label
@@ -654,6 +708,7 @@ class ProtocolMixin(object):
     @field('message')
     @expect(proto.Success)
     def apply_flags(self, flags):
+        self._invalidate_features()
         out = self.call(proto.ApplyFlags(flags=flags))
         self.init_device()  # Reload Features
         return out
@@ -661,11 +716,14 @@ class ProtocolMixin(object):
     @field('message')
     @expect(proto.Success)
     def clear_session(self):
-        return self.call(proto.ClearSession())
+        self._invalidate_features()
+        ret = self.call(proto.ClearSession())
+        return ret
 
     @field('message')
     @expect(proto.Success)
     def change_pin(self, remove=False):
+        self._invalidate_features()
         ret = self.call(proto.ChangePin(remove=remove))
         self.init_device()  # Re-read features
         return ret
@@ -697,6 +755,7 @@ class ProtocolMixin(object):
     @field('message')
     @expect(proto.Success)
     def set_u2f_counter(self, u2f_counter):
+        self._invalidate_features()
         ret = self.call(proto.SetU2FCounter(u2f_counter=u2f_counter))
         return ret
 
@@ -752,15 +811,17 @@ class ProtocolMixin(object):
                                               ask_on_decrypt=ask_on_decrypt,
                                               iv=iv))
 
-    def _prepare_sign_tx(self, inputs, outputs):
+    def _prepare_sign_tx(self, inputs, outputs, wait=True):
         tx = proto.TransactionType()
         tx.inputs = inputs
         tx.outputs = outputs
 
         txes = {None: tx}
 
+        # Distinct previous transactions, in order of first appearance
+        prev_hashes = OrderedDict()
         for inp in inputs:
-            if inp.prev_hash in txes:
+            if inp.prev_hash in txes or inp.prev_hash in prev_hashes:
                 continue
 
             if inp.script_type in (proto.InputScriptType.SPENDP2SHWITNESS,
@@ -770,133 +831,236 @@ class ProtocolMixin(object):
             if not self.tx_api:
                 raise RuntimeError('TX_API not defined')
 
-            prev_tx = self.tx_api.get_tx(binascii.hexlify(inp.prev_hash).decode('utf-8'))
-            txes[inp.prev_hash] = prev_tx
+            prev_hashes[inp.prev_hash] = None
 
-        return txes
+        if not prev_hashes:
+            return txes
 
-    @session
-    def sign_tx(self, coin_name, inputs, outputs, version=None, lock_time=None, expiry=None, overwintered=None, debug_processor=None):
+        # Fetch all previous transactions concurrently. Without `wait`,
+        # `txes` is returned with Futures in place of the pending transactions.
+        txhashes = [binascii.hexlify(prev_hash).decode('utf-8') for prev_hash in prev_hashes]
+        prev_txes = submit_txs(self.tx_api.get_tx, txhashes, self.TX_API_WORKERS)
+        if wait:
+            prev_txes = wait_txs(prev_txes)
+        for prev_hash, txhash in zip(prev_hashes, txhashes):
+            txes[prev_hash] = prev_txes[txhash]
 
-        # start = time.time()
-        txes = self._prepare_sign_tx(inputs, outputs)
-
-        # Prepare and send initial message
-        tx = proto.SignTx()
-        tx.inputs_count = len(inputs)
-        tx.outputs_count = len(outputs)
-        tx.coin_name = coin_name
-        if version is not None:
-            tx.version = version
-        if lock_time is not None:
-            tx.lock_time = lock_time
-        if expiry is not None:
-            tx.expiry = expiry
-        if overwintered is not None:
-            tx.overwintered = overwintered
-        res = self.call(tx)
-
-        # Prepare structure for signatures
-        signatures = [None] * len(inputs)
-        serialized_tx = b''
-
-        counter = 0
-        while True:
-            counter += 1
+        return txes
 
-            if isinstance(res, proto.Failure):
-                raise CallException("Signing failed")
+    @staticmethod
+    def _cancel_prev_txes(txes):
+        for prev_tx in txes.values():
+            if isinstance(prev_tx, Future):
+                prev_tx.cancel()
 
-            if not isinstance(res, proto.TxRequest):
-                raise CallException("Unexpected message")
+    @staticmethod
+    def _tx_meta(tx, prev):
+        msg = proto.TransactionType()
+        msg.version = tx.version
+        msg.lock_time = tx.lock_time
+        msg.inputs_cnt = len(tx.inputs)
+        if prev:
+            msg.outputs_cnt = len(tx.bin_outputs)
+        else:
+            msg.outputs_cnt = len(tx.outputs)
+        msg.extra_data_len = len(tx.extra_data) if tx.extra_data else 0
+        return msg
 
-            # If there's some part of signed transaction, let's add it
-            if res.serialized and res.serialized.serialized_tx:
-                # log("RECEIVED PART OF SERIALIZED TX (%d BYTES)" % len(res.serialized.serialized_tx))
-                serialized_tx += res.serialized.serialized_tx
+    @staticmethod
+    def _tx_ack_key(tx_hash, request_type, request_index):
+        if request_type == proto.RequestType.TXMETA:
+            request_index = None
+        return (tx_hash, request_type, request_index)
+
+    def _encode_tx_acks(self, txes, tx_acks, stop):
+        # Fill `tx_acks` with the TxAck answers to every TXMETA, TXINPUT and
+        # TXOUTPUT request the device can send, serialized and framed by the
+        # transport. Runs in a background thread until `stop` is set, the
+        # signing loop builds whatever is not ready yet by itself.
+        for tx_hash, tx in list(txes.items()):
+            if isinstance(tx, Future):
+                try:
+                    tx = tx.result()
+                except Exception:
+                    continue  # reported by the signing loop
+            prev = tx_hash is not None
+
+            answers = [(proto.RequestType.TXMETA, None, self._tx_meta(tx, prev))]
+            answers += [(proto.RequestType.TXINPUT, i, proto.TransactionType(inputs=[inp]))
+                        for i, inp in enumerate(tx.inputs)]
+            if prev:
+                answers += [(proto.RequestType.TXOUTPUT, i, proto.TransactionType(bin_outputs=[out]))
+                            for i, out in enumerate(tx.bin_outputs)]
+            else:
+                answers += [(proto.RequestType.TXOUTPUT, i, proto.TransactionType(outputs=[out]))
+                            for i, out in enumerate(tx.outputs)]
+
+            for request_type, request_index, msg in answers:
+                if stop.is_set():
+                    return
+                key = self._tx_ack_key(tx_hash, request_type, request_index)
+                try:
+                    tx_acks[key] = self.transport.encode(proto.TxAck(tx=msg))
+                except Exception as e:
+                    LOG.debug("Failed to encode TxAck in advance: {}".format(e))
+                    return
 
-            if res.serialized and res.serialized.signature_index is not None:
-                if signatures[res.serialized.signature_index] is not None:
-                    raise ValueError("Signature for index %d already filled" % res.serialized.signature_index)
-                signatures[res.serialized.signature_index] = res.serialized.signature
+    @session
+    def sign_tx(self, coin_name, inputs, outputs, version=None, lock_time=None, expiry=None, overwintered=None, debug_processor=None, fetch_in_background=False, on_serialized=None, precompute_acks=False):
+        # With `fetch_in_background`, signing starts right away and previous
+        # transactions are only waited for when the device asks for them.
+        # A failed fetch then aborts the signing midway.
+        #
+        # If `on_serialized` is given, it is called with every chunk of the
+        # signed transaction as soon as the device sends it. The chunks are
+        # not collected in that case and `None` is returned instead of the
+        # serialized transaction.
+        #
+        # With `precompute_acks`, the answers to the device's requests are
+        # serialized and framed in a background thread while the device
+        # processes SignTx, so that most requests are answered by writing
+        # ready-made bytes. Ignored when `debug_processor` is used.
 
-            if res.request_type == proto.RequestType.TXFINISHED:
-                # Device didn't ask for more information, finish workflow
-                break
+        # start = time.time()
+        txes = self._prepare_sign_tx(inputs, outputs, wait=not fetch_in_background)
 
-            # Device asked for one more information, let's process it.
-            if not res.details.tx_hash:
-                current_tx = txes[None]
-            else:
-                current_tx = txes[bytes(res.details.tx_hash)]
-
-            if res.request_type == proto.RequestType.TXMETA:
-                msg = proto.TransactionType()
-                msg.version = current_tx.version
-                msg.lock_time = current_tx.lock_time
-                msg.inputs_cnt = len(current_tx.inputs)
-                if res.details.tx_hash:
-                    msg.outputs_cnt = len(current_tx.bin_outputs)
+        tx_acks = None
+        stop_encoding = threading.Event()
+        if precompute_acks and debug_processor is None:
+            tx_acks = {}
+            threading.Thread(target=self._encode_tx_acks, args=(txes, tx_acks, stop_encoding), daemon=True).start()
+
+        # Pending fetches and encoding are stopped however signing ends
+        try:
+            # Prepare and send initial message
+            tx = proto.SignTx()
+            tx.inputs_count = len(inputs)
+            tx.outputs_count = len(outputs)
+            tx.coin_name = coin_name
+            if version is not None:
+                tx.version = version
+            if lock_time is not None:
+                tx.lock_time = lock_time
+            if expiry is not None:
+                tx.expiry = expiry
+            if overwintered is not None:
+                tx.overwintered = overwintered
+            res = self.call(tx)
+
+            # Prepare structure for signatures
+            signatures = [None] * len(inputs)
+            serialized_tx = bytearray()
+
+            counter = 0
+            while True:
+                counter += 1
+
+                if isinstance(res, proto.Failure):
+                    raise CallException("Signing failed")
+
+                if not isinstance(res, proto.TxRequest):
+                    raise CallException("Unexpected message")
+
+                # If there's some part of signed transaction, let's add it
+                if res.serialized and res.serialized.serialized_tx:
+                    # log("RECEIVED PART OF SERIALIZED TX (%d BYTES)" % len(res.serialized.serialized_tx))
+                    if on_serialized is not None:
+                        on_serialized(res.serialized.serialized_tx)
+                    else:
+                        serialized_tx += res.serialized.serialized_tx
+
+                if res.serialized and res.serialized.signature_index is not None:
+                    if signatures[res.serialized.signature_index] is not None:
+                        raise ValueError("Signature for index %d already filled" % res.serialized.signature_index)
+                    signatures[res.serialized.signature_index] = res.serialized.signature
+
+                if res.request_type == proto.RequestType.TXFINISHED:
+                    # Device didn't ask for more information, finish workflow
+                    break
+
+                # Device asked for one more information, let's process it.
+                tx_hash = bytes(res.details.tx_hash) if res.details.tx_hash else None
+
+                if tx_acks is not None:
+                    key = self._tx_ack_key(tx_hash, res.request_type, res.details.request_index)
+                    encoded = tx_acks.get(key)
+                    if encoded is not None:
+                        res = self.call(encoded)
+                        continue
+
+                if tx_hash is None:
+                    current_tx = txes[None]
                 else:
-                    msg.outputs_cnt = len(current_tx.outputs)
-                msg.extra_data_len = len(current_tx.extra_data) if current_tx.extra_data else 0
-                res = self.call(proto.TxAck(tx=msg))
-                continue
+                    current_tx = txes[tx_hash]
+                    if isinstance(current_tx, Future):
+                        current_tx = txes[tx_hash] = current_tx.result()
 
-            elif res.request_type == proto.RequestType.TXINPUT:
-                msg = proto.TransactionType()
-                msg.inputs = [current_tx.inputs[res.details.request_index]]
-                if debug_processor is not None:
-                    # msg needs to be deep copied so when it's modified
-                    # the other messages stay intact
-                    from copy import deepcopy
-                    msg = deepcopy(msg)
-                    # If debug_processor function is provided,
-                    # pass thru it the request and prepared response.
-                    # This is useful for tests, see test_msg_signtx
-                    msg = debug_processor(res, msg)
-
-                res = self.call(proto.TxAck(tx=msg))
-                continue
+                if res.request_type == proto.RequestType.TXMETA:
+                    msg = self._tx_meta(current_tx, tx_hash is not None)
+                    res = self.call(proto.TxAck(tx=msg))
+                    continue
 
-            elif res.request_type == proto.RequestType.TXOUTPUT:
-                msg = proto.TransactionType()
-                if res.details.tx_hash:
-                    msg.bin_outputs = [current_tx.bin_outputs[res.details.request_index]]
-                else:
-                    msg.outputs = [current_tx.outputs[res.details.request_index]]
-
-                if debug_processor is not None:
-                    # msg needs to be deep copied so when it's modified
-                    # the other messages stay intact
-                    from copy import deepcopy
-                    msg = deepcopy(msg)
-                    # If debug_processor function is provided,
-                    # pass thru it the request and prepared response.
-                    # This is useful for tests, see test_msg_signtx
-                    msg = debug_processor(res, msg)
-
-                res = self.call(proto.TxAck(tx=msg))
-                continue
+                elif res.request_type == proto.RequestType.TXINPUT:
+                    msg = proto.TransactionType()
+                    msg.inputs = [current_tx.inputs[res.details.request_index]]
+                    if debug_processor is not None:
+                        # msg needs to be deep copied so when it's modified
+                        # the other messages stay intact
+                        from copy import deepcopy
+                        msg = deepcopy(msg)
+                        # If debug_processor function is provided,
+                        # pass thru it the request and prepared response.
+                        # This is useful for tests, see test_msg_signtx
+                        msg = debug_processor(res, msg)
+
+                    res = self.call(proto.TxAck(tx=msg))
+                    continue
 
-            elif res.request_type == proto.RequestType.TXEXTRADATA:
-                o, l = res.details.extra_data_offset, res.details.extra_data_len
-                msg = proto.TransactionType()
-                msg.extra_data = current_tx.extra_data[o:o + l]
-                res = self.call(proto.TxAck(tx=msg))
-                continue
+                elif res.request_type == proto.RequestType.TXOUTPUT:
+                    msg = proto.TransactionType()
+                    if res.details.tx_hash:
+                        msg.bin_outputs = [current_tx.bin_outputs[res.details.request_index]]
+                    else:
+                        msg.outputs = [current_tx.outputs[res.details.request_index]]
+
+                    if debug_processor is not None:
+                        # msg needs to be deep copied so when it's modified
+                        # the other messages stay intact
+                        from copy import deepcopy
+                        msg = deepcopy(msg)
+                        # If debug_processor function is provided,
+                        # pass thru it the request and prepared response.
+                        # This is useful for tests, see test_msg_signtx
+                        msg = debug_processor(res, msg)
+
+                    res = self.call(proto.TxAck(tx=msg))
+                    continue
+
+                elif res.request_type == proto.RequestType.TXEXTRADATA:
+                    o, l = res.details.extra_data_offset, res.details.extra_data_len
+                    msg = proto.TransactionType()
+                    msg.extra_data = current_tx.extra_data[o:o + l]
+                    res = self.call(proto.TxAck(tx=msg))
+                    continue
 
-        if None in signatures:
-            raise RuntimeError("Some signatures are missing!")
+            if None in signatures:
+                raise RuntimeError("Some signatures are missing!")
 
-        # log("SIGNED IN %.03f SECONDS, CALLED %d MESSAGES, %d BYTES" %
-        #    (time.time() - start, counter, len(serialized_tx)))
+            # log("SIGNED IN %.03f SECONDS, CALLED %d MESSAGES, %d BYTES" %
+            #    (time.time() - start, counter, len(serialized_tx)))
 
-        return (signatures, serialized_tx)
+            if on_serialized is not None:
+                return (signatures, None)
+
+            return (signatures, bytes(serialized_tx))
+        finally:
+            stop_encoding.set()
+            self._cancel_prev_txes(txes)
 
     @field('message')
     @expect(proto.Success)
     def wipe_device(self):
+        self._invalidate_features()
         ret = self.call(proto.WipeDevice())
         self.init_device()
         return ret
@@ -904,6 +1068,7 @@ class ProtocolMixin(object):
     @field('message')
     @expect(proto.Success)
     def recovery_device(self, word_count, passphrase_protection, pin_protection, label, language, type=proto.RecoveryDeviceType.ScrambledWords, expand=False, dry_run=False):
+        self._invalidate_features()
         if self.features.initialized and not dry_run:
             raise RuntimeError("Device is initialized already. Call wipe_device() and try again.")
 
@@ -934,6 +1099,7 @@ class ProtocolMixin(object):
     @expect(proto.Success)
     @session
     def reset_device(self, display_random, strength, passphrase_protection, pin_protection, label, language, u2f_counter=0, skip_backup=False):
+        self._invalidate_features()
         if self.features.initialized:
             raise RuntimeError("Device is initialized already. Call wipe_device() and try again.")
 
@@ -960,12 +1126,14 @@ class ProtocolMixin(object):
     @field('message')
     @expect(proto.Success)
     def backup_device(self):
+        self._invalidate_features()
         ret = self.call(proto.BackupDevice())
         return ret
 
     @field('message')
     @expect(proto.Success)
     def load_device_by_mnemonic(self, mnemonic, pin, passphrase_protection, label, language='english', skip_checksum=False, expand=False):
+        self._invalidate_features()
         # Convert mnemonic to UTF8 NKFD
         mnemonic = Mnemonic.normalize_string(mnemonic)
 
@@ -994,6 +1162,7 @@ class ProtocolMixin(object):
     @field('message')
     @expect(proto.Success)
     def load_device_by_xprv(self, xprv, pin, passphrase_protection, label, language):
+        self._invalidate_features()
         if self.features.initialized:
             raise RuntimeError("Device is initialized already. Call wipe_device() and try again.")
 
@@ -1035,14 +1204,45 @@ class ProtocolMixin(object):
         self.init_device()
         return resp
 
+    @staticmethod
+    def _firmware_data(fp):
+        # Returns the firmware image as a memoryview. Files are memory-mapped
+        # instead of read whenever possible, so that no copies are made.
+        if isinstance(fp, (bytes, bytearray, memoryview, mmap.mmap)):
+            return memoryview(fp)
+        if isinstance(fp, str):
+            with open(fp, 'rb') as f:
+                try:
+                    return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                except ValueError:
+                    # empty files cannot be mapped
+                    raise ValueError("Trezor firmware header expected") from None
+        try:
+            if fp.tell() == 0:
+                return memoryview(mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ))
+        except (AttributeError, OSError, ValueError):
+            pass
+        return memoryview(fp.read())
+
     @session
-    def firmware_update(self, fp):
+    def firmware_update(self, fp, progress=None):
+        # `fp` is a file object, a filename, an mmap or a bytes-like object.
+        # `progress`, if given, is called as progress(sent, total, bytes_per_second)
+        # after every uploaded chunk.
+        self._invalidate_features()
         if self.features.bootloader_mode is False:
             raise RuntimeError("Device must be in bootloader mode")
 
-        data = fp.read()
+        data = self._firmware_data(fp)
+        total = len(data)
+        start = time.time()
+
+        def report(sent):
+            if progress is not None:
+                elapsed = time.time() - start
+                progress(sent, total, sent / elapsed if elapsed > 0 else 0.0)
 
-        resp = self.call(proto.FirmwareErase(length=len(data)))
+        resp = self.call(proto.FirmwareErase(length=total))
         if isinstance(resp, proto.Failure) and resp.code == proto.FailureType.FirmwareError:
             return False
 
@@ -1052,6 +1252,7 @@ class ProtocolMixin(object):
             LOG.debug("Firmware fingerprint: " + fingerprint)
             resp = self.call(proto.FirmwareUpload(payload=data))
             if isinstance(resp, proto.Success):
+                report(total)
                 return True
             elif isinstance(resp, proto.Failure) and resp.code == proto.FailureType.FirmwareError:
                 return False
@@ -1060,17 +1261,41 @@ class ProtocolMixin(object):
         # TREZORv2 method
         if isinstance(resp, proto.FirmwareRequest):
             import pyblake2
-            while True:
-                payload = data[resp.offset:resp.offset + resp.length]
-                digest = pyblake2.blake2s(payload).digest()
-                resp = self.call(proto.FirmwareUpload(payload=payload, hash=digest))
-                if isinstance(resp, proto.FirmwareRequest):
-                    continue
-                elif isinstance(resp, proto.Success):
-                    return True
-                elif isinstance(resp, proto.Failure) and resp.code == proto.FailureType.FirmwareError:
-                    return False
-                raise RuntimeError("Unexpected result %s" % resp)
+
+            def digest(payload):
+                return pyblake2.blake2s(payload).digest()
+
+            # The chunk the device most likely asks for next is hashed
+            # in the background while the current one is being uploaded.
+            executor = ThreadPoolExecutor(max_workers=1)
+            try:
+                sent = 0
+                next_chunk = next_digest = None
+                while True:
+                    payload = data[resp.offset:resp.offset + resp.length]
+                    if next_chunk == (resp.offset, len(payload)):
+                        payload_digest = next_digest.result()
+                    else:
+                        payload_digest = digest(payload)
+
+                    next_offset = resp.offset + len(payload)
+                    if next_offset < total:
+                        next_payload = data[next_offset:next_offset + resp.length]
+                        next_chunk = (next_offset, len(next_payload))
+                        next_digest = executor.submit(digest, next_payload)
+
+                    resp = self.call(proto.FirmwareUpload(payload=payload, hash=payload_digest))
+                    sent += len(payload)
+                    report(sent)
+                    if isinstance(resp, proto.FirmwareRequest):
+                        continue
+                    elif isinstance(resp, proto.Success):
+                        return True
+                    elif isinstance(resp, proto.Failure) and resp.code == proto.FailureType.FirmwareError:
+                        return False
+                    raise RuntimeError("Unexpected result %s" % resp)
+            finally:
+                executor.shutdown(wait=False)
 
         raise RuntimeError("Unexpected message %s" % resp)
 
@@ -1092,36 +1317,50 @@ class ProtocolMixin(object):
     def stellar_get_address(self, address_n, show_display=False):
         return self.call(proto.StellarGetAddress(address_n=address_n, show_display=show_display))
 
+    @session
     def stellar_sign_transaction(self, tx, operations, address_n, network_passphrase=None):
+        # `operations` can be any iterable of operation messages, e.g. the
+        # iterator of `stellar.parse_transaction_bytes_iter`. If it has no
+        # length, `tx.num_operations` must be set. The list is not modified.
+
         # default networkPassphrase to the public network
         if network_passphrase is None:
             network_passphrase = "Public Global Stellar Network ; September 2015"
 
         tx.network_passphrase = network_passphrase
         tx.address_n = address_n
-        tx.num_operations = len(operations)
+        if hasattr(operations, '__len__'):
+            tx.num_operations = len(operations)
+        elif tx.num_operations is None:
+            raise ValueError("num_operations must be set when operations is an iterator")
         # Signing loop works as follows:
         #
-        # 1. Start with tx (header information for the transaction) and operations (an array of operation protobuf messagess)
+        # 1. Start with tx (header information for the transaction) and operations (an iterable of operation protobuf messagess)
         # 2. Send the tx header to the device
         # 3. Receive a StellarTxOpRequest message
         # 4. Send operations one by one until all operations have been sent. If there are more operations to sign, the device will send a StellarTxOpRequest message
         # 5. The final message received will be StellarSignedTx which is returned from this method
-        resp = self.call(tx)
-        try:
+        #
+        # The next operation is taken from `operations` in a background thread
+        # while the device processes the current one.
+        operations = iter(operations)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            next_op = executor.submit(next, operations, None)
+            resp = self.call(tx)
             while isinstance(resp, proto.StellarTxOpRequest):
-                resp = self.call(operations.pop(0))
-        except IndexError:
-            # pop from empty list
-            raise CallException("Stellar.UnexpectedEndOfOperations",
-                                "Reached end of operations without a signature.") from None
-
-        if not isinstance(resp, proto.StellarSignedTx):
-            raise CallException(proto.FailureType.UnexpectedMessage, resp)
-
-        if operations:
-            raise CallException("Stellar.UnprocessedOperations",
-                                "Received a signature before processing all operations.")
+                op = next_op.result()
+                if op is None:
+                    raise CallException("Stellar.UnexpectedEndOfOperations",
+                                        "Reached end of operations without a signature.")
+                next_op = executor.submit(next, operations, None)
+                resp = self.call(op)
+
+            if not isinstance(resp, proto.StellarSignedTx):
+                raise CallException(proto.FailureType.UnexpectedMessage, resp)
+
+            if next_op.result() is not None:
+                raise CallException("Stellar.UnprocessedOperations",
+                                    "Received a signature before processing all operations.")
 
         return resp
 
@@ -14,10 +14,13 @@
 # You should have received a copy of the License along with this library.
 # If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
 
+import multiprocessing
 import sys
+import time
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from functools import reduce
-import binascii
-from typing import Iterable, Tuple
+from typing import Iterable, List, Sequence, Tuple
 
 from trezorlib import _ed25519
 
@@ -30,9 +33,9 @@ Ed25519Signature = bytes
 
 def combine_keys(pks: Iterable[Ed25519PublicPoint]) -> Ed25519PublicPoint:
     """Combine a list of Ed25519 points into a "global" CoSi key."""
-    P = [_ed25519.decodepoint(pk) for pk in pks]
-    combine = reduce(_ed25519.edwards, P)
-    return Ed25519PublicPoint(_ed25519.encodepoint(combine))
+    P = [_ed25519.to_extended(_ed25519.decodepoint(pk)) for pk in pks]
+    combine = reduce(_ed25519.add_extended, P)
+    return Ed25519PublicPoint(_ed25519.encodepoint(_ed25519.to_affine(combine)))
 
 
 def combine_sig(global_R: Ed25519PublicPoint, sigs: Iterable[Ed25519Signature]) -> Ed25519Signature:
@@ -56,7 +59,7 @@ def get_nonce(sk: Ed25519PrivateKey, data: bytes, ctr: int = 0) -> Tuple[int, Ed
     """
     h = _ed25519.H(sk)
     b = _ed25519.b
-    r = _ed25519.Hint(bytes([h[i] for i in range(b >> 3, b >> 2)]) + data + binascii.unhexlify('%08x' % ctr))
+    r = _ed25519.Hint(h[b >> 3:b >> 2] + data + ctr.to_bytes(4, 'big'))
     R = _ed25519.scalarmult(_ed25519.B, r)
     return r, Ed25519PublicPoint(_ed25519.encodepoint(R))
 
@@ -67,6 +70,44 @@ def verify(signature: Ed25519Signature, digest: bytes, pub_key: Ed25519PublicPoi
     _ed25519.checkvalid(signature, digest, pub_key)
 
 
+def _verify_chunk(items: Sequence[Tuple[Ed25519Signature, bytes, Ed25519PublicPoint]]) -> List[bool]:
+    # batch check, bisecting on failure to find the bad signatures
+    if not items:
+        return []
+    if len(items) == 1:
+        try:
+            _ed25519.checkvalid(*items[0])
+            return [True]
+        except Exception:
+            return [False]
+    if _ed25519.checkvalid_batch(items):
+        return [True] * len(items)
+    half = len(items) // 2
+    return _verify_chunk(items[:half]) + _verify_chunk(items[half:])
+
+
+def verify_batch(items: Iterable[Tuple[Ed25519Signature, bytes, Ed25519PublicPoint]],
+                 processes: int = None, chunk_size: int = 64) -> List[bool]:
+    """Verify many (signature, digest, pub_key) triples.
+
+    Returns a list of booleans, True for every valid signature.
+    Signatures are checked in batches of `chunk_size`; a failing batch is
+    split in halves until the invalid signatures are found. With `processes`,
+    batches are spread over that many worker processes.
+
+    Batches use the cofactored verification equation, so a signature that
+    involves small-order points may pass here and fail in :func:`verify`.
+    """
+    items = list(items)
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    if processes:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(_verify_chunk, chunks)
+    else:
+        results = map(_verify_chunk, chunks)
+    return [valid for chunk in results for valid in chunk]
+
+
 def pubkey_from_privkey(privkey: Ed25519PrivateKey) -> Ed25519PublicPoint:
     """Interpret 32 bytes of data as an Ed25519 private key.
      Calculate and return the corresponding public key.
@@ -81,8 +122,50 @@ def sign_with_privkey(digest: bytes, privkey: Ed25519PrivateKey,
     """Create a CoSi signature of `digest` with the supplied private key.
     This function needs to know the global public key and global commitment.
     """
-    h = _ed25519.H(privkey)
-    b = _ed25519.b
-    a = 2 ** (b - 2) + sum(2 ** i * _ed25519.bit(h, i) for i in range(3, b - 2))
+    a = _ed25519.secret_scalar(_ed25519.H(privkey))
     S = (nonce + _ed25519.Hint(global_commit + global_pubkey + digest) * a) % _ed25519.l
     return Ed25519Signature(_ed25519.encodeint(S))
+
+
+# seconds spent in cosi_commit and cosi_sign by one signer
+SignerTiming = namedtuple('SignerTiming', ('commit', 'sign'))
+CosiResult = namedtuple('CosiResult', ('signature', 'global_pubkey', 'global_commitment', 'timings'))
+
+
+def sign_with_devices(signers: Sequence[Tuple[object, List[int]]], digest: bytes) -> CosiResult:
+    """Collectively sign `digest` with several devices.
+
+    `signers` is a list of (client, address_n) pairs. Commitments and then
+    signatures are requested from all devices concurrently; signers that
+    share a client are driven one after another. The combined signature is
+    verified before it is returned. `timings` has a `SignerTiming` for
+    every signer, in the order of `signers`.
+    """
+    groups = OrderedDict()
+    for i, (client, _) in enumerate(signers):
+        groups.setdefault(id(client), []).append(i)
+
+    def run_all(step):
+        results = [None] * len(signers)
+
+        def run_group(indices):
+            for i in indices:
+                start = time.time()
+                result = step(*signers[i])
+                results[i] = (result, time.time() - start)
+
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            for future in [executor.submit(run_group, indices) for indices in groups.values()]:
+                future.result()
+        return results
+
+    commits = run_all(lambda client, n: client.cosi_commit(n, digest))
+    global_pk = combine_keys([commit.pubkey for commit, _ in commits])
+    global_R = combine_keys([commit.commitment for commit, _ in commits])
+
+    sigs = run_all(lambda client, n: client.cosi_sign(n, digest, global_R, global_pk))
+    signature = combine_sig(global_R, [sig.signature for sig, _ in sigs])
+    verify(signature, digest, global_pk)
+
+    timings = [SignerTiming(commit_time, sign_time) for (_, commit_time), (_, sign_time) in zip(commits, sigs)]
+    return CosiResult(signature, global_pk, global_R, timings)
@@ -0,0 +1,102 @@
+# This file is part of the Trezor project.
+#
+# Copyright (C) 2012-2018 SatoshiLabs and contributors
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the License along with this library.
+# If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
+
+'''
+BIP44 account discovery.
+
+The device is asked for one public node per account. Addresses are derived
+on the host with `bip32` and looked up through a backend, which only needs
+an `is_used(address)` method and must be safe to call from several threads.
+'''
+
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from . import bip32
+from . import messages as proto
+from .coins import slip44
+from .tools import H_
+
+LOG = logging.getLogger(__name__)
+
+PURPOSES = {
+    proto.InputScriptType.SPENDADDRESS: 44,
+    proto.InputScriptType.SPENDP2SHWITNESS: 49,
+    proto.InputScriptType.SPENDWITNESS: 84,
+}
+
+# `used` maps chain (0 external, 1 change) to a list of (index, address) pairs
+DiscoveredAccount = namedtuple('DiscoveredAccount', ('index', 'address_n', 'node', 'used'))
+
+
+class InsightBackend(object):
+    """Address usage lookup through the Insight API of a `TxApi`."""
+
+    def __init__(self, tx_api):
+        self.tx_api = tx_api
+
+    def is_used(self, address):
+        # shares the pooled session of `tx_api`
+        j = self.tx_api._get_json(self.tx_api.get_url('/addr', address))
+        return j.get('txApperances', 0) + j.get('unconfirmedTxApperances', 0) > 0
+
+
+def _scan_chain(executor, backend, node, coin_name, script_type, chain, gap_limit):
+    used = []
+    last_used = -1
+    start = 0
+    while start <= last_used + gap_limit:
+        # check just enough addresses to close the gap after the last used one
+        indices = range(start, last_used + gap_limit + 1)
+        addresses = list(bip32.derive_addresses(node, coin_name, indices, script_type, chain=chain))
+        for index, address, is_used in zip(indices, addresses, executor.map(backend.is_used, addresses)):
+            if is_used:
+                used.append((index, address))
+                last_used = index
+        start = indices.stop
+    return used
+
+
+def discover_accounts(client, coin_name: str, backend,
+                      script_type=proto.InputScriptType.SPENDADDRESS,
+                      gap_limit: int = 20,
+                      max_workers: int = 8,
+                      max_accounts: int = None) -> List[DiscoveredAccount]:
+    """Find the used accounts of `coin_name` on the device.
+
+    Accounts are scanned in order until one without any used external
+    address is found, as described in BIP-44. Each chain of an account
+    is scanned until `gap_limit` consecutive addresses are unused.
+    At most `max_workers` backend lookups run at the same time.
+    """
+    purpose = PURPOSES[script_type]
+    accounts = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        index = 0
+        while max_accounts is None or index < max_accounts:
+            address_n = [H_(purpose), H_(slip44[coin_name]), H_(index)]
+            node = client.get_public_node(address_n, coin_name=coin_name).node
+
+            external = _scan_chain(executor, backend, node, coin_name, script_type, 0, gap_limit)
+            if not external:
+                break
+            change = _scan_chain(executor, backend, node, coin_name, script_type, 1, gap_limit)
+            LOG.info("Account {}: {} used addresses".format(index, len(external) + len(change)))
+            accounts.append(DiscoveredAccount(index, address_n, node, {0: external, 1: change}))
+            index += 1
+    return accounts
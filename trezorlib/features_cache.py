@@ -0,0 +1,139 @@
+# This file is part of the Trezor project.
+#
+# Copyright (C) 2012-2018 SatoshiLabs and contributors
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the License along with this library.
+# If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
+
+import binascii
+import json
+import logging
+import os
+import tempfile
+import time
+from io import BytesIO
+
+from . import messages as proto
+from . import protobuf
+
+LOG = logging.getLogger(__name__)
+
+
+# Features that only change with a firmware update or a different device
+STATIC_FIELDS = (
+    'vendor', 'major_version', 'minor_version', 'patch_version', 'device_id',
+    'revision', 'bootloader_hash', 'model',
+    'fw_major', 'fw_minor', 'fw_patch', 'fw_vendor', 'fw_vendor_keys',
+)
+
+
+class FeaturesCache(object):
+    """Persistent record of device `Features`, shared between processes.
+
+    Clients always send `Initialize` and store the `Features` they receive,
+    so every entry comes from a live device response. Only `STATIC_FIELDS`
+    are kept: session and settings fields such as `pin_cached` or
+    `bootloader_mode` are never served from the cache.
+
+    Entries are stored per transport path and session state and remember
+    the `device_id` they belong to. An entry is only used while it is
+    younger than `max_age` seconds. It is dropped when a different device,
+    or a device in bootloader mode, shows up on the same path, and before
+    every call that changes the device. An unchanged entry is only
+    rewritten once it is older than half of `max_age`.
+
+    `get` serves the static fields without talking to the device, e.g.
+    for `trezorctl list` and `trezorctl get_features --static`.
+    """
+
+    def __init__(self, filename, max_age=3600):
+        self.filename = filename
+        self.max_age = max_age
+
+    @staticmethod
+    def _key(path, state):
+        state = binascii.hexlify(state).decode() if state is not None else ''
+        return '{}|{}'.format(path, state)
+
+    def _load(self):
+        try:
+            with open(self.filename) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, entries):
+        # unique name, so that concurrent writers do not collide
+        try:
+            fd, tmp_filename = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(os.path.abspath(self.filename)))
+        except OSError as e:
+            LOG.warning("Failed to write features cache {}: {}".format(self.filename, e))
+            return
+        try:
+            with open(fd, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp_filename, self.filename)
+        except BaseException as e:
+            os.unlink(tmp_filename)
+            if not isinstance(e, OSError):
+                raise
+            LOG.warning("Failed to write features cache {}: {}".format(self.filename, e))
+
+    def get(self, path, state=None):
+        """Return the static features last seen on `path`, or None."""
+        entry = self._load().get(self._key(path, state))
+        if entry is None or not entry.get('device_id'):
+            return None
+        if time.time() - entry.get('time', 0) > self.max_age:
+            return None
+        try:
+            data = binascii.unhexlify(entry['features'])
+            return protobuf.load_message(BytesIO(data), proto.Features)
+        except Exception:
+            return None
+
+    def set(self, path, state, features):
+        """Store `features` just received from the device on `path`."""
+        if not features.device_id or features.bootloader_mode:
+            # bootloader mode, nothing to key the entry by
+            self.invalidate(path)
+            return
+        entries = self._load()
+        # a different device may have appeared on the same path
+        for key in [k for k, v in entries.items() if k.startswith(path + '|') and v.get('device_id') != features.device_id]:
+            del entries[key]
+        static = proto.Features(**{name: getattr(features, name, None) for name in STATIC_FIELDS})
+        data = BytesIO()
+        protobuf.dump_message(data, static)
+        entry = {
+            'device_id': features.device_id,
+            'features': binascii.hexlify(data.getvalue()).decode(),
+            'time': time.time(),
+        }
+        key = self._key(path, state)
+        old = entries.get(key)
+        if (old is not None and old.get('features') == entry['features'] and
+                entry['time'] - old.get('time', 0) < self.max_age / 2):
+            # unchanged and fresh enough, spare the rewrite
+            return
+        entries[key] = entry
+        self._save(entries)
+
+    def invalidate(self, path):
+        """Drop entries for `path` and for every device last seen there."""
+        entries = self._load()
+        device_ids = {v.get('device_id') for k, v in entries.items() if k.startswith(path + '|')}
+        stale = [k for k, v in entries.items() if k.startswith(path + '|') or v.get('device_id') in device_ids]
+        if stale:
+            for key in stale:
+                del entries[key]
+            self._save(entries)
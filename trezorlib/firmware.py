@@ -0,0 +1,125 @@
+# This file is part of the Trezor project.
+#
+# Copyright (C) 2012-2018 SatoshiLabs and contributors
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the License along with this library.
+# If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
+
+import binascii
+import hashlib
+import logging
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional
+
+from .transport import Transport
+
+LOG = logging.getLogger(__name__)
+
+# TREZOR One firmware and TREZOR T vendor header magic
+HEADERS = (b'TRZR', b'TRZV')
+HEX_HEADERS = tuple(binascii.hexlify(h) for h in HEADERS)
+
+FlashResult = namedtuple('FlashResult', ('path', 'success', 'attempts', 'elapsed', 'error'))
+
+
+def decode_hex(data):
+    """Return `data` unhexlified if it is a hex-encoded firmware image."""
+    if bytes(data[:8]) in HEX_HEADERS:
+        return binascii.unhexlify(data)
+    return data
+
+
+def has_valid_header(data) -> bool:
+    return bytes(data[:4]) in HEADERS
+
+
+def fingerprint(data) -> Optional[str]:
+    """Calculate fingerprint of a TREZOR One firmware image.
+
+    Returns None for TREZOR T images, whose fingerprint is not supported yet.
+    """
+    if bytes(data[:4]) != b'TRZR':
+        return None
+    return hashlib.sha256(memoryview(data)[256:]).hexdigest()
+
+
+def validate(data, expected_fingerprint=None):
+    """Check a firmware image and return it decoded.
+
+    Raises ValueError if the header is missing or the fingerprint does not match,
+    or if a fingerprint is expected for a TREZOR T image.
+    """
+    data = decode_hex(data)
+    if not has_valid_header(data):
+        raise ValueError("Trezor firmware header expected")
+    calculated = fingerprint(data)
+    if expected_fingerprint and calculated is None:
+        raise ValueError("Checking Trezor T fingerprint is not supported yet")
+    if expected_fingerprint and expected_fingerprint != calculated:
+        raise ValueError("Fingerprints do not match: expected {}, got {}".format(expected_fingerprint, calculated))
+    return data
+
+
+def flash_devices(transports: Iterable[Transport],
+                  data,
+                  expected_fingerprint: str = None,
+                  skip_check: bool = False,
+                  retries: int = 1,
+                  progress: Callable = None,
+                  client_class=None) -> List[FlashResult]:
+    """Upload one firmware image to several devices in bootloader mode at once.
+
+    The image is checked once, then every transport is flashed in its own
+    thread. A device is retried up to `retries` times if the upload fails
+    with an exception. A firmware rejected by the device is not retried.
+
+    `progress`, if given, is called as progress(path, sent, total, bytes_per_second).
+    Returns a `FlashResult` for every transport, in the same order.
+    """
+    if client_class is None:
+        from .client import TrezorClient
+        client_class = TrezorClient
+
+    if not skip_check:
+        data = validate(data, expected_fingerprint)
+    data = memoryview(data)
+    transports = list(transports)
+
+    def flash(transport):
+        path = transport.get_path()
+        start = time.time()
+        error = None
+
+        def device_progress(sent, total, speed):
+            if progress is not None:
+                progress(path, sent, total, speed)
+
+        for attempt in range(1, retries + 2):
+            try:
+                client = client_class(transport)
+                if not client.features.bootloader_mode:
+                    return FlashResult(path, False, attempt, time.time() - start, "Device is not in bootloader mode")
+                if client.firmware_update(data, progress=device_progress):
+                    return FlashResult(path, True, attempt, time.time() - start, None)
+                return FlashResult(path, False, attempt, time.time() - start, "Update aborted on device")
+            except Exception as e:
+                error = '{}: {}'.format(e.__class__.__name__, e)
+                LOG.warning("Flashing {} failed (attempt {}): {}".format(path, attempt, error))
+
+        return FlashResult(path, False, attempt, time.time() - start, error)
+
+    if not transports:
+        return []
+    with ThreadPoolExecutor(max_workers=len(transports)) as executor:
+        return list(executor.map(flash, transports))
@@ -0,0 +1,314 @@
+# This file is part of the Trezor project.
+#
+# Copyright (C) 2012-2018 SatoshiLabs and contributors
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the License along with this library.
+# If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
+
+import logging
+import threading
+import time
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterable
+
+from .client import CallException
+from .transport import Transport, enumerate_devices
+
+LOG = logging.getLogger(__name__)
+
+
+class _PooledDevice(object):
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.path = transport.get_path()
+        self.client = None
+        self.evicted = False
+        self.added = time.monotonic()
+        self.leased_since = None
+        self.leases = 0
+        self.busy_time = 0.0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.evictions = 0
+
+
+class DevicePool(object):
+    """Set of clients shared by worker threads, one client per device.
+
+    Workers get exclusive use of a device through :meth:`lease`. Waiting
+    workers are served in FIFO order and idle devices are handed out
+    least-recently-used first, so load is spread evenly over the pool.
+
+    A device is evicted after `max_failures` consecutive failed leases or
+    a failed health check. :meth:`refresh` attaches new devices and tries
+    to reconnect evicted ones. :meth:`start` does both periodically.
+
+    asyncio code can lease devices with ``loop.run_in_executor(None, pool.acquire)``.
+
+    >>> pool = DevicePool()
+    >>> pool.refresh()
+    >>> with pool.lease() as client:
+    ...     client.get_address('Bitcoin', address_n)
+    """
+
+    def __init__(self, transports: Iterable[Transport] = (), client_factory=None, max_failures=3):
+        if client_factory is None:
+            from .client import TrezorClient
+            client_factory = TrezorClient
+        self.client_factory = client_factory
+        self.max_failures = max_failures
+
+        self._cond = threading.Condition()
+        self._devices = OrderedDict()  # type: Dict[str, _PooledDevice]
+        self._idle = deque()
+        self._leased = {}
+        self._waiters = deque()
+        self._thread = None
+        self._stop = threading.Event()
+
+        for transport in transports:
+            self.add(transport)
+
+    def __len__(self):
+        with self._cond:
+            return sum(1 for d in self._devices.values() if not d.evicted)
+
+    def _connect(self, device):
+        if device.client is not None:
+            # client of an evicted device, release its transport first
+            try:
+                device.client.close()
+            except Exception as e:
+                LOG.debug("Failed to close client of {}: {}".format(device.path, e))
+            device.client = None
+        try:
+            device.client = self.client_factory(device.transport)
+            return True
+        except Exception as e:
+            LOG.warning("Failed to connect to {}: {}".format(device.path, e))
+            return False
+
+    def _evict(self, device):
+        LOG.warning("Evicting device {}".format(device.path))
+        device.evicted = True
+        device.evictions += 1
+        if device in self._idle:
+            self._idle.remove(device)
+
+    def add(self, transport: Transport) -> bool:
+        """Connect to `transport` and add it to the pool.
+
+        Returns False if the device could not be connected.
+        """
+        device = _PooledDevice(transport)
+        with self._cond:
+            if device.path in self._devices:
+                raise ValueError("Device {} is already in the pool".format(device.path))
+            self._devices[device.path] = device
+
+        connected = self._connect(device)
+        with self._cond:
+            if connected:
+                self._idle.append(device)
+                self._cond.notify_all()
+            else:
+                self._evict(device)
+        return connected
+
+    def remove(self, path: str) -> None:
+        """Remove a device from the pool. A current lease stays valid until released."""
+        with self._cond:
+            device = self._devices.pop(path)
+            device.evicted = True
+            if device in self._idle:
+                self._idle.remove(device)
+
+    def acquire(self, timeout=None):
+        """Wait for an idle device and return its client.
+
+        Raises TimeoutError if no device becomes available within `timeout` seconds.
+        The client must be returned with :meth:`release`.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ticket = object()
+        with self._cond:
+            self._waiters.append(ticket)
+            try:
+                while self._waiters[0] is not ticket or not self._idle:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError("No device available")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiters.remove(ticket)
+                self._cond.notify_all()
+
+            device = self._idle.popleft()
+            device.leased_since = time.monotonic()
+            device.leases += 1
+            self._leased[id(device.client)] = device
+            return device.client
+
+    def release(self, client, failed=False) -> None:
+        """Return a leased client to the pool.
+
+        Set `failed` if the device misbehaved during the lease.
+        """
+        with self._cond:
+            device = self._leased.pop(id(client))
+            device.busy_time += time.monotonic() - device.leased_since
+            device.leased_since = None
+            if failed:
+                device.failures += 1
+                device.consecutive_failures += 1
+            else:
+                device.consecutive_failures = 0
+
+            if device.evicted:
+                pass  # removed while leased
+            elif device.consecutive_failures >= self.max_failures:
+                self._evict(device)
+            else:
+                self._idle.append(device)
+            self._cond.notify_all()
+
+    @contextmanager
+    def lease(self, timeout=None):
+        """Context manager around :meth:`acquire` and :meth:`release`.
+
+        Exceptions other than `CallException` (a regular error answer from
+        the device) count as a failure of the device.
+        """
+        client = self.acquire(timeout)
+        failed = False
+        try:
+            yield client
+        except CallException:
+            raise
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.release(client, failed)
+
+    def health_check(self) -> None:
+        """Ping every idle device and evict the ones that do not answer."""
+        with self._cond:
+            devices = list(self._idle)
+
+        for device in devices:
+            with self._cond:
+                if device not in self._idle:
+                    continue
+                self._idle.remove(device)
+
+            try:
+                device.client.ping('health check')
+                healthy = True
+            except Exception as e:
+                LOG.warning("Health check of {} failed: {}".format(device.path, e))
+                healthy = False
+
+            with self._cond:
+                if device.evicted:
+                    pass
+                elif healthy:
+                    self._idle.append(device)
+                else:
+                    self._evict(device)
+                self._cond.notify_all()
+
+    def refresh(self, transports: Iterable[Transport] = None) -> None:
+        """Add newly connected devices and reattach evicted ones.
+
+        `transports` defaults to all currently connected devices.
+        """
+        if transports is None:
+            transports = enumerate_devices()
+
+        for transport in transports:
+            path = transport.get_path()
+            with self._cond:
+                device = self._devices.get(path)
+                if device is not None and not device.evicted:
+                    continue
+
+            if device is None:
+                self.add(transport)
+                continue
+
+            device.transport = transport
+            if self._connect(device):
+                LOG.info("Reattached device {}".format(path))
+                with self._cond:
+                    if self._devices.get(path) is device:
+                        device.evicted = False
+                        device.consecutive_failures = 0
+                        self._idle.append(device)
+                        self._cond.notify_all()
+
+    def start(self, interval=60) -> None:
+        """Run :meth:`health_check` and :meth:`refresh` every `interval` seconds."""
+        if self._thread is not None:
+            raise RuntimeError("Pool maintenance already running")
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.health_check()
+                    self.refresh()
+                except Exception as e:
+                    LOG.error("Pool maintenance failed: {}".format(e))
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """Stop pool maintenance and close all clients."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        with self._cond:
+            devices = list(self._devices.values())
+        for device in devices:
+            if device.client is not None:
+                device.client.close()
+
+    def stats(self) -> Dict[str, dict]:
+        """Per-device utilization metrics, keyed by transport path."""
+        now = time.monotonic()
+        result = {}
+        with self._cond:
+            for path, device in self._devices.items():
+                busy_time = device.busy_time
+                if device.leased_since is not None:
+                    busy_time += now - device.leased_since
+                lifetime = now - device.added
+                if device.evicted:
+                    state = 'evicted'
+                elif device.leased_since is not None:
+                    state = 'leased'
+                else:
+                    state = 'idle'
+                result[path] = {
+                    'state': state,
+                    'leases': device.leases,
+                    'busy_time': busy_time,
+                    'utilization': busy_time / lifetime if lifetime > 0 else 0.0,
+                    'failures': device.failures,
+                    'evictions': device.evictions,
+                }
+        return result
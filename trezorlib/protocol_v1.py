@@ -19,7 +19,7 @@ from __future__ import absolute_import
 from io import BytesIO
 import logging
 import struct
-from typing import Tuple, Type
+from typing import Iterable, Iterator, List, Tuple, Type
 
 from . import mapping
 from . import protobuf
@@ -39,20 +39,29 @@ class ProtocolV1:
         pass
 
     def write(self, transport: Transport, msg: protobuf.MessageType) -> None:
-        LOG.debug("sending message: {}".format(msg.__class__.__name__),
-                  extra={'protobuf': msg})
+        self.write_encoded(transport, msg, self._chunks(msg))
+
+    def encode(self, msg: protobuf.MessageType) -> List[bytes]:
+        # Serialize and frame the message ahead of time for write_encoded()
+        return list(self._chunks(msg))
+
+    def _chunks(self, msg: protobuf.MessageType) -> Iterator[bytes]:
         data = BytesIO()
         protobuf.dump_message(data, msg)
         ser = data.getvalue()
         header = struct.pack(">HL", mapping.get_type(msg), len(ser))
-        data = bytearray(b"##" + header + ser)
+        data = b"##" + header + ser
 
-        while data:
+        for offset in range(0, len(data), REPLEN - 1):
             # Report ID, data padded to 63 bytes
-            chunk = b'?' + data[:REPLEN - 1]
-            chunk = chunk.ljust(REPLEN, b'\x00')
+            chunk = b'?' + data[offset:offset + REPLEN - 1]
+            yield chunk.ljust(REPLEN, b'\x00')
+
+    def write_encoded(self, transport: Transport, msg: protobuf.MessageType, chunks: Iterable[bytes]) -> None:
+        LOG.debug("sending message: {}".format(msg.__class__.__name__),
+                  extra={'protobuf': msg})
+        for chunk in chunks:
             transport.write_chunk(chunk)
-            data = data[63:]
 
     def read(self, transport: Transport) -> protobuf.MessageType:
         # Read header with first part of message data
@@ -19,7 +19,7 @@ from __future__ import absolute_import
 from io import BytesIO
 import logging
 import struct
-from typing import Tuple
+from typing import Iterable, Iterator, List, Tuple
 
 from . import mapping
 from . import protobuf
@@ -57,32 +57,46 @@ class ProtocolV2:
         self.session = None
 
     def write(self, transport: Transport, msg: protobuf.MessageType) -> None:
+        self.write_encoded(transport, msg, self._chunks(msg))
+
+    def encode(self, msg: protobuf.MessageType) -> List[bytes]:
+        # Serialize and frame the message ahead of time for write_encoded()
+        return list(self._chunks(msg))
+
+    def _chunks(self, msg: protobuf.MessageType) -> Iterator[bytes]:
+        # The chunks carry the session id and are only valid in this session
         if not self.session:
             raise RuntimeError('Missing session for v2 protocol')
 
-        LOG.debug("[session {}] sending message: {}".format(self.session, msg.__class__.__name__),
-                  extra={'protobuf': msg})
         # Serialize whole message
         data = BytesIO()
         protobuf.dump_message(data, msg)
         data = data.getvalue()
         dataheader = struct.pack('>LL', mapping.get_type(msg), len(data))
         data = dataheader + data
+        offset = 0
         seq = -1
 
-        # Write it out
-        while data:
+        while offset < len(data):
             if seq < 0:
                 repheader = struct.pack('>BL', 0x01, self.session)
             else:
                 repheader = struct.pack('>BLL', 0x02, self.session, seq)
             datalen = REPLEN - len(repheader)
-            chunk = repheader + data[:datalen]
-            chunk = chunk.ljust(REPLEN, b'\x00')
-            transport.write_chunk(chunk)
-            data = data[datalen:]
+            chunk = repheader + data[offset:offset + datalen]
+            yield chunk.ljust(REPLEN, b'\x00')
+            offset += datalen
             seq += 1
 
+    def write_encoded(self, transport: Transport, msg: protobuf.MessageType, chunks: Iterable[bytes]) -> None:
+        if not self.session:
+            raise RuntimeError('Missing session for v2 protocol')
+
+        LOG.debug("[session {}] sending message: {}".format(self.session, msg.__class__.__name__),
+                  extra={'protobuf': msg})
+        for chunk in chunks:
+            transport.write_chunk(chunk)
+
     def read(self, transport: Transport) -> protobuf.MessageType:
         if not self.session:
             raise RuntimeError('Missing session for v2 protocol')
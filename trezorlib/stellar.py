@@ -16,7 +16,6 @@
 
 import base64
 import struct
-import xdrlib
 
 from . import messages
 
@@ -51,29 +50,113 @@ DEFAULT_BIP32_PATH = "m/44h/148h/0h"
 # Stellar's BIP32 differs to Bitcoin's see https://github.com/stellar/stellar-protocol/blob/master/ecosystem/sep-0005.md
 
 
+# version byte of account ids (G...)
+ACCOUNT_ID_VERSION = 6 << 3
+# version byte, 32 bytes of public key and 2 bytes of checksum
+_ADDRESS_BYTES = 35
+# 35 bytes are exactly 56 base32 characters, so addresses can be
+# encoded and decoded in bulk without padding
+_ADDRESS_LENGTH = 56
+
+
+def _address_payload(pk_bytes):
+    if len(pk_bytes) != 32:
+        raise ValueError("Public key must be 32 bytes")
+    payload = bytes((ACCOUNT_ID_VERSION,)) + pk_bytes
+    return payload + struct.pack("<H", _crc16_checksum(payload))
+
+
+def _public_key_from_payload(payload):
+    if len(payload) != _ADDRESS_BYTES or payload[0] != ACCOUNT_ID_VERSION:
+        raise ValueError("Invalid address")
+    if struct.unpack("<H", payload[-2:])[0] != _crc16_checksum(payload[:-2]):
+        raise ValueError("Invalid address checksum")
+    return payload[1:-2]
+
+
 def address_from_public_key(pk_bytes):
     """Returns the base32-encoded version of pk_bytes (G...)
     """
-    final_bytes = bytearray()
-
-    # version
-    final_bytes.append(6 << 3)
-    # public key
-    final_bytes.extend(pk_bytes)
-    # checksum
-    final_bytes.extend(struct.pack("<H", _crc16_checksum(final_bytes)))
-
-    return str(base64.b32encode(final_bytes), 'utf-8')
+    return str(base64.b32encode(_address_payload(pk_bytes)), 'utf-8')
 
 
 def address_to_public_key(address_str):
     """Returns the raw 32 bytes representing a public key by extracting
-    it from the G... string
+    it from the G... string. Raises ValueError if the checksum does not match.
+    """
+    return _public_key_from_payload(base64.b32decode(address_str))
+
+
+def addresses_from_public_keys(public_keys):
+    """Returns the list of addresses of public_keys
+    """
+    encoded = str(base64.b32encode(b''.join(_address_payload(pk) for pk in public_keys)), 'utf-8')
+    return [encoded[i:i + _ADDRESS_LENGTH] for i in range(0, len(encoded), _ADDRESS_LENGTH)]
+
+
+def public_keys_from_addresses(addresses):
+    """Returns the list of raw public keys of addresses, validating every
+    checksum
+    """
+    addresses = list(addresses)
+    if any(len(address) != _ADDRESS_LENGTH for address in addresses):
+        raise ValueError("Invalid address")
+    decoded = base64.b32decode(''.join(addresses))
+    return [_public_key_from_payload(decoded[i:i + _ADDRESS_BYTES]) for i in range(0, len(decoded), _ADDRESS_BYTES)]
+
+
+_UINT = struct.Struct(">I")
+_HYPER = struct.Struct(">q")
+_UHYPER = struct.Struct(">Q")
+_ADDRESS = struct.Struct(">I32s")
+
+
+class _XdrReader(object):
+    """Reads XDR values from a bytes-like object without copying it.
+
+    Method names follow `xdrlib.Unpacker`. Fixed-size values are read with
+    precompiled struct formats.
     """
-    decoded = base64.b32decode(address_str)
 
-    # skip 0th byte (version) and last two bytes (checksum)
-    return decoded[1:-2]
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.offset = 0
+
+    def unpack(self, fmt):
+        try:
+            values = fmt.unpack_from(self.data, self.offset)
+        except struct.error:
+            raise ValueError("Unexpected end of XDR data")
+        self.offset += fmt.size
+        return values
+
+    def unpack_uint(self):
+        return self.unpack(_UINT)[0]
+
+    def unpack_bool(self):
+        return bool(self.unpack(_UINT)[0])
+
+    def unpack_hyper(self):
+        return self.unpack(_HYPER)[0]
+
+    def unpack_uhyper(self):
+        return self.unpack(_UHYPER)[0]
+
+    def unpack_fopaque(self, n):
+        end = self.offset + n
+        if end > len(self.data):
+            raise ValueError("Unexpected end of XDR data")
+        data = self.data[self.offset:end].tobytes()
+        # opaque data is padded to a multiple of 4 bytes
+        self.offset = end + (-n & 3)
+        return data
+
+    unpack_fstring = unpack_fopaque
+
+    def unpack_opaque(self):
+        return self.unpack_fopaque(self.unpack_uint())
+
+    unpack_string = unpack_opaque
 
 
 def parse_transaction_bytes(tx_bytes):
@@ -81,8 +164,18 @@ def parse_transaction_bytes(tx_bytes):
         tx - a StellarSignTx describing the transaction header
         operations - an array of protobuf message objects for each operation
     """
+    tx, operations = parse_transaction_bytes_iter(tx_bytes)
+    return tx, list(operations)
+
+
+def parse_transaction_bytes_iter(tx_bytes):
+    """Like `parse_transaction_bytes`, but `operations` is an iterator that
+    parses the operations one by one as they are consumed.
+
+    `tx_bytes` must not be modified until the iterator is exhausted.
+    """
     tx = messages.StellarSignTx()
-    unpacker = xdrlib.Unpacker(tx_bytes)
+    unpacker = _XdrReader(tx_bytes)
 
     tx.source_account = _xdr_read_address(unpacker)
     tx.fee = unpacker.unpack_uint()
@@ -114,9 +207,7 @@ def parse_transaction_bytes(tx_bytes):
 
     tx.num_operations = unpacker.unpack_uint()
 
-    operations = []
-    for i in range(tx.num_operations):
-        operations.append(_parse_operation_bytes(unpacker))
+    operations = (_parse_operation_bytes(unpacker) for i in range(tx.num_operations))
 
     return tx, operations
 
@@ -308,29 +399,37 @@ def _xdr_read_address(unpacker):
     This method assumes the encoded address is a public address (starting with G)
     """
     # First 4 bytes are the address type
-    address_type = unpacker.unpack_uint()
+    address_type, public_key = unpacker.unpack(_ADDRESS)
     if address_type != 0:
         raise ValueError("Unsupported address type")
 
-    return address_from_public_key(unpacker.unpack_fopaque(32))
+    return address_from_public_key(public_key)
+
+
+def _crc16_table():
+    # CRC-16/XModem (polynomial 0x1021) of every single byte
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for i in range(8):
+            crc = (crc << 1) ^ 0x1021 if crc & 0x8000 else crc << 1
+        table.append(crc & 0xffff)
+    return tuple(table)
+
+
+_CRC16_TABLE = _crc16_table()
 
 
 def _crc16_checksum(bytes):
     """Returns the CRC-16 checksum of bytearray bytes
 
-    Ported from Java implementation at: http://introcs.cs.princeton.edu/java/61data/CRC16CCITT.java.html
-
-    Initial value changed to 0x0000 to match Stellar configuration.
+    CRC-16/XModem as used by Stellar, with initial value 0x0000,
+    computed one byte at a time with a lookup table.
     """
     crc = 0x0000
-    polynomial = 0x1021
+    table = _CRC16_TABLE
 
     for byte in bytes:
-        for i in range(8):
-            bit = ((byte >> (7 - i) & 1) == 1)
-            c15 = ((crc >> 15 & 1) == 1)
-            crc <<= 1
-            if c15 ^ bit:
-                crc ^= polynomial
+        crc = ((crc << 8) & 0xffff) ^ table[(crc >> 8) ^ byte]
 
-    return crc & 0xffff
+    return crc
@@ -24,6 +24,7 @@ from trezorlib.client import TrezorClientDebugLink
 
 tests_dir = os.path.dirname(os.path.abspath(__file__))
 tx_api.cache_dir = os.path.join(tests_dir, '../txcache')
+tx_api.tx_cache = tx_api.LRUTxCache()
 
 
 class TrezorTest:
@@ -123,15 +123,11 @@ def serialize(node, version=0x0488B21E):
         s += b'\x00' + node.private_key
     else:
         s += node.public_key
-    s += tools.btc_hash(s)[:4]
-    return tools.b58encode(s)
+    return tools.b58check_encode(s)
 
 
 def deserialize(xpub):
-    data = tools.b58decode(xpub, None)
-
-    if tools.btc_hash(data[:-4])[:4] != data[-4:]:
-        raise ValueError("Checksum failed")
+    data = tools.b58check_decode(xpub)
 
     node = messages.HDNodeType()
     node.depth = struct.unpack('>B', data[4:5])[0]
@@ -139,7 +135,7 @@ def deserialize(xpub):
     node.child_num = struct.unpack('>I', data[9:13])[0]
     node.chain_code = data[13:45]
 
-    key = data[45:-4]
+    key = data[45:]
     if key[0] == 0:
         node.private_key = key[1:]
     else:
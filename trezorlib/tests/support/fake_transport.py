@@ -0,0 +1,64 @@
+# This file is part of the Trezor project.
+#
+# Copyright (C) 2012-2018 SatoshiLabs and contributors
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the License along with this library.
+# If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
+
+from collections import deque
+
+from trezorlib import messages as proto
+from trezorlib.transport import Transport
+
+
+def make_features(**kwargs):
+    """Features of an initialized TREZOR One, updated with `kwargs`."""
+    values = dict(vendor='trezor.io', major_version=1, minor_version=6, patch_version=2,
+                  device_id='0123456789ABCDEF01234567', initialized=True, bootloader_mode=None,
+                  pin_protection=False, passphrase_protection=False, model='1')
+    values.update(kwargs)
+    return proto.Features(**values)
+
+
+class FakeTransport(Transport):
+    """In-memory transport. Every written message is answered by `handler(msg)`.
+
+    Written messages are recorded in `written`. Initialize is answered with
+    `features` unless `handler` returns something else for it.
+    """
+    PATH_PREFIX = 'fake'
+
+    def __init__(self, handler=None, device='0', features=None):
+        super().__init__()
+        self.device = device
+        self.handler = handler
+        self.features = features if features is not None else make_features()
+        self.written = []
+        self.responses = deque()
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def write(self, msg):
+        self.written.append(msg)
+        resp = self.handler(msg) if self.handler is not None else None
+        if resp is None and isinstance(msg, proto.Initialize):
+            resp = self.features
+        if resp is None:
+            resp = proto.Success()
+        self.responses.append(resp)
+
+    def read(self):
+        return self.responses.popleft()
@@ -0,0 +1,67 @@
+# This file is part of the Trezor project.
+#
+# Copyright (C) 2012-2018 SatoshiLabs and contributors
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the License along with this library.
+# If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
+
+import binascii
+import pytest
+
+from trezorlib import bip32
+from trezorlib import messages as proto
+from trezorlib.tools import H_
+from ..support import ckd_public
+
+XPUB = 'xpub661MyMwAqRbcEnKbXcCqD2GT1di5zQxVqoHPAgHNe8dv5JP8gWmDproS6kFHJnLZd23tWevhdn4urGJ6b264DfTGKr8zjmYDjyDTi9U7iyT'
+# BIP-84 test vector, account 0
+ZPUB = 'zpub6rFR7y4Q2AijBEqTUquhVz398htDFrtymD9xYYfG1m4wAcvPhXNfE3EfH1r1ADqtfSdVCToUG868RvUUkgDKf31mGDtKsAYz2oz2AGutZYs'
+
+
+def test_public_ckd():
+    node = bip32.deserialize(XPUB)
+    assert bip32.serialize(bip32.public_ckd(node, [0])) == 'xpub67ymn1YTdE2iSGXitxUEZeUdHF2FsejJATroeAxVMtzTAK9o3vjmFLrE7TqE1X76iobkVc3p8h3gNzNRTwPeQGYW3CCmYCG8n5ThVkXaQzs'
+    assert bip32.serialize(bip32.public_ckd(node, [0, 0])) == 'xpub6BD2MwdEg5PJPqiGetL9DJs7oDo6zP3XwAABX2vAQb5eLpY3QhHGUEm25V4nkQhnFMsqEVfTwtax2gKz8EFrt1PnBN6xQjE9jGmWDR6modu'
+
+    with pytest.raises(ValueError):
+        bip32.get_subnode(node, H_(0))
+
+
+def test_node_cache():
+    node = bip32.deserialize(XPUB)
+    cache = bip32.NodeCache(maxsize=2)
+    child = bip32.public_ckd(node, [1, 2, 3], cache)
+    assert len(cache) == 2
+    assert bip32.public_ckd(node, [1, 2, 3], cache) == child
+    assert bip32.public_ckd(node, [1, 2, 3], None) == child
+
+
+def test_derive_children():
+    node = bip32.deserialize(XPUB)
+    indices = [0, 1, bip32.BATCH_SIZE, bip32.BATCH_SIZE + 7]
+    children = list(bip32.derive_children(node, range(bip32.BATCH_SIZE + 10)))
+    for i in indices:
+        assert children[i] == bip32.get_subnode(node, i, None)
+        assert children[i] == ckd_public.public_ckd(node, [i])
+
+    addresses = list(bip32.derive_addresses(node, 'Bitcoin', indices, chain=5))
+    assert addresses == [ckd_public.get_address(ckd_public.public_ckd(node, [5, i]), 0) for i in indices]
+
+
+def test_addresses():
+    node = bip32.public_ckd(bip32.deserialize(ZPUB), [0, 0])
+    assert node.public_key == binascii.unhexlify('0330d54fd0dd420a6e5f8d3624f5f3482cae350f79d5f0753bf5beef9c2d91af3c')
+    assert bip32.get_address(node, 'Bitcoin', proto.InputScriptType.SPENDWITNESS) == 'bc1qcr8te4kr609gcawutmrza0j4xv80jy8z306fyu'
+
+    # BIP-49 test vector
+    public_key = binascii.unhexlify('03a1af804ac108a8a51782198c2d034b28bf90c8803f5a53f76276fa69a4eae77f')
+    assert bip32.public_key_to_address(public_key, 'Testnet', proto.InputScriptType.SPENDP2SHWITNESS) == '2Mww8dCYPUpKHofjgcXcBCEGmniw9CoaiD2'
@@ -19,18 +19,7 @@ import hashlib
 import pytest
 
 from trezorlib import cosi
-
-# These tests calculate Ed25519 signatures in pure Python.
-# In addition to being Python, this is also DJB's proof-of-concept, unoptimized code.
-# As a result, it is actually very noticeably slow. On a gen8 Core i5, this takes around 40 seconds.
-# To skip the test, run `pytest -m "not slow_cosi"`.
-
-# Therefore, the tests are skipped by default.
-# Run `pytest -m slow_cosi` to explicitly enable.
-
-pytestmark = pytest.mark.slow_cosi
-if "slow_cosi" not in pytest.config.getoption("-m"):
-    pytestmark = pytest.mark.skip("Skipping slow CoSi tests. 'pytest -m slow_cosi' to run.")
+from trezorlib import messages
 
 
 RFC8032_VECTORS = (
@@ -138,3 +127,43 @@ def test_cosi_combination(keyset):
         cosi.verify(global_sig, message, global_pk)
     except ValueError:
         pytest.fail("Failed to validate global signature")
+
+
+def test_verify_batch():
+    items = [(signature, message, pubkey) for _, pubkey, message, signature in RFC8032_VECTORS]
+    assert cosi.verify_batch(items) == [True] * len(items)
+
+    items[1] = (items[1][0], items[1][1] + b'\x00', items[1][2])
+    items[2] = (b'\xf1' + items[2][0][1:], items[2][1], items[2][2])
+    expected = [True] * len(items)
+    expected[1] = expected[2] = False
+    assert cosi.verify_batch(items, chunk_size=2) == expected
+    assert cosi.verify_batch(items * 3, processes=2) == expected * 3
+
+
+class FakeCosiClient:
+    # signs with the RFC 8032 keys, indexed by the last path component
+    def __init__(self):
+        self.nonces = {}
+
+    def cosi_commit(self, n, digest):
+        privkey = RFC8032_VECTORS[n[-1]][0]
+        nonce, commitment = cosi.get_nonce(privkey, digest)
+        self.nonces[n[-1]] = nonce
+        return messages.CosiCommitment(commitment=commitment, pubkey=cosi.pubkey_from_privkey(privkey))
+
+    def cosi_sign(self, n, digest, global_commitment, global_pubkey):
+        privkey = RFC8032_VECTORS[n[-1]][0]
+        signature = cosi.sign_with_privkey(digest, privkey, global_pubkey, self.nonces[n[-1]], global_commitment)
+        return messages.CosiSignature(signature=signature)
+
+
+def test_sign_with_devices():
+    digest = hashlib.sha256(b'this is a message').digest()
+    shared = FakeCosiClient()
+    signers = [(FakeCosiClient(), [0]), (shared, [1]), (shared, [2])]
+    result = cosi.sign_with_devices(signers, digest)
+
+    assert result.global_pubkey == cosi.combine_keys(pubkey for _, pubkey, _, _ in RFC8032_VECTORS[:3])
+    cosi.verify(result.signature, digest, result.global_pubkey)
+    assert len(result.timings) == 3
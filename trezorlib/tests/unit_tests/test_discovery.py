@@ -0,0 +1,72 @@
+# This file is part of the Trezor project.
+#
+# Copyright (C) 2012-2018 SatoshiLabs and contributors
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the License along with this library.
+# If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
+
+from trezorlib import bip32
+from trezorlib import messages as proto
+from trezorlib.discovery import discover_accounts
+from trezorlib.tools import H_
+
+XPUB = 'xpub661MyMwAqRbcEnKbXcCqD2GT1di5zQxVqoHPAgHNe8dv5JP8gWmDproS6kFHJnLZd23tWevhdn4urGJ6b264DfTGKr8zjmYDjyDTi9U7iyT'
+ROOT = bip32.deserialize(XPUB)
+
+
+class FakeClient:
+    # account nodes are stand-ins derived publicly from a fixed root
+    def __init__(self):
+        self.calls = []
+
+    def get_public_node(self, n, coin_name=None):
+        self.calls.append(n)
+        return proto.PublicKey(node=bip32.get_subnode(ROOT, n[2] & ~H_(0)))
+
+
+def address(account, chain, index):
+    return bip32.get_address(bip32.public_ckd(ROOT, [account, chain, index]), 'Bitcoin')
+
+
+class StubBackend:
+    def __init__(self, used):
+        self.used = set(used)
+        self.queried = set()
+
+    def is_used(self, address):
+        self.queried.add(address)
+        return address in self.used
+
+
+def test_discover_accounts():
+    backend = StubBackend([
+        address(0, 0, 0),
+        address(0, 0, 5),
+        address(0, 0, 24),
+        address(0, 0, 50),  # beyond the gap
+        address(0, 1, 3),
+        address(1, 0, 0),
+        address(3, 0, 0),  # after an unused account
+    ])
+    client = FakeClient()
+    accounts = discover_accounts(client, 'Bitcoin', backend, gap_limit=20)
+
+    assert [a.index for a in accounts] == [0, 1]
+    assert client.calls == [[H_(44), H_(0), H_(i)] for i in range(3)]
+    assert accounts[0].used[0] == [(i, address(0, 0, i)) for i in (0, 5, 24)]
+    assert accounts[0].used[1] == [(3, address(0, 1, 3))]
+    assert accounts[1].used == {0: [(0, address(1, 0, 0))], 1: []}
+
+    # every chain is checked exactly up to the gap limit
+    assert address(0, 0, 44) in backend.queried
+    assert address(0, 0, 45) not in backend.queried
+    assert len(backend.queried) == 45 + 24 + 21 + 20 + 20
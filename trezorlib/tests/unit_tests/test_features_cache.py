@@ -0,0 +1,181 @@
+# This file is part of the Trezor project.
+#
+# Copyright (C) 2012-2018 SatoshiLabs and contributors
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the License along with this library.
+# If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
+
+import os
+import threading
+import time
+
+import pytest
+
+from trezorlib import messages as proto
+from trezorlib.client import TrezorClient
+from trezorlib.features_cache import FeaturesCache
+
+from ..support.fake_transport import FakeTransport, make_features
+
+OTHER_DEVICE_ID = 'FEDCBA987654321012345678'
+XPRV = 'xprv9s21ZrQH143K3QTDL4LXw2F7HEK3wJUD2nW2nRk4stbPy6cq3jPPqjiChkVvvNKmPGJxWUtg6LnF5kejMRNNU3TGtRBeJgk33yuGBxrMPHi'
+
+
+@pytest.fixture
+def cache(tmpdir):
+    return FeaturesCache(str(tmpdir.join('features.json')))
+
+
+def test_get_set(cache):
+    features = make_features(label='label', pin_cached=True, passphrase_cached=True)
+    assert cache.get('fake:0') is None
+    cache.set('fake:0', None, features)
+
+    cached = cache.get('fake:0')
+    assert cached.device_id == features.device_id
+    assert cached.vendor == 'trezor.io'
+    assert cached.major_version == 1
+    # settings and session fields are never cached
+    assert cached.label is None
+    assert cached.pin_cached is None
+    assert cached.passphrase_cached is None
+    assert cached.initialized is None
+
+    # shared through the file
+    assert FeaturesCache(cache.filename).get('fake:0').device_id == features.device_id
+
+
+def test_expiry(cache, monkeypatch):
+    cache.set('fake:0', None, make_features())
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + cache.max_age + 1)
+    assert cache.get('fake:0') is None
+
+
+def test_unchanged_not_rewritten(cache, monkeypatch):
+    saved = []
+    save = cache._save
+    monkeypatch.setattr(cache, '_save', lambda entries: saved.append(save(entries)))
+    cache.set('fake:0', None, make_features())
+    cache.set('fake:0', None, make_features(label='other'))
+    assert len(saved) == 1
+
+    cache.set('fake:0', None, make_features(patch_version=3))
+    assert len(saved) == 2
+
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + cache.max_age / 2 + 1)
+    cache.set('fake:0', None, make_features(patch_version=3))
+    assert len(saved) == 3
+
+
+def test_concurrent_writers(cache):
+    def worker(i):
+        for j in range(20):
+            cache.set('fake:%d' % i, bytes([j]) * 64, make_features())
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # updates may be lost between writers, but the file is always complete
+    assert cache._load()
+    assert os.listdir(os.path.dirname(cache.filename)) == ['features.json']
+
+
+def test_state_key(cache):
+    cache.set('fake:0', b'\x01' * 64, make_features())
+    assert cache.get('fake:0') is None
+    assert cache.get('fake:0', b'\x02' * 64) is None
+    assert cache.get('fake:0', b'\x01' * 64) is not None
+
+
+def test_path_reuse(cache):
+    cache.set('fake:0', None, make_features())
+    cache.set('fake:0', b'\x01' * 64, make_features())
+    cache.set('fake:1', None, make_features(device_id=OTHER_DEVICE_ID))
+
+    # another device on the same path drops the entries of the old one
+    cache.set('fake:0', None, make_features(device_id=OTHER_DEVICE_ID))
+    assert cache.get('fake:0').device_id == OTHER_DEVICE_ID
+    assert cache.get('fake:0', b'\x01' * 64) is None
+
+    # so does a device in bootloader mode, and the other path of that device
+    cache.set('fake:0', None, make_features(device_id=None, bootloader_mode=True))
+    assert cache.get('fake:0') is None
+    assert cache.get('fake:1') is None
+
+
+def test_client_always_initializes(cache):
+    state = b'\x01' * 64
+    cache.set('fake:0', state, make_features())
+    transport = FakeTransport()
+    client = TrezorClient(transport, state=state, features_cache=cache)
+
+    assert isinstance(transport.written[0], proto.Initialize)
+    assert transport.written[0].state == state
+    assert client.features is transport.features
+
+
+def test_bootloader_reboot(cache):
+    transport = FakeTransport()
+    TrezorClient(transport, features_cache=cache)
+    assert cache.get('fake:0') is not None
+
+    # same path, rebooted into bootloader mode
+    transport.features = make_features(device_id=None, bootloader_mode=True, initialized=None)
+    client = TrezorClient(transport, features_cache=cache)
+    assert client.features.bootloader_mode
+    assert cache.get('fake:0') is None
+    assert client.firmware_update(b'\x00' * 1024)
+
+
+STATE_CHANGING_CALLS = [
+    ('apply_settings', (), {'label': 'new'}, True),
+    ('apply_flags', (1,), {}, True),
+    ('change_pin', (), {}, True),
+    ('clear_session', (), {}, True),
+    ('set_u2f_counter', (5,), {}, True),
+    ('wipe_device', (), {}, True),
+    ('backup_device', (), {}, True),
+    ('recovery_device', (12, False, False, 'label', 'english'), {}, False),
+    ('reset_device', (False, 128, False, False, 'label', 'english'), {}, False),
+    ('load_device_by_mnemonic', ('all ' * 12, '', False, 'label'), {'skip_checksum': True}, False),
+    ('load_device_by_xprv', (XPRV, '', False, 'label', 'english'), {}, False),
+]
+
+
+@pytest.mark.parametrize('method, args, kwargs, initialized', STATE_CHANGING_CALLS)
+def test_invalidation(cache, method, args, kwargs, initialized):
+    cached_during_call = []
+
+    def handler(msg):
+        if isinstance(msg, proto.Initialize):
+            return None
+        cached_during_call.append(cache.get('fake:0') is not None)
+        if isinstance(msg, proto.ResetDevice):
+            return proto.EntropyRequest()
+        return None
+
+    transport = FakeTransport(handler, features=make_features(initialized=initialized))
+    client = TrezorClient(transport, features_cache=cache)
+    assert cache.get('fake:0') is not None
+
+    sent = len(transport.written)
+    getattr(client, method)(*args, **kwargs)
+    # no extra Initialize before the call
+    assert not isinstance(transport.written[sent], proto.Initialize)
+    assert cached_during_call and not any(cached_during_call)
+    # the next Initialize records the features again
+    client.init_device()
+    assert cache.get('fake:0') is not None
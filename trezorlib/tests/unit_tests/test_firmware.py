@@ -0,0 +1,96 @@
+# This file is part of the Trezor project.
+#
+# Copyright (C) 2012-2018 SatoshiLabs and contributors
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the License along with this library.
+# If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
+
+import binascii
+import hashlib
+import pytest
+
+from trezorlib import firmware
+from trezorlib import messages as proto
+
+FIRMWARE_V1 = b'TRZR' + b'\x00' * 252 + b'firmware code'
+FIRMWARE_V1_FINGERPRINT = hashlib.sha256(b'firmware code').hexdigest()
+
+
+class FakeTransport:
+    def __init__(self, path):
+        self.path = path
+
+    def get_path(self):
+        return self.path
+
+
+class FakeClient:
+    failures = {}
+    flashed = {}
+
+    def __init__(self, transport):
+        self.path = transport.get_path()
+        self.features = proto.Features(bootloader_mode=(self.path != 'fake:normal'))
+
+    def firmware_update(self, fp, progress=None):
+        if self.failures.get(self.path, 0) > 0:
+            self.failures[self.path] -= 1
+            raise OSError('device disconnected')
+        self.flashed[self.path] = bytes(fp)
+        progress(len(fp), len(fp), 1.0)
+        return self.path != 'fake:reject'
+
+
+def test_validate():
+    assert firmware.validate(FIRMWARE_V1) == FIRMWARE_V1
+    assert firmware.validate(binascii.hexlify(FIRMWARE_V1)) == FIRMWARE_V1
+    assert firmware.validate(FIRMWARE_V1, FIRMWARE_V1_FINGERPRINT) == FIRMWARE_V1
+    assert firmware.fingerprint(FIRMWARE_V1) == FIRMWARE_V1_FINGERPRINT
+    assert firmware.fingerprint(b'TRZV' + FIRMWARE_V1[4:]) is None
+
+    with pytest.raises(ValueError):
+        firmware.validate(b'XXXX' + FIRMWARE_V1[4:])
+    with pytest.raises(ValueError):
+        firmware.validate(FIRMWARE_V1, '00' * 32)
+
+    firmware_v2 = b'TRZV' + FIRMWARE_V1[4:]
+    assert firmware.validate(firmware_v2) == firmware_v2
+    with pytest.raises(ValueError, match='not supported'):
+        firmware.validate(firmware_v2, FIRMWARE_V1_FINGERPRINT)
+
+
+def test_flash_devices():
+    FakeClient.failures = {'fake:flaky': 1, 'fake:broken': 5}
+    FakeClient.flashed = {}
+    paths = ['fake:ok', 'fake:flaky', 'fake:broken', 'fake:reject', 'fake:normal']
+    seen = set()
+
+    results = firmware.flash_devices(
+        [FakeTransport(path) for path in paths],
+        binascii.hexlify(FIRMWARE_V1),
+        expected_fingerprint=FIRMWARE_V1_FINGERPRINT,
+        retries=2,
+        progress=lambda path, sent, total, speed: seen.add(path),
+        client_class=FakeClient,
+    )
+
+    assert [r.path for r in results] == paths
+    assert [r.success for r in results] == [True, True, False, False, False]
+    assert [r.attempts for r in results] == [1, 2, 3, 1, 1]
+    assert 'device disconnected' in results[2].error
+    assert FakeClient.flashed['fake:ok'] == FIRMWARE_V1
+    assert seen == {'fake:ok', 'fake:flaky', 'fake:reject'}
+
+
+def test_flash_devices_invalid_image():
+    with pytest.raises(ValueError):
+        firmware.flash_devices([FakeTransport('fake:ok')], b'garbage', client_class=FakeClient)
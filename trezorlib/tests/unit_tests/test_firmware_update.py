@@ -0,0 +1,169 @@
+# This file is part of the Trezor project.
+#
+# Copyright (C) 2012-2018 SatoshiLabs and contributors
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the License along with this library.
+# If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
+
+
+import hashlib
+import struct
+import sys
+import types
+from collections import deque
+
+import pytest
+
+from trezorlib import messages as proto
+from trezorlib.client import CallException, TrezorClient
+from trezorlib.protocol_v1 import ProtocolV1
+from trezorlib.protocol_v2 import ProtocolV2
+
+from ..support.fake_transport import FakeTransport, make_features
+
+FIRMWARE = bytes(range(256)) * 40
+CHUNK = 4096
+# the device is free to ask for chunks in any order
+OFFSETS = [0, 2 * CHUNK, CHUNK]
+
+
+@pytest.fixture
+def blake2s(monkeypatch):
+    # pyblake2 is only needed by TREZORv2 updates, hashlib provides the same hash
+    module = types.ModuleType('pyblake2')
+    module.blake2s = hashlib.blake2s
+    monkeypatch.setitem(sys.modules, 'pyblake2', module)
+
+
+def bootloader_client(handler, major_version):
+    features = make_features(device_id=None, initialized=None, bootloader_mode=True,
+                             major_version=major_version)
+    transport = FakeTransport(handler, features=features)
+    return TrezorClient(transport), transport
+
+
+def uploads(transport):
+    return [msg for msg in transport.written if isinstance(msg, proto.FirmwareUpload)]
+
+
+def test_firmware_update_v1():
+    def handler(msg):
+        if isinstance(msg, proto.FirmwareErase):
+            assert msg.length == len(FIRMWARE)
+
+    client, transport = bootloader_client(handler, 1)
+    progress = []
+    assert client.firmware_update(FIRMWARE, progress=lambda *args: progress.append(args))
+
+    upload, = uploads(transport)
+    assert bytes(upload.payload) == FIRMWARE
+    assert upload.hash is None
+    assert [p[:2] for p in progress] == [(len(FIRMWARE), len(FIRMWARE))]
+
+
+def test_firmware_update_v2(blake2s):
+    requests = deque(proto.FirmwareRequest(offset=offset, length=CHUNK) for offset in OFFSETS)
+
+    def handler(msg):
+        if isinstance(msg, (proto.FirmwareErase, proto.FirmwareUpload)):
+            return requests.popleft() if requests else proto.Success()
+
+    client, transport = bootloader_client(handler, 2)
+    progress = []
+    assert client.firmware_update(FIRMWARE, progress=lambda *args: progress.append(args))
+
+    sent = uploads(transport)
+    assert len(sent) == len(OFFSETS)
+    for offset, upload in zip(OFFSETS, sent):
+        expected = FIRMWARE[offset:offset + CHUNK]
+        assert bytes(upload.payload) == expected
+        assert upload.hash == hashlib.blake2s(expected).digest()
+
+    sizes = [len(FIRMWARE[offset:offset + CHUNK]) for offset in OFFSETS]
+    assert [p[0] for p in progress] == [sum(sizes[:i + 1]) for i in range(len(sizes))]
+    assert all(total == len(FIRMWARE) for _, total, _ in progress)
+    assert progress[-1][0] == len(FIRMWARE)
+    assert all(speed >= 0 for _, _, speed in progress)
+
+
+def test_firmware_update_v2_failure(blake2s):
+    def handler(msg):
+        if isinstance(msg, proto.FirmwareErase):
+            return proto.FirmwareRequest(offset=0, length=CHUNK)
+        if isinstance(msg, proto.FirmwareUpload):
+            return proto.Failure(code=proto.FailureType.FirmwareError)
+
+    client, transport = bootloader_client(handler, 2)
+    with pytest.raises(CallException):
+        client.firmware_update(FIRMWARE)
+    assert len(uploads(transport)) == 1
+
+
+def test_firmware_update_empty_file(tmpdir):
+    client, _ = bootloader_client(None, 1)
+    path = tmpdir.join('empty.bin')
+    path.write_binary(b'')
+    with pytest.raises(ValueError, match='Trezor firmware header expected'):
+        client.firmware_update(str(path))
+
+
+class ChunkTransport:
+
+    def __init__(self):
+        self.chunks = deque()
+
+    def write_chunk(self, chunk):
+        assert len(chunk) == 64
+        self.chunks.append(bytearray(chunk))
+
+    def read_chunk(self):
+        return self.chunks.popleft()
+
+
+@pytest.mark.parametrize('size', [0, 50, 1000, 5000])
+def test_protocol_v1_write(size):
+    msg = proto.FirmwareUpload(payload=FIRMWARE[:size])
+    transport = ChunkTransport()
+    ProtocolV1().write(transport, msg)
+
+    chunks = list(transport.chunks)
+    assert all(chunk[:1] == b'?' for chunk in chunks)
+    assert chunks[0][1:3] == b'##'
+    msg_type, length = struct.unpack('>HL', chunks[0][3:9])
+    assert msg_type == proto.MessageType.FirmwareUpload
+    assert len(chunks) == -(-(8 + length) // 63)
+
+    assert chunks == ProtocolV1().encode(msg)
+
+    read = ProtocolV1().read(transport)
+    assert read.payload == msg.payload
+
+
+@pytest.mark.parametrize('size', [0, 50, 1000, 5000])
+def test_protocol_v2_write(size):
+    msg = proto.FirmwareUpload(payload=FIRMWARE[:size])
+    transport = ChunkTransport()
+    protocol = ProtocolV2()
+    protocol.session = 0x12345678
+    protocol.write(transport, msg)
+
+    chunks = list(transport.chunks)
+    magic, session, msg_type, length = struct.unpack('>BLLL', chunks[0][:13])
+    assert (magic, session, msg_type) == (0x01, 0x12345678, proto.MessageType.FirmwareUpload)
+    for seq, chunk in enumerate(chunks[1:]):
+        assert struct.unpack('>BLL', chunk[:9]) == (0x02, 0x12345678, seq)
+    assert len(chunks) == 1 + max(0, -(-(8 + length - 59) // 55))
+
+    assert chunks == protocol.encode(msg)
+
+    read = protocol.read(transport)
+    assert read.payload == msg.payload
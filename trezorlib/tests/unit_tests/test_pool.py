@@ -0,0 +1,131 @@
+# This file is part of the Trezor project.
+#
+# Copyright (C) 2012-2018 SatoshiLabs and contributors
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the License along with this library.
+# If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
+
+import threading
+import pytest
+
+from trezorlib.client import CallException
+from trezorlib.pool import DevicePool
+
+
+class FakeTransport:
+    def __init__(self, path):
+        self.path = path
+
+    def get_path(self):
+        return self.path
+
+
+class FakeClient:
+    broken = set()
+    opened = []
+    close_fails = False
+
+    def __init__(self, transport):
+        self.path = transport.get_path()
+        self.closed = False
+        if self.path in self.broken:
+            raise OSError('device disconnected')
+        self.opened.append(self)
+
+    def ping(self, msg):
+        if self.path in self.broken:
+            raise OSError('device disconnected')
+        return msg
+
+    def close(self):
+        if self.close_fails:
+            raise OSError('device disconnected')
+        self.closed = True
+
+
+def make_pool(*paths, **kwargs):
+    FakeClient.broken = set()
+    FakeClient.opened = []
+    FakeClient.close_fails = False
+    return DevicePool([FakeTransport(p) for p in paths], client_factory=FakeClient, **kwargs)
+
+
+def test_round_robin():
+    pool = make_pool('fake:1', 'fake:2')
+    used = []
+    for _ in range(4):
+        with pool.lease() as client:
+            used.append(client.path)
+    assert used == ['fake:1', 'fake:2', 'fake:1', 'fake:2']
+
+    stats = pool.stats()
+    assert stats['fake:1']['leases'] == 2
+    assert stats['fake:1']['state'] == 'idle'
+
+
+def test_exclusive_lease():
+    pool = make_pool('fake:1')
+    client = pool.acquire()
+    assert pool.stats()['fake:1']['state'] == 'leased'
+    with pytest.raises(TimeoutError):
+        pool.acquire(timeout=0.01)
+
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(pool.acquire(timeout=5)))
+    waiter.start()
+    pool.release(client)
+    waiter.join()
+    assert result == [client]
+
+
+def test_evict_and_reattach():
+    pool = make_pool('fake:1', 'fake:2', max_failures=2)
+
+    # device errors do not count as failures
+    with pytest.raises(CallException):
+        with pool.lease():
+            raise CallException(1, 'Action cancelled')
+    assert len(pool) == 2
+
+    for _ in range(2):
+        with pytest.raises(OSError):
+            with pool.lease() as client:
+                assert client.path == 'fake:2'
+                raise OSError('timeout')
+        # keep fake:1 busy so that the next lease gets fake:2
+        pool.release(pool.acquire())
+    assert len(pool) == 1
+    assert pool.stats()['fake:2']['state'] == 'evicted'
+
+    FakeClient.broken = {'fake:1'}
+    pool.health_check()
+    assert len(pool) == 0
+
+    FakeClient.broken = set()
+    pool.refresh([FakeTransport('fake:1'), FakeTransport('fake:2'), FakeTransport('fake:3')])
+    assert len(pool) == 3
+    # the clients of the evicted devices were closed when reattaching
+    assert all(client.closed for client in FakeClient.opened[:2])
+    assert not any(client.closed for client in FakeClient.opened[2:])
+
+    stats = pool.stats()
+    assert stats['fake:1']['evictions'] == 1
+    assert stats['fake:2']['failures'] == 2
+    assert stats['fake:3']['state'] == 'idle'
+
+    # errors while closing the old client do not prevent reattaching
+    FakeClient.broken = {'fake:1'}
+    pool.health_check()
+    FakeClient.broken = set()
+    FakeClient.close_fails = True
+    pool.refresh([FakeTransport('fake:1')])
+    assert len(pool) == 3
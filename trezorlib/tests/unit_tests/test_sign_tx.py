@@ -0,0 +1,248 @@
+# This file is part of the Trezor project.
+#
+# Copyright (C) 2012-2018 SatoshiLabs and contributors
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the License along with this library.
+# If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
+
+import binascii
+import threading
+import time
+from io import BytesIO
+
+import pytest
+
+from trezorlib import messages as proto
+from trezorlib import protobuf
+from trezorlib.client import CallException, TrezorClient
+from trezorlib.transport import Encoded
+
+from ..support.fake_transport import FakeTransport
+
+HASH_A = b'\xaa' * 32
+HASH_B = b'\xbb' * 32
+
+
+def prev_tx(amount):
+    return proto.TransactionType(
+        version=1, lock_time=0,
+        inputs=[proto.TxInputType(prev_hash=b'\x00' * 32, prev_index=0, script_sig=b'\x00', sequence=0xffffffff)],
+        bin_outputs=[proto.TxOutputBinType(amount=amount, script_pubkey=b'\x51')],
+    )
+
+
+class FakeTxApi:
+    def __init__(self, block=None):
+        self.txes = {binascii.hexlify(HASH_A).decode(): prev_tx(1000), binascii.hexlify(HASH_B).decode(): prev_tx(2000)}
+        self.calls = []
+        self.threads = set()
+        self.block = block
+        self.timed_out = False
+
+    def get_tx(self, txhash):
+        self.calls.append(txhash)
+        self.threads.add(threading.current_thread())
+        if self.block is not None and not self.block.wait(5):
+            self.timed_out = True
+        return self.txes[txhash]
+
+
+def request(request_type, index=None, tx_hash=None, serialized=None):
+    return proto.TxRequest(request_type=request_type,
+                           details=proto.TxRequestDetailsType(request_index=index, tx_hash=tx_hash),
+                           serialized=serialized)
+
+
+def chunk(data, signature_index=None):
+    return proto.TxRequestSerializedType(serialized_tx=data, signature_index=signature_index,
+                                         signature=b'sig' if signature_index is not None else None)
+
+
+# requests of a device signing INPUTS, two of which spend outputs of HASH_A
+SCRIPT = [
+    request(proto.RequestType.TXINPUT, 0),
+    request(proto.RequestType.TXMETA, tx_hash=HASH_A),
+    request(proto.RequestType.TXINPUT, 0, HASH_A),
+    request(proto.RequestType.TXOUTPUT, 0, HASH_A),
+    request(proto.RequestType.TXINPUT, 1),
+    request(proto.RequestType.TXINPUT, 2),
+    request(proto.RequestType.TXMETA, tx_hash=HASH_B),
+    request(proto.RequestType.TXOUTPUT, 0, HASH_B),
+    request(proto.RequestType.TXOUTPUT, 0),
+    request(proto.RequestType.TXINPUT, 0, serialized=chunk(b'\x01\x00', 0)),
+    request(proto.RequestType.TXINPUT, 1, serialized=chunk(b'\x02\x00', 1)),
+    request(proto.RequestType.TXINPUT, 2, serialized=chunk(b'\x03\x00', 2)),
+    request(proto.RequestType.TXFINISHED, serialized=chunk(b'\x04')),
+]
+
+INPUTS = [
+    proto.TxInputType(address_n=[0], prev_hash=HASH_A, prev_index=0),
+    proto.TxInputType(address_n=[1], prev_hash=HASH_A, prev_index=0),
+    proto.TxInputType(address_n=[2], prev_hash=HASH_B, prev_index=0),
+]
+OUTPUTS = [proto.TxOutputType(address='address', amount=2500, script_type=proto.OutputScriptType.PAYTOADDRESS)]
+
+
+def scripted(script, on_message=None):
+    responses = iter(script)
+
+    def handler(msg):
+        if isinstance(msg, proto.Initialize):
+            return None
+        if on_message is not None:
+            resp = on_message(msg)
+            if resp is not None:
+                return resp
+        return next(responses)
+    return handler
+
+
+def acks(transport):
+    return [msg.tx for msg in transport.written if isinstance(msg, proto.TxAck)]
+
+
+def test_sign_tx_prefetch():
+    transport = FakeTransport(scripted(SCRIPT))
+    client = TrezorClient(transport)
+    api = FakeTxApi()
+    client.set_tx_api(api)
+
+    signatures, serialized = client.sign_tx('Bitcoin', INPUTS, OUTPUTS)
+    assert signatures == [b'sig'] * 3
+    assert serialized == b'\x01\x00\x02\x00\x03\x00\x04'
+
+    # one fetch per distinct previous transaction, in worker threads
+    assert sorted(api.calls) == sorted(binascii.hexlify(h).decode() for h in (HASH_A, HASH_B))
+    assert threading.current_thread() not in api.threads
+
+    sent = acks(transport)
+    assert sent[0].inputs[0].address_n == [0]
+    assert sent[1].inputs_cnt == 1 and sent[1].outputs_cnt == 1
+    assert sent[3].bin_outputs[0].amount == 1000
+    assert sent[7].bin_outputs[0].amount == 2000
+    assert sent[8].outputs[0].address == 'address'
+
+
+def test_sign_tx_fetch_in_background():
+    # fetches only finish once SignTx has been sent
+    sign_tx_sent = threading.Event()
+    api = FakeTxApi(block=sign_tx_sent)
+
+    def on_message(msg):
+        if isinstance(msg, proto.SignTx):
+            sign_tx_sent.set()
+
+    transport = FakeTransport(scripted(SCRIPT, on_message))
+    client = TrezorClient(transport)
+    client.set_tx_api(api)
+
+    signatures, serialized = client.sign_tx('Bitcoin', INPUTS, OUTPUTS, fetch_in_background=True)
+    assert not api.timed_out
+    assert serialized == b'\x01\x00\x02\x00\x03\x00\x04'
+    assert acks(transport)[3].bin_outputs[0].amount == 1000
+
+
+def test_sign_tx_failure_cancels_fetches(monkeypatch):
+    release = threading.Event()
+    api = FakeTxApi(block=release)
+
+    def on_message(msg):
+        if isinstance(msg, proto.SignTx):
+            return proto.Failure(code=proto.FailureType.ActionCancelled, message='Cancelled')
+
+    transport = FakeTransport(scripted(SCRIPT, on_message))
+    client = TrezorClient(transport)
+    client.set_tx_api(api)
+    # one worker, so that the second fetch is still queued
+    monkeypatch.setattr(client, 'TX_API_WORKERS', 1)
+
+    with pytest.raises(CallException):
+        client.sign_tx('Bitcoin', INPUTS, OUTPUTS, fetch_in_background=True)
+    release.set()
+    time.sleep(0.05)
+    assert api.calls == [binascii.hexlify(HASH_A).decode()]
+
+
+def test_sign_tx_on_serialized():
+    transport = FakeTransport(scripted(SCRIPT))
+    client = TrezorClient(transport)
+    client.set_tx_api(FakeTxApi())
+
+    chunks = []
+    signatures, serialized = client.sign_tx('Bitcoin', INPUTS, OUTPUTS, on_serialized=chunks.append)
+    assert signatures == [b'sig'] * 3
+    assert serialized is None
+    assert chunks == [b'\x01\x00', b'\x02\x00', b'\x03\x00', b'\x04']
+
+    # without a callback, the chunks are joined into bytes
+    client.transport.handler = scripted(SCRIPT)
+    _, serialized = client.sign_tx('Bitcoin', INPUTS, OUTPUTS)
+    assert type(serialized) is bytes
+    assert serialized == b''.join(chunks)
+
+
+class EncodingTransport(FakeTransport):
+    # serializes messages in `encode`, and checks them in `write_encoded`
+    def __init__(self, handler):
+        super().__init__(handler)
+        self.encoded = []
+        self.written_encoded = 0
+
+    def encode(self, msg):
+        data = BytesIO()
+        protobuf.dump_message(data, msg)
+        self.encoded.append(msg)
+        return Encoded(msg, data.getvalue())
+
+    def write_encoded(self, encoded):
+        data = BytesIO()
+        protobuf.dump_message(data, encoded.msg)
+        assert encoded.data == data.getvalue()
+        self.written_encoded += 1
+        self.write(encoded.msg)
+
+
+def serialize(msgs):
+    data = BytesIO()
+    for msg in msgs:
+        protobuf.dump_message(data, msg)
+    return data.getvalue()
+
+
+def test_sign_tx_precompute_acks():
+    expected = FakeTransport(scripted(SCRIPT))
+    client = TrezorClient(expected)
+    client.set_tx_api(FakeTxApi())
+    expected_result = client.sign_tx('Bitcoin', INPUTS, OUTPUTS)
+
+    # every answer is encoded before the device sends its first request:
+    # META, 3 INPUTs and 1 OUTPUT of the new transaction, META, INPUT and OUTPUT of each previous one
+    def on_message(msg):
+        if isinstance(msg, proto.SignTx):
+            deadline = time.time() + 5
+            while len(transport.encoded) < 11 and time.time() < deadline:
+                time.sleep(0.001)
+
+    transport = EncodingTransport(scripted(SCRIPT, on_message))
+    client = TrezorClient(transport)
+    client.set_tx_api(FakeTxApi())
+    assert client.sign_tx('Bitcoin', INPUTS, OUTPUTS, precompute_acks=True) == expected_result
+
+    assert len(transport.encoded) == 11
+    assert transport.written_encoded == len(acks(transport)) == 12
+    assert serialize(acks(transport)) == serialize(acks(expected))
+
+    # nothing is encoded in advance for debug_processor runs
+    transport.encoded = []
+    transport.handler = scripted(SCRIPT)
+    client.sign_tx('Bitcoin', INPUTS, OUTPUTS, precompute_acks=True, debug_processor=lambda req, msg: msg)
+    assert transport.encoded == []
@@ -15,8 +15,11 @@
 # If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
 
 import base64
+import pytest
+
 from trezorlib import stellar
 from trezorlib import messages
+from trezorlib.client import CallException, ProtocolMixin
 
 
 def test_stellar_parse_transaction_bytes_simple():
@@ -330,3 +333,102 @@ def test_stellar_parse_operation_bytes_bump_sequence_simple():
     assert op.source_account is None
 
     assert op.bump_to == 1234567890
+
+
+def test_stellar_parse_transaction_bytes_iter():
+    b64 = b'AAAAABXWSL/k028ZbPtXNf/YylTNS4Iz90PyJEnefPMBzbRpAAAAZAAAAAEAAAAAAAAAAAAAAAAAAAABAAAAAAAAAAEAAAAAXVVkJGaxhbhDFS6eIZFR28WJICfsQBAaUXvtXKAwwuAAAAABVEVTVAAAAAAphJYCwg5YNl8SPBLYehykVQ0QzSGwrg4Y1E4+Vv1qFQAAAAAdzxaYAAAAAA=='
+    data = base64.b64decode(b64)
+    # envelope with 100 copies of the payment operation
+    data = data[:56] + b'\x00\x00\x00\x64' + data[60:-4] * 100 + data[-4:]
+
+    tx, operations = stellar.parse_transaction_bytes_iter(data)
+    assert tx.num_operations == 100
+    count = 0
+    for op in operations:
+        assert isinstance(op, messages.StellarPaymentOp)
+        assert op.destination_account == 'GBOVKZBEM2YYLOCDCUXJ4IMRKHN4LCJAE7WEAEA2KF562XFAGDBOB64V'
+        assert op.asset.code == b'TEST'
+        assert op.amount == 500111000
+        count += 1
+    assert count == 100
+
+    with pytest.raises(ValueError):
+        stellar.parse_transaction_bytes(data[:-40])
+
+
+class FakeTransport:
+    def session_begin(self):
+        pass
+
+    def session_end(self):
+        pass
+
+
+class FakeStellarClient:
+    stellar_sign_transaction = ProtocolMixin.stellar_sign_transaction
+
+    def __init__(self, num_operations):
+        self.transport = FakeTransport()
+        self.num_operations = num_operations
+        self.received = []
+
+    def call(self, msg):
+        self.received.append(msg)
+        if len(self.received) <= self.num_operations:
+            return messages.StellarTxOpRequest()
+        return messages.StellarSignedTx(public_key=b'\x00' * 32, signature=b'\x01' * 64)
+
+
+def test_stellar_sign_transaction_streaming():
+    b64 = b'AAAAABXWSL/k028ZbPtXNf/YylTNS4Iz90PyJEnefPMBzbRpAAAAZAAAAAEAAAAAAAAAAAAAAAAAAAABAAAAAAAAAAsAAAAASZYC0gAAAAA='
+    data = base64.b64decode(b64)
+    data = data[:56] + b'\x00\x00\x00\x05' + data[60:-4] * 5 + data[-4:]
+
+    client = FakeStellarClient(5)
+    tx, operations = stellar.parse_transaction_bytes_iter(data)
+    resp = client.stellar_sign_transaction(tx, operations, [0])
+    assert resp.signature == b'\x01' * 64
+    assert client.received[0] is tx
+    assert tx.num_operations == 5
+    assert [op.bump_to for op in client.received[1:]] == [1234567890] * 5
+
+    tx, operations = stellar.parse_transaction_bytes(data)
+    FakeStellarClient(5).stellar_sign_transaction(tx, operations, [0])
+    assert len(operations) == 5
+
+    with pytest.raises(CallException):
+        FakeStellarClient(6).stellar_sign_transaction(tx, operations, [0])
+    with pytest.raises(CallException):
+        FakeStellarClient(4).stellar_sign_transaction(tx, operations, [0])
+    with pytest.raises(ValueError):
+        FakeStellarClient(5).stellar_sign_transaction(messages.StellarSignTx(), iter(operations), [0])
+
+
+def test_stellar_crc16_checksum():
+    # CRC-16/XModem check value
+    assert stellar._crc16_checksum(b'123456789') == 0x31C3
+    assert stellar._crc16_checksum(b'') == 0
+
+
+def test_stellar_address_conversion():
+    addresses = [
+        'GBOVKZBEM2YYLOCDCUXJ4IMRKHN4LCJAE7WEAEA2KF562XFAGDBOB64V',
+        'GAK5MSF74TJW6GLM7NLTL76YZJKM2S4CGP3UH4REJHPHZ4YBZW2GSBPW',
+    ]
+    public_keys = stellar.public_keys_from_addresses(addresses)
+    assert public_keys == [stellar.address_to_public_key(address) for address in addresses]
+    assert public_keys[0] == base64.b64decode(b'XVVkJGaxhbhDFS6eIZFR28WJICfsQBAaUXvtXKAwwuA=')
+    assert stellar.addresses_from_public_keys(public_keys) == addresses
+    assert [stellar.address_from_public_key(pk) for pk in public_keys] == addresses
+    assert stellar.addresses_from_public_keys([]) == []
+
+    # last character changes the checksum
+    invalid = addresses[0][:-1] + 'U'
+    with pytest.raises(ValueError):
+        stellar.address_to_public_key(invalid)
+    with pytest.raises(ValueError):
+        stellar.public_keys_from_addresses([addresses[1], invalid])
+    with pytest.raises(ValueError):
+        stellar.public_keys_from_addresses([addresses[1][:-1]])
+    with pytest.raises(ValueError):
+        stellar.addresses_from_public_keys([public_keys[0][:31]])
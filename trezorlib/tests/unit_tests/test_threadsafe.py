@@ -0,0 +1,134 @@
+# This file is part of the Trezor project.
+#
+# Copyright (C) 2012-2018 SatoshiLabs and contributors
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the License along with this library.
+# If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
+
+import threading
+import time
+import pytest
+
+from trezorlib import messages as proto
+from trezorlib.client import TrezorClient
+from trezorlib.threadsafe import ThreadSafeClient
+from trezorlib.tools import H_
+
+from ..support import fake_transport
+
+
+class FakeTransport:
+    def __init__(self):
+        self.sessions = 0
+
+    def session_begin(self):
+        self.sessions += 1
+
+    def session_end(self):
+        self.sessions -= 1
+
+
+class FakeClient:
+    features = 'features'
+
+    def __init__(self):
+        self.transport = FakeTransport()
+        self.busy = False
+        self.threads = set()
+        self.calls = []
+        self.closed = False
+
+    def get_public_node(self, n):
+        assert not self.busy, 'concurrent call'
+        self.busy = True
+        self.threads.add(threading.current_thread())
+        time.sleep(0.001)
+        self.calls.append(n)
+        self.busy = False
+        if n < 0:
+            raise ValueError('invalid path')
+        return 'node%d' % n
+
+    def close(self):
+        self.closed = True
+
+
+def test_serialized_calls():
+    client = FakeClient()
+    with ThreadSafeClient(client) as safe:
+        assert safe.features == 'features'
+
+        results = {}
+
+        def worker(start):
+            futures = [safe.get_public_node(n) for n in range(start, start + 10)]
+            results[start] = [f.result() for f in futures]
+
+        threads = [threading.Thread(target=worker, args=(i * 10,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        for start, nodes in results.items():
+            assert nodes == ['node%d' % n for n in range(start, start + 10)]
+        assert sorted(client.calls) == list(range(40))
+        assert len(client.threads) == 1
+        assert client.transport.sessions == 1
+
+        futures = safe.map('get_public_node', [1, -1])
+        assert futures[0].result() == 'node1'
+        with pytest.raises(ValueError):
+            futures[1].result()
+
+    assert client.transport.sessions == 0
+    assert client.closed
+
+
+class DeviceHandler:
+    # answers address and public key requests, recording the serving threads
+    def __init__(self):
+        self.threads = set()
+
+    def __call__(self, msg):
+        if isinstance(msg, proto.GetAddress):
+            self.threads.add(threading.current_thread())
+            return proto.Address(address='%s/%d' % (msg.coin_name, msg.address_n[-1]))
+        if isinstance(msg, proto.GetPublicKey):
+            self.threads.add(threading.current_thread())
+            return proto.PublicKey(xpub='xpub/%d' % msg.address_n[-1])
+
+
+def test_batch_getters():
+    handler = DeviceHandler()
+    transport = fake_transport.FakeTransport(handler)
+    client = TrezorClient(transport)
+
+    addresses = list(client.get_addresses('Bitcoin', 'Bitcoin/0h/0/0-2'))
+    assert addresses == [([H_(44), H_(0), H_(0), 0, i], 'Bitcoin/%d' % i) for i in range(3)]
+
+    nodes = list(client.get_public_nodes(["m/44'/0'/0'", [H_(44), H_(0), H_(1)]]))
+    assert [n for n, _ in nodes] == [[H_(44), H_(0), H_(0)], [H_(44), H_(0), H_(1)]]
+    assert [node.xpub for _, node in nodes] == ['xpub/%d' % H_(0), 'xpub/%d' % H_(1)]
+    assert transport.session_counter == 0
+
+
+def test_threadsafe_batch_getters():
+    handler = DeviceHandler()
+    transport = fake_transport.FakeTransport(handler)
+    with ThreadSafeClient(TrezorClient(transport)) as safe:
+        addresses = safe.get_addresses('Testnet', 'm/0/0-9')
+        nodes = safe.get_public_nodes('m/0/0-1')
+        assert [a for _, a in addresses.result()] == ['Testnet/%d' % i for i in range(10)]
+        assert [node.xpub for _, node in nodes.result()] == ['xpub/0', 'xpub/1']
+    assert handler.threads and threading.current_thread() not in handler.threads
+    assert len(handler.threads) == 1
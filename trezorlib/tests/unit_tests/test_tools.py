@@ -0,0 +1,88 @@
+# This file is part of the Trezor project.
+#
+# Copyright (C) 2012-2018 SatoshiLabs and contributors
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the License along with this library.
+# If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
+
+import pytest
+
+from trezorlib.tools import (
+    H_, b58check_decode, b58check_encode, b58decode, b58decode_batch, b58encode, b58encode_batch,
+    PathTemplate, parse_path, parse_path_template,
+)
+
+
+def test_parse_path_template():
+    assert list(parse_path_template('m/44h/0h/0h/0/5')) == [parse_path('m/44h/0h/0h/0/5')]
+    assert list(parse_path_template('Bitcoin/0h/0-1/0-1')) == [
+        [H_(44), H_(0), H_(0), 0, 0],
+        [H_(44), H_(0), H_(0), 0, 1],
+        [H_(44), H_(0), H_(0), 1, 0],
+        [H_(44), H_(0), H_(0), 1, 1],
+    ]
+    assert list(parse_path_template("m/44'/0-2'")) == [[H_(44), H_(i)] for i in range(3)]
+    assert list(parse_path_template('m/-1/0-1')) == [[H_(1), 0], [H_(1), 1]]
+    assert list(parse_path_template('')) == [[]]
+
+    paths = parse_path_template('m/0/0-9999')
+    assert next(paths) == [0, 0]
+    assert len(list(paths)) == 9999
+
+    with pytest.raises(ValueError):
+        parse_path_template('m/5-1')
+    with pytest.raises(ValueError):
+        parse_path_template('m/0/x-1')
+
+
+def test_path_template():
+    template = PathTemplate('m/44h/0h/{0-9}h/0/*')
+    assert template.prefix == [H_(44), H_(0)]
+    assert len(template) == 10 * 2 ** 31
+
+    paths = iter(template)
+    assert next(paths) == [H_(44), H_(0), H_(0), 0, 0]
+    assert next(paths) == [H_(44), H_(0), H_(0), 0, 1]
+    assert [H_(44), H_(0), H_(9), 0, 12345] in template
+    assert [H_(44), H_(0), 10, 0, 12345] not in template
+    assert [H_(44), H_(0), H_(1), 0] not in template
+
+    assert list(PathTemplate('Bitcoin/{0-1}h')) == [[H_(44), H_(0), H_(0)], [H_(44), H_(0), H_(1)]]
+    assert list(PathTemplate('m/1/2')) == [[1, 2]]
+    assert len(PathTemplate('m/*h/1')) == 2 ** 31
+
+    with pytest.raises(ValueError):
+        PathTemplate('m/{1-2/3')
+    with pytest.raises(ValueError):
+        PathTemplate('m/**')
+
+
+def test_b58():
+    xpub = 'xpub661MyMwAqRbcEnKbXcCqD2GT1di5zQxVqoHPAgHNe8dv5JP8gWmDproS6kFHJnLZd23tWevhdn4urGJ6b264DfTGKr8zjmYDjyDTi9U7iyT'
+    data = b58check_decode(xpub)
+    assert len(data) == 78
+    assert b58check_encode(data) == xpub
+    assert b58decode(xpub, None)[:-4] == data
+    assert b58decode(xpub, 10) is None
+
+    assert b58encode(b'\x00\x00\x01') == '112'
+    assert b58decode('112', None) == b'\x00\x00\x01'
+    assert b58encode(b'') == ''
+    assert b58encode(b'hello world') == 'StV1DL6CwTryKyV'
+
+    assert b58encode_batch([b'\x00\x00\x01', b'hello world']) == ['112', 'StV1DL6CwTryKyV']
+    assert b58decode_batch([xpub], check=True) == [data]
+
+    with pytest.raises(ValueError):
+        b58check_decode(xpub[:-1] + '1')
+    with pytest.raises(ValueError):
+        b58decode('0OIl', None)
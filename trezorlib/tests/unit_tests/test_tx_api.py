@@ -14,9 +14,21 @@
 # You should have received a copy of the License along with this library.
 # If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
 
+import binascii
+import glob
+import hashlib
+import http.server
+import json
 import os
+import struct
+import threading
+from decimal import Decimal
+from io import BytesIO
+
+import pytest
 
 from trezorlib import coins
+from trezorlib import protobuf
 from trezorlib import tx_api
 
 TxApiBitcoin = coins.tx_api['Bitcoin']
@@ -46,3 +58,225 @@ def test_tx_api_gettx():
 
     TxApiZencash.get_tx('f7294424486d18d1d59f774fcc1acfd21d19ae53a313dfd2901682ae6035670c')
     TxApiZencash.get_tx('e04e6deaaac430d56384c6bade9381cb03290e5aa181058f5264e436179356f3')
+
+
+def test_tx_api_cache(tmpdir):
+    tx_api.cache_dir = os.path.join(tests_dir, '../txcache')
+    txhash = 'd6da21677d7cca5f42fbc7631d062c9ae918a0254f7c6c22de8e8cb7fd5b8236'
+    sqlite = tx_api.SqliteTxCache(str(tmpdir.join('txs.sqlite')))
+    api = tx_api.TxApiInsight("insight_testnet", cache=tx_api.LRUTxCache(sqlite, maxsize=2))
+
+    tx = api.get_tx(txhash)
+    assert api.get_tx(txhash) is tx
+
+    # a fresh LRU layer loads the transaction from the sqlite file
+    api.cache = tx_api.LRUTxCache(sqlite)
+    tx_api.cache_dir = None
+    stored = api.get_tx(txhash)
+    assert stored is not tx
+    assert stored.version == tx.version
+    assert stored.lock_time == tx.lock_time
+    assert [i.prev_hash for i in stored.inputs] == [i.prev_hash for i in tx.inputs]
+    assert [o.script_pubkey for o in stored.bin_outputs] == [o.script_pubkey for o in tx.bin_outputs]
+    assert [o.amount for o in stored.bin_outputs] == [o.amount for o in tx.bin_outputs]
+    sqlite.close()
+
+
+def test_lru_tx_cache_eviction():
+    cache = tx_api.LRUTxCache(maxsize=2)
+    cache.put('net', 'a', 1)
+    cache.put('net', 'b', 2)
+    assert cache.get('net', 'a') == 1
+    cache.put('net', 'c', 3)
+    assert len(cache) == 2
+    assert cache.get('net', 'b') is None
+    assert cache.get('net', 'a') == 1
+    assert cache.get('other', 'a') is None
+
+
+class TxCacheHandler(http.server.BaseHTTPRequestHandler):
+    # serves /api/tx/<txhash> from the txcache directory of insight_testnet
+    failures = 0
+
+    def do_GET(self):
+        if TxCacheHandler.failures:
+            TxCacheHandler.failures -= 1
+            self.send_error(503)
+            return
+        txhash = self.path.rsplit('/', 1)[-1]
+        filename = os.path.join(tests_dir, '../txcache', 'insight_testnet_tx_%s.json' % txhash)
+        if not os.path.exists(filename):
+            self.send_error(404)
+            return
+        with open(filename, 'rb') as f:
+            data = f.read()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def insight_server():
+    server = http.server.HTTPServer(('127.0.0.1', 0), TxCacheHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%d/api' % server.server_port
+    server.shutdown()
+    server.server_close()
+
+
+def test_tx_api_get_txs(insight_server):
+    txhashes = [
+        'e5040e1bc1ae7667ffb9e5248e90b2fb93cd9150234151ce90e14ab2f5933bcd',
+        'd6da21677d7cca5f42fbc7631d062c9ae918a0254f7c6c22de8e8cb7fd5b8236',
+    ]
+    tx_api.cache_dir = os.path.join(tests_dir, '../txcache')
+    expected = [TxApiTestnet.get_tx(txhash) for txhash in txhashes]
+
+    tx_api.cache_dir = None
+    api = tx_api.TxApiInsight("insight_testnet", url=insight_server)
+    TxCacheHandler.failures = 1  # retried
+    txs = api.get_txs(txhashes + txhashes[:1], max_workers=2)
+    assert list(txs) == txhashes
+    for tx, orig in zip(txs.values(), expected):
+        assert tx.version == orig.version
+        assert tx.lock_time == orig.lock_time
+        assert [o.script_pubkey for o in tx.bin_outputs] == [o.script_pubkey for o in orig.bin_outputs]
+
+    with pytest.raises(RuntimeError):
+        api.get_txs(txhashes + ['00' * 32])
+    api.close()
+
+
+def varint(n):
+    if n < 0xfd:
+        return struct.pack('<B', n)
+    return struct.pack('<BH', 0xfd, n)
+
+
+def serialize_tx(t, version_group_id=None, witness=None):
+    s = struct.pack('<I', t.version | (0x80000000 if t.overwintered else 0))
+    if t.overwintered:
+        s += struct.pack('<I', version_group_id)
+    if witness:
+        s += b'\x00\x01'
+    s += varint(len(t.inputs))
+    for i in t.inputs:
+        s += i.prev_hash[::-1] + struct.pack('<I', i.prev_index)
+        s += varint(len(i.script_sig)) + i.script_sig + struct.pack('<I', i.sequence)
+    s += varint(len(t.bin_outputs))
+    for o in t.bin_outputs:
+        s += struct.pack('<Q', o.amount) + varint(len(o.script_pubkey)) + o.script_pubkey
+    if witness:
+        for items in witness:
+            s += varint(len(items)) + b''.join(varint(len(item)) + item for item in items)
+    s += struct.pack('<I', t.lock_time)
+    if t.overwintered:
+        s += struct.pack('<I', t.expiry)
+    if t.extra_data:
+        s += t.extra_data
+    return s
+
+
+def dump(msg):
+    data = BytesIO()
+    protobuf.dump_message(data, msg)
+    return data.getvalue()
+
+
+TXCACHE_FILES = sorted(
+    os.path.basename(f)[:-5] for f in glob.glob(os.path.join(tests_dir, '../txcache', 'insight_*_tx_*.json'))
+    if 'decred' not in f
+)
+
+
+@pytest.mark.parametrize('name', TXCACHE_FILES)
+def test_parse_tx(name):
+    tx_api.cache_dir = os.path.join(tests_dir, '../txcache')
+    network, txhash = name.rsplit('_tx_', 1)
+    zcash = 'zcash' in network
+    tx = tx_api.TxApiInsight(network, zcash=zcash).get_tx(txhash)
+    with open(os.path.join(tests_dir, '../txcache', name + '.json')) as f:
+        version_group_id = json.load(f).get('nVersionGroupId')
+
+    raw = serialize_tx(tx, version_group_id)
+    # the txid proves that the reconstructed transaction is the original one
+    assert hashlib.sha256(hashlib.sha256(raw).digest()).digest()[::-1] == binascii.unhexlify(txhash)
+    assert dump(tx_api.parse_tx(raw, zcash=zcash)) == dump(tx)
+
+
+def test_parse_tx_segwit():
+    tx_api.cache_dir = os.path.join(tests_dir, '../txcache')
+    tx = TxApiTestnet.get_tx('d6da21677d7cca5f42fbc7631d062c9ae918a0254f7c6c22de8e8cb7fd5b8236')
+    witness = [[b'\x30' * 71, b'\x02' * 33]] + [[]] * (len(tx.inputs) - 1)
+    assert dump(tx_api.parse_tx(serialize_tx(tx, witness=witness))) == dump(tx)
+
+
+def test_parse_tx_decred():
+    with open(os.path.join(tests_dir, '../txcache',
+                           'insight_decred_testnet_tx_16da185052740d85a630e79c140558215b64e26c500212b90e16b55d13ca06a8.json')) as f:
+        data = json.load(f)
+    raw = struct.pack('<I', data['version']) + varint(len(data['vin']))
+    for vin in data['vin']:
+        raw += binascii.unhexlify(vin['txid'])[::-1] + struct.pack('<IBI', vin['vout'], vin['tree'], vin['sequence'])
+    raw += varint(len(data['vout']))
+    for vout in data['vout']:
+        script = binascii.unhexlify(vout['scriptPubKey']['hex'])
+        raw += struct.pack('<QH', int(Decimal(vout['value']) * 100000000), vout['version']) + varint(len(script)) + script
+    raw += struct.pack('<II', data['locktime'], data['expiry']) + varint(len(data['vin']))
+    for vin in data['vin']:
+        script = binascii.unhexlify(vin['scriptSig']['hex'])
+        raw += struct.pack('<QII', vin['valueSat'], vin['blockheight'], vin['blockindex']) + varint(len(script)) + script
+
+    tx = tx_api.parse_tx(raw, decred=True)
+    assert tx.version == data['version']
+    assert tx.lock_time == data['locktime']
+    assert tx.expiry == data['expiry']
+    assert [i.prev_hash for i in tx.inputs] == [binascii.unhexlify(vin['txid']) for vin in data['vin']]
+    assert [i.decred_tree for i in tx.inputs] == [vin['tree'] for vin in data['vin']]
+    assert [i.script_sig for i in tx.inputs] == [binascii.unhexlify(vin['scriptSig']['hex']) for vin in data['vin']]
+    assert [o.script_pubkey for o in tx.bin_outputs] == [binascii.unhexlify(vout['scriptPubKey']['hex']) for vout in data['vout']]
+    assert [o.decred_script_version for o in tx.bin_outputs] == [vout['version'] for vout in data['vout']]
+
+    with pytest.raises(ValueError):
+        tx_api.parse_tx(raw[:-1], decred=True)
+
+
+def test_tx_api_raw(tmpdir):
+    txhash = 'aaf51e4606c264e47e5c42c958fe4cf1539c5172684721e38e69f4ef634d75dc'
+    tx_api.cache_dir = os.path.join(tests_dir, '../txcache')
+    tx = tx_api.TxApiInsight("insight_zcash_testnet", zcash=True).get_tx(txhash)
+    with open(os.path.join(tests_dir, '../txcache', 'insight_zcash_testnet_tx_%s.json' % txhash)) as f:
+        raw = serialize_tx(tx, json.load(f)['nVersionGroupId'])
+
+    tx_api.cache_dir = str(tmpdir)
+    tmpdir.join('insight_zcash_testnet_rawtx_%s.json' % txhash).write(json.dumps({'rawtx': binascii.hexlify(raw).decode()}))
+    api = tx_api.TxApiRaw("insight_zcash_testnet", zcash=True)
+    assert dump(api.get_tx(txhash)) == dump(tx)
+
+    with pytest.raises(ValueError):
+        tx_api.parse_tx(raw[:20], zcash=True)
+
+
+def test_tx_api_get_block():
+    requests = []
+
+    def get_json(url):
+        requests.append(url)
+        if url.endswith('/blocks/'):
+            return {'blocks': [{'height': 1000}]}
+        return {'blockHash': '00' * 31 + 'ff'}
+
+    api = tx_api.TxApiInsight("insight_testnet", url='http://localhost/api')
+    api._get_json = get_json
+    assert api.get_block(300) == (b'\xff' + b'\x00' * 31, 700)
+    assert api.get_block(300) == (b'\xff' + b'\x00' * 31, 700)
+    assert requests == ['http://localhost/api/blocks/', 'http://localhost/api/block-index/700']
+
+    api.block_cache_ttl = 0
+    api.get_block(300)
+    assert len(requests) == 4
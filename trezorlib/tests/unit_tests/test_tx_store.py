@@ -0,0 +1,73 @@
+# This file is part of the Trezor project.
+#
+# Copyright (C) 2012-2018 SatoshiLabs and contributors
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the License along with this library.
+# If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
+
+import os
+from io import BytesIO
+import pytest
+
+from trezorlib import protobuf
+from trezorlib import tx_api
+from trezorlib import tx_store
+
+TxApiTestnet = tx_api.TxApiInsight("insight_testnet")
+TxApiZcashTestnet = tx_api.TxApiInsight("insight_zcash_testnet", zcash=True)
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def serialize(msgs):
+    data = BytesIO()
+    for msg in msgs:
+        protobuf.dump_message(data, msg)
+    return data.getvalue()
+
+
+TXHASHES = (
+    (TxApiTestnet, 'd6da21677d7cca5f42fbc7631d062c9ae918a0254f7c6c22de8e8cb7fd5b8236'),
+    (TxApiTestnet, 'e5040e1bc1ae7667ffb9e5248e90b2fb93cd9150234151ce90e14ab2f5933bcd'),
+    (TxApiZcashTestnet, 'aaf51e4606c264e47e5c42c958fe4cf1539c5172684721e38e69f4ef634d75dc'),
+)
+
+
+@pytest.mark.parametrize('api, txhash', TXHASHES)
+def test_tx_store_roundtrip(tmpdir, api, txhash):
+    tx_api.cache_dir = os.path.join(tests_dir, '../txcache')
+    store = tx_store.TxStore(str(tmpdir), api)
+
+    assert txhash not in store
+    stored = store.get_tx(txhash)
+    assert txhash in store
+    assert tmpdir.listdir() == [tmpdir.join('%s.tx' % txhash)]
+
+    orig = api.get_tx(txhash)
+    assert stored.version == orig.version
+    assert stored.lock_time == orig.lock_time
+    assert stored.extra_data == orig.extra_data
+    assert stored.overwintered == orig.overwintered
+    assert len(stored.inputs) == len(orig.inputs)
+    assert len(stored.bin_outputs) == len(orig.bin_outputs)
+    assert serialize(stored.inputs) == serialize(orig.inputs)
+    assert serialize(stored.bin_outputs) == serialize(orig.bin_outputs)
+    assert serialize(stored.bin_outputs[-1:]) == serialize(orig.bin_outputs[-1:])
+
+    with pytest.raises(IndexError):
+        stored.inputs[len(orig.inputs)]
+
+
+def test_tx_store_missing(tmpdir):
+    store = tx_store.TxStore(str(tmpdir))
+    with pytest.raises(RuntimeError):
+        store.get_tx('00' * 32)
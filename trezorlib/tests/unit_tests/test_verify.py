@@ -0,0 +1,84 @@
+# This file is part of the Trezor project.
+#
+# Copyright (C) 2012-2018 SatoshiLabs and contributors
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the License along with this library.
+# If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
+
+from binascii import hexlify, unhexlify
+
+import pytest
+
+from trezorlib import verify
+
+MESSAGE = 'This is an example of a signed message.'
+LONG_MESSAGE = 'VeryLongMessage!' * 64
+
+# vectors from the device tests
+BITCOIN_VECTORS = [
+    ('Bitcoin', '14LmW5k4ssUrtbAB4255zdqv3b4w1TuX9e', '205ff795c29aef7538f8b3bdb2e8add0d0722ad630a140b6aefd504a5a895cbd867cbb00981afc50edd0398211e8d7c304bb8efa461181bc0afa67ea4a720a89ed', LONG_MESSAGE),
+    ('Testnet', 'mirio8q3gtv7fhdnmb3TpZ4EuafdzSs7zL', '209e23edf0e4e47ff1dec27f32cd78c50e74ef018ee8a6adf35ae17c7a9b0dd96f48b493fd7dbab03efb6f439c6383c9523b3bbc5f1a7d158a6af90ab154e9be80', MESSAGE),
+    ('Bitcoin', '1JwSSubhmg6iPtRjtyqhUYYH7bZg3Lfy1T', '1ba77e01a9e17ba158b962cfef5f13dfed676ffc2b4bada24e58f784458b52b97421470d001d53d5880cf5e10e76f02be3e80bf21e18398cbd41e8c3b4af74c8c2', MESSAGE),
+    ('Bitcoin', '3CwYaeWxhpXXiHue3ciQez1DLaTEAXcKa1', '245ff795c29aef7538f8b3bdb2e8add0d0722ad630a140b6aefd504a5a895cbd867cbb00981afc50edd0398211e8d7c304bb8efa461181bc0afa67ea4a720a89ed', LONG_MESSAGE),
+    ('Bitcoin', 'bc1qyjjkmdpu7metqt5r36jf872a34syws33s82q2j', '285ff795c29aef7538f8b3bdb2e8add0d0722ad630a140b6aefd504a5a895cbd867cbb00981afc50edd0398211e8d7c304bb8efa461181bc0afa67ea4a720a89ed', LONG_MESSAGE),
+    ('Bitcoin', '1KzXE97kV7DrpxCViCN3HbGbiKhzzPM7TQ', '1cc694f0f23901dfe3603789142f36a3fc582d0d5c0ec7215cf2ccd641e4e37228504f3d4dc3eea28bbdbf5da27c49d4635c097004d9f228750ccd836a8e1460c0', u'žluťoučk\xfd kůň \xfapěl ď\xe1belsk\xe9 \xf3dy'),
+]
+
+
+def test_keccak_256():
+    assert hexlify(verify.keccak_256(b'')) == b'c5d2460186f7233c927e7db2dcc703c0e500b653ca82273b7bfad8045d85a470'
+
+
+def test_verify_message():
+    for coin_name, address, signature, message in BITCOIN_VECTORS:
+        assert verify.verify_message(coin_name, address, unhexlify(signature), message)
+
+    coin_name, address, signature, message = BITCOIN_VECTORS[0]
+    assert not verify.verify_message(coin_name, address, unhexlify(signature), message + '!')
+    assert not verify.verify_message(coin_name, address, unhexlify(signature[:-2] + '00'), message)
+    # same key, but the header selects a different address type
+    assert not verify.verify_message(coin_name, address, unhexlify('24' + signature[2:]), message)
+
+    # message is normalized to NFC
+    nfkd = u'Příšerně žluťoučký kůň úpěl ďábelské ódy zákeřný učeň běží podél zóny úlů'
+    signature = unhexlify('20d0ec02ed8da8df23e7fe9e680e7867cc290312fe1c970749d8306ddad1a1eda41c6a771b13d495dd225b13b0a9d0f915a984ee3d0703f92287bf8009fbb9f7d6')
+    assert verify.verify_message('Bitcoin', '14LmW5k4ssUrtbAB4255zdqv3b4w1TuX9e', signature, nfkd)
+
+
+@pytest.mark.parametrize('coin_name', ['Bcash', 'Decred', 'Groestlcoin'])
+def test_verify_message_unsupported_coin(coin_name):
+    _, _, signature, message = BITCOIN_VECTORS[0]
+    with pytest.raises(ValueError):
+        verify.verify_message(coin_name, '14LmW5k4ssUrtbAB4255zdqv3b4w1TuX9e', unhexlify(signature), message)
+
+
+def test_ethereum_verify_message():
+    address = unhexlify('cb3864960e8db1a751212c580af27ee8867d688f')
+    signature = unhexlify('da2b73b0170479c2bfba3dd4839bf0d67732a44df8c873f3f3a2aca8a57d7bdc0b5d534f54c649e2d44135717001998b176d3cd1212366464db51f5838430fb31c')
+    assert verify.ethereum_verify_message(address, signature, LONG_MESSAGE)
+    assert verify.ethereum_verify_message('0xcb3864960e8db1a751212c580af27ee8867d688f', signature, LONG_MESSAGE)
+    assert not verify.ethereum_verify_message(address, signature, MESSAGE)
+
+
+def test_lisk_verify_message():
+    pubkey = unhexlify('eb56d7bbb5e8ea9269405f7a8527fe126023d1db2c973cfac6f760b60ae27294')
+    signature = unhexlify('7858ae7cd52ea6d4b17e800ca60144423db5560bfd618b663ffbf26ab66758563df45cbffae8463db22dc285dd94309083b8c807776085b97d05374d79867d05')
+    assert verify.lisk_verify_message(pubkey, signature, MESSAGE)
+    assert not verify.lisk_verify_message(pubkey, signature, LONG_MESSAGE)
+
+
+def test_verify_batch():
+    items = [(c, a, unhexlify(s), m) for c, a, s, m in BITCOIN_VECTORS]
+    items.append(items[0][:3] + (MESSAGE,))
+    expected = [True] * len(BITCOIN_VECTORS) + [False]
+    assert verify.verify_batch(verify.verify_message, items) == expected
+    assert verify.verify_batch(verify.verify_message, items, processes=2, chunksize=2) == expected
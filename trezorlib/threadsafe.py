@@ -0,0 +1,90 @@
+# This file is part of the Trezor project.
+#
+# Copyright (C) 2012-2018 SatoshiLabs and contributors
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the License along with this library.
+# If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
+
+import functools
+import logging
+import types
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, List
+
+LOG = logging.getLogger(__name__)
+
+
+def _call(func, *args, **kwargs):
+    # A generator would talk to the device from whichever thread consumes it
+    result = func(*args, **kwargs)
+    if isinstance(result, types.GeneratorType):
+        result = list(result)
+    return result
+
+
+class ThreadSafeClient(object):
+    """Facade that runs every call of a client on a single I/O thread.
+
+    Methods of the wrapped client are queued in submission order and
+    return a `Future` instead of the result, so any number of threads can
+    share one device without locking. Independent requests can be
+    pipelined by submitting them all before waiting for the results:
+
+    >>> safe = ThreadSafeClient(client)
+    >>> futures = [safe.get_public_node(n) for n in paths]
+    >>> nodes = [f.result() for f in futures]
+
+    The transport session is held open while the facade is in use.
+    Non-callable attributes, such as `features`, are returned directly.
+    Generators, such as the results of `get_addresses`, are consumed on the
+    I/O thread and their futures resolve to lists.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._executor.submit(client.transport.session_begin)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def submit(self, method, *args, **kwargs) -> Future:
+        """Queue `client.method(*args, **kwargs)` and return its future.
+
+        `method` is a method name or any callable taking the client as first argument.
+        """
+        if isinstance(method, str):
+            return self._executor.submit(_call, getattr(self.client, method), *args, **kwargs)
+        return self._executor.submit(_call, method, self.client, *args, **kwargs)
+
+    def map(self, method, *iterables: Iterable) -> List[Future]:
+        """Queue `method` for every set of arguments, like the builtin `map`."""
+        return [self.submit(method, *args) for args in zip(*iterables)]
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def queued(*args, **kwargs):
+            return self.submit(name, *args, **kwargs)
+        return queued
+
+    def close(self):
+        """Finish the queued requests, then end the session and close the client."""
+        self._executor.submit(self.client.transport.session_end)
+        self._executor.shutdown(wait=True)
+        self.client.close()
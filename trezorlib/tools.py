@@ -14,9 +14,11 @@
 # You should have received a copy of the License along with this library.
 # If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
 
+import functools
 import hashlib
+import re
 import struct
-from typing import NewType, List
+from typing import Iterator, NewType, List, Tuple
 
 from .coins import slip44
 
@@ -47,9 +49,7 @@ def hash_160(public_key):
 
 def hash_160_to_bc_address(h160, address_type):
     vh160 = struct.pack('<B', address_type) + h160
-    h = btc_hash(vh160)
-    addr = vh160 + h[0:4]
-    return b58encode(addr)
+    return b58check_encode(vh160)
 
 
 def compress_pubkey(public_key):
@@ -66,63 +66,122 @@ def public_key_to_bc_address(public_key, address_type, compress=True):
     return hash_160_to_bc_address(h160, address_type)
 
 
+_BECH32_CHARSET = 'qpzry9x8gf2tvdw0s3jn54khce6mua7l'
+
+
+def _bech32_polymod(values):
+    generator = (0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3)
+    chk = 1
+    for value in values:
+        top = chk >> 25
+        chk = (chk & 0x1ffffff) << 5 ^ value
+        for i in range(5):
+            chk ^= generator[i] if ((top >> i) & 1) else 0
+    return chk
+
+
+def _convertbits(data, frombits, tobits):
+    acc = 0
+    bits = 0
+    result = []
+    maxv = (1 << tobits) - 1
+    for value in data:
+        acc = (acc << frombits) | value
+        bits += frombits
+        while bits >= tobits:
+            bits -= tobits
+            result.append((acc >> bits) & maxv)
+    if bits:
+        result.append((acc << (tobits - bits)) & maxv)
+    return result
+
+
+def bech32_encode_address(hrp, witver, witprog):
+    """ encode witness program to segwit (BIP-173) address."""
+    data = [witver] + _convertbits(witprog, 8, 5)
+    hrp_expanded = [ord(c) >> 5 for c in hrp] + [0] + [ord(c) & 31 for c in hrp]
+    polymod = _bech32_polymod(hrp_expanded + data + [0] * 6) ^ 1
+    checksum = [(polymod >> 5 * (5 - i)) & 31 for i in range(6)]
+    return hrp + '1' + ''.join(_BECH32_CHARSET[d] for d in data + checksum)
+
+
 __b58chars = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
 __b58base = len(__b58chars)
+__b58values = {c: i for i, c in enumerate(__b58chars)}
+# base58 digits are converted ten at a time, 58 ** 10 still fits in a machine word
+__b58chunk = __b58base ** 10
+__b58pairs = [a + b for a in __b58chars for b in __b58chars]
 
 
 def b58encode(v):
     """ encode v, which is a string of bytes, to base58."""
+    long_value = int.from_bytes(v, 'big')
 
-    long_value = 0
-    for c in v:
-        long_value = long_value * 256 + c
-
-    result = ''
-    while long_value >= __b58base:
-        div, mod = divmod(long_value, __b58base)
-        result = __b58chars[mod] + result
-        long_value = div
-    result = __b58chars[long_value] + result
+    pairs = []
+    while long_value:
+        long_value, chunk = divmod(long_value, __b58chunk)
+        for _ in range(5):
+            chunk, mod = divmod(chunk, __b58base * __b58base)
+            pairs.append(__b58pairs[mod])
+    # strip the zero digits of the last chunk
+    result = ''.join(reversed(pairs)).lstrip(__b58chars[0])
 
     # Bitcoin does a little leading-zero-compression:
     # leading 0-bytes in the input become leading-1s
-    nPad = 0
-    for c in v:
-        if c == 0:
-            nPad += 1
-        else:
-            break
+    nPad = len(v) - len(bytes(v).lstrip(b'\0'))
 
-    return (__b58chars[0] * nPad) + result
+    return __b58chars[0] * nPad + result
 
 
 def b58decode(v, length):
     """ decode v into a string of len bytes."""
+    try:
+        values = [__b58values[c] for c in v]
+    except KeyError as e:
+        raise ValueError('Invalid base58 character: %r' % e.args[0]) from None
+
     long_value = 0
-    for (i, c) in enumerate(v[::-1]):
-        long_value += __b58chars.find(c) * (__b58base ** i)
-
-    result = b''
-    while long_value >= 256:
-        div, mod = divmod(long_value, 256)
-        result = struct.pack('B', mod) + result
-        long_value = div
-    result = struct.pack('B', long_value) + result
-
-    nPad = 0
-    for c in v:
-        if c == __b58chars[0]:
-            nPad += 1
-        else:
-            break
+    for i in range(0, len(values), 10):
+        chunk = 0
+        for value in values[i:i + 10]:
+            chunk = chunk * __b58base + value
+        long_value = long_value * __b58base ** len(values[i:i + 10]) + chunk
+
+    nPad = len(v) - len(v.lstrip(__b58chars[0]))
+    result = b'\x00' * nPad + long_value.to_bytes((long_value.bit_length() + 7) // 8, 'big')
 
-    result = b'\x00' * nPad + result
     if length is not None and len(result) != length:
         return None
 
     return result
 
 
+def b58check_encode(v):
+    """ encode v to base58 with a 4-byte double-SHA256 checksum."""
+    return b58encode(v + btc_hash(v)[:4])
+
+
+def b58check_decode(v):
+    """ decode base58check string v, raise ValueError on a bad checksum."""
+    data = b58decode(v, None)
+    if len(data) < 4 or btc_hash(data[:-4])[:4] != data[-4:]:
+        raise ValueError('Invalid base58 checksum')
+    return data[:-4]
+
+
+def b58encode_batch(values, check=False):
+    """ encode many strings of bytes, optionally with checksums."""
+    encode = b58check_encode if check else b58encode
+    return [encode(v) for v in values]
+
+
+def b58decode_batch(values, check=False):
+    """ decode many base58 strings, optionally verifying checksums."""
+    if check:
+        return [b58check_decode(v) for v in values]
+    return [b58decode(v, None) for v in values]
+
+
 def parse_path(nstr: str) -> Address:
     """
     Convert BIP32 path string to list of uint32 integers with hardened flags.
@@ -130,12 +189,15 @@ def parse_path(nstr: str) -> Address:
 
     e.g.: "0/1h/1" -> [0, 0x80000001, 1]
 
+    Parsed paths are memoized.
+
     :param nstr: path string
     :return: list of integers
     """
-    if not nstr:
-        return []
+    return list(_parse_path(nstr))
 
+
+def _split_path(nstr: str) -> List[str]:
     n = nstr.split('/')
 
     # m/a/b/c => a/b/c
@@ -143,19 +205,122 @@ def parse_path(nstr: str) -> Address:
         n = n[1:]
 
     # coin_name/a/b/c => 44'/SLIP44_constant'/a/b/c
-    if n[0] in slip44:
+    if n and n[0] in slip44:
         coin_id = slip44[n[0]]
         n[0:1] = ['44h', '{}h'.format(coin_id)]
 
-    def str_to_harden(x: str) -> int:
-        if x.startswith('-'):
-            return H_(abs(int(x)))
-        elif x.endswith(('h', "'")):
-            return H_(int(x[:-1]))
-        else:
-            return int(x)
+    return n
+
 
+def _str_to_harden(x: str) -> int:
+    if x.startswith('-'):
+        return H_(abs(int(x)))
+    elif x.endswith(('h', "'")):
+        return H_(int(x[:-1]))
+    else:
+        return int(x)
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_path(nstr: str) -> Tuple[int, ...]:
+    if not nstr:
+        return ()
     try:
-        return list(str_to_harden(x) for x in n)
+        return tuple(_str_to_harden(x) for x in _split_path(nstr))
     except Exception:
         raise ValueError('Invalid BIP32 path', nstr)
+
+
+_PATH_RANGE = re.compile(r"^(\{)?(\d+)-(\d+)(?(1)\})([h']?)$")
+_PATH_WILDCARD = re.compile(r"^\*([h']?)$")
+
+
+class PathTemplate(object):
+    """
+    Compiled BIP32 path template.
+
+    Besides indices accepted by `parse_path`, components can be inclusive
+    ranges written as {0-9} or 0-9, or the wildcard * for all indices.
+    A trailing h or ' hardens the whole range.
+
+    e.g.: "m/44h/0h/{0-9}h/0/*"
+
+    Iterating yields matching paths lazily, in lexicographic order.
+    Components before the first range are parsed once and shared.
+    """
+
+    def __init__(self, template: str):
+        self.template = template
+        components = []
+        for x in (_split_path(template) if template else []):
+            range_match = _PATH_RANGE.match(x)
+            wildcard_match = _PATH_WILDCARD.match(x)
+            if range_match:
+                start, end = int(range_match.group(2)), int(range_match.group(3))
+                if start > end or end >= HARDENED_FLAG:
+                    raise ValueError('Invalid BIP32 path', template)
+                flag = HARDENED_FLAG if range_match.group(4) else 0
+                components.append(range(start | flag, (end | flag) + 1))
+            elif wildcard_match:
+                flag = HARDENED_FLAG if wildcard_match.group(1) else 0
+                components.append(range(flag, flag + HARDENED_FLAG))
+            else:
+                try:
+                    components.append((_str_to_harden(x),))
+                except Exception:
+                    raise ValueError('Invalid BIP32 path', template)
+
+        split = 0
+        while split < len(components) and isinstance(components[split], tuple):
+            split += 1
+        self.prefix = [c[0] for c in components[:split]]  # type: Address
+        self.ranges = components[split:]
+
+    def __repr__(self):
+        return 'PathTemplate({!r})'.format(self.template)
+
+    def __len__(self):
+        count = 1
+        for r in self.ranges:
+            count *= len(r)
+        return count
+
+    def __contains__(self, address_n):
+        depth = len(self.prefix)
+        return (len(address_n) == depth + len(self.ranges) and
+                list(address_n[:depth]) == self.prefix and
+                all(i in r for i, r in zip(address_n[depth:], self.ranges)))
+
+    def __iter__(self) -> Iterator[Address]:
+        if not self.ranges:
+            return iter([list(self.prefix)])
+        return self._expand(0, self.prefix)
+
+    def _expand(self, depth, base):
+        if depth == len(self.ranges) - 1:
+            for index in self.ranges[depth]:
+                yield base + [index]
+        else:
+            for index in self.ranges[depth]:
+                yield from self._expand(depth + 1, base + [index])
+
+
+@functools.lru_cache(maxsize=256)
+def compile_path_template(nstr: str) -> PathTemplate:
+    """
+    Return the memoized `PathTemplate` for a template string.
+    """
+    return PathTemplate(nstr)
+
+
+def parse_path_template(nstr: str) -> Iterator[Address]:
+    """
+    Expand BIP32 path template to all paths it describes, lazily.
+    See `PathTemplate` for the syntax.
+
+    e.g.: "44h/0h/0h/0/0-2" -> [.., 0, 0], [.., 0, 1], [.., 0, 2]
+
+    :param nstr: path template string
+    :return: iterator of lists of integers
+    """
+    return iter(compile_path_template(nstr))
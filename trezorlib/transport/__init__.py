@@ -16,6 +16,8 @@
 
 import importlib
 import logging
+import threading
+from collections import namedtuple
 
 from typing import Iterable, Type, List, Set
 
@@ -26,10 +28,16 @@ class TransportException(Exception):
     pass
 
 
+# A message serialized and framed ahead of time by `Transport.encode`.
+# `data` is specific to the transport (and session) that encoded it.
+Encoded = namedtuple('Encoded', 'msg data')
+
+
 class Transport(object):
 
     def __init__(self):
         self.session_counter = 0
+        self.session_lock = threading.Lock()
 
     def __str__(self):
         return self.get_path()
@@ -38,14 +46,26 @@ class Transport(object):
         return '{}:{}'.format(self.PATH_PREFIX, self.device)
 
     def session_begin(self):
-        if self.session_counter == 0:
-            self.open()
-        self.session_counter += 1
+        with self.session_lock:
+            if self.session_counter == 0:
+                self.open()
+            self.session_counter += 1
 
     def session_end(self):
-        self.session_counter = max(self.session_counter - 1, 0)
-        if self.session_counter == 0:
-            self.close()
+        with self.session_lock:
+            self.session_counter = max(self.session_counter - 1, 0)
+            if self.session_counter == 0:
+                self.close()
+
+    def encode(self, msg):
+        """Serialize and frame `msg` now, to be sent later by `write_encoded`.
+
+        Transports without a faster path keep the message as it is.
+        """
+        return Encoded(msg, None)
+
+    def write_encoded(self, encoded):
+        self.write(encoded.msg)
 
     def open(self):
         raise NotImplementedError
@@ -23,7 +23,7 @@ import struct
 from .. import mapping
 from .. import messages
 from .. import protobuf
-from . import Transport, TransportException
+from . import Encoded, Transport, TransportException
 
 LOG = logging.getLogger(__name__)
 
@@ -78,15 +78,20 @@ class BridgeTransport(Transport):
         self.session = None
 
     def write(self, msg):
-        LOG.debug("sending message: {}".format(msg.__class__.__name__),
-                  extra={'protobuf': msg})
+        self.write_encoded(self.encode(msg))
+
+    def encode(self, msg):
         data = BytesIO()
         protobuf.dump_message(data, msg)
         ser = data.getvalue()
         header = struct.pack(">HL", mapping.get_type(msg), len(ser))
-        data = binascii.hexlify(header + ser).decode()
+        return Encoded(msg, binascii.hexlify(header + ser).decode())
+
+    def write_encoded(self, encoded):
+        LOG.debug("sending message: {}".format(encoded.msg.__class__.__name__),
+                  extra={'protobuf': encoded.msg})
         r = self.conn.post(
-            TREZORD_HOST + '/call/%s' % self.session, data=data, headers=self.HEADERS)
+            TREZORD_HOST + '/call/%s' % self.session, data=encoded.data, headers=self.HEADERS)
         if r.status_code != 200:
             raise TransportException('trezord: Could not write message' + get_error(r))
         self.response = r.text
@@ -21,7 +21,7 @@ import sys
 
 from ..protocol_v1 import ProtocolV1
 from ..protocol_v2 import ProtocolV2
-from . import Transport, TransportException
+from . import Encoded, Transport, TransportException
 
 DEV_TREZOR1 = (0x534c, 0x0001)
 DEV_TREZOR2 = (0x1209, 0x53c1)
@@ -131,6 +131,12 @@ class HidTransport(Transport):
     def write(self, msg):
         return self.protocol.write(self, msg)
 
+    def encode(self, msg):
+        return Encoded(msg, self.protocol.encode(msg))
+
+    def write_encoded(self, encoded):
+        return self.protocol.write_encoded(self, encoded.msg, encoded.data)
+
     def write_chunk(self, chunk):
         if len(chunk) != 64:
             raise TransportException('Unexpected chunk size: %d' % len(chunk))
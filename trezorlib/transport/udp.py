@@ -19,7 +19,7 @@ import socket
 
 from ..protocol_v1 import ProtocolV1
 from ..protocol_v2 import ProtocolV2
-from . import Transport, TransportException
+from . import Encoded, Transport, TransportException
 
 
 class UdpTransport(Transport):
@@ -107,6 +107,12 @@ class UdpTransport(Transport):
     def write(self, msg):
         return self.protocol.write(self, msg)
 
+    def encode(self, msg):
+        return Encoded(msg, self.protocol.encode(msg))
+
+    def write_encoded(self, encoded):
+        return self.protocol.write_encoded(self, encoded.msg, encoded.data)
+
     def write_chunk(self, chunk):
         if len(chunk) != 64:
             raise TransportException('Unexpected data length')
@@ -22,7 +22,7 @@ import sys
 
 from ..protocol_v1 import ProtocolV1
 from ..protocol_v2 import ProtocolV2
-from . import Transport, TransportException
+from . import Encoded, Transport, TransportException
 
 DEV_TREZOR1 = (0x534c, 0x0001)
 DEV_TREZOR2 = (0x1209, 0x53c1)
@@ -146,6 +146,12 @@ class WebUsbTransport(Transport):
     def write(self, msg):
         return self.protocol.write(self, msg)
 
+    def encode(self, msg):
+        return Encoded(msg, self.protocol.encode(msg))
+
+    def write_encoded(self, encoded):
+        return self.protocol.write_encoded(self, encoded.msg, encoded.data)
+
     def write_chunk(self, chunk):
         endpoint = DEBUG_ENDPOINT if self.debug else ENDPOINT
         if len(chunk) != 64:
@@ -15,31 +15,195 @@
 # If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
 
 import binascii
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
+from io import BytesIO
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import sqlite3
+import struct
+import threading
+import time
 
 from . import messages as proto
+from . import protobuf
 cache_dir = None
+# default transaction cache of all TxApi instances without their own `cache`
+tx_cache = None
+
+
+class TxCache(object):
+    """Storage of previous transactions, keyed by network and txhash.
+
+    `get` returns None for transactions that are not cached.
+    """
+
+    def get(self, network, txhash):
+        return None
+
+    def put(self, network, txhash, tx):
+        pass
+
+
+class SqliteTxCache(TxCache):
+    """Transactions kept as serialized `TransactionType` in one sqlite file."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        # sign_tx fetches previous transactions from worker threads
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS txs ('
+                            'network TEXT NOT NULL, txhash TEXT NOT NULL, data BLOB NOT NULL, '
+                            'PRIMARY KEY (network, txhash))')
+
+    def get(self, network, txhash):
+        with self.lock:
+            row = self.db.execute('SELECT data FROM txs WHERE network = ? AND txhash = ?',
+                                  (network, txhash)).fetchone()
+        if row is None:
+            return None
+        return protobuf.load_message(BytesIO(row[0]), proto.TransactionType)
+
+    def put(self, network, txhash, tx):
+        data = BytesIO()
+        protobuf.dump_message(data, tx)
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO txs VALUES (?, ?, ?)',
+                            (network, txhash, data.getvalue()))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class LRUTxCache(TxCache):
+    """In-process cache of the most recently used transactions.
+
+    Misses are looked up in `backend`, e.g. a `SqliteTxCache`, and new
+    transactions are written through to it. Cached transactions are shared
+    between callers and must not be modified.
+    """
+
+    def __init__(self, backend=None, maxsize=1024):
+        self.backend = backend
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self._txs = OrderedDict()
+
+    def __len__(self):
+        return len(self._txs)
+
+    def _remember(self, key, tx):
+        with self.lock:
+            self._txs[key] = tx
+            self._txs.move_to_end(key)
+            if len(self._txs) > self.maxsize:
+                self._txs.popitem(last=False)
+
+    def get(self, network, txhash):
+        key = (network, txhash)
+        with self.lock:
+            tx = self._txs.get(key)
+            if tx is not None:
+                self._txs.move_to_end(key)
+                return tx
+        if self.backend is None:
+            return None
+        tx = self.backend.get(network, txhash)
+        if tx is not None:
+            self._remember(key, tx)
+        return tx
+
+    def put(self, network, txhash, tx):
+        self._remember((network, txhash), tx)
+        if self.backend is not None:
+            self.backend.put(network, txhash, tx)
+
+    def clear(self):
+        with self.lock:
+            self._txs.clear()
 
 
 class TxApi(object):
+    # seconds to wait for the server to connect and to send data
+    TIMEOUT = 10
+    # retries of failed connections and 5xx responses, with exponential backoff
+    RETRIES = 3
+    # default number of transactions fetched at once by `get_txs`
+    MAX_WORKERS = 8
+    # seconds for which `get_block` results are reused
+    BLOCK_CACHE_TTL = 60
 
-    def __init__(self, network, url=None):
+    def __init__(self, network, url=None, cache=None):
         self.network = network
         self.url = url
+        self.cache = cache
+        self.timeout = self.TIMEOUT
+        self.block_cache_ttl = self.BLOCK_CACHE_TTL
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._blocks = {}
+        self._blocks_lock = threading.Lock()
+
+    @property
+    def session(self):
+        # created on first use, there is a TxApi for every known coin
+        with self._session_lock:
+            if self._session is None:
+                session = requests.Session()
+                session.headers['User-agent'] = 'Mozilla/5.0'
+                retry = Retry(total=self.RETRIES, backoff_factor=0.2, status_forcelist=(500, 502, 503, 504))
+                adapter = HTTPAdapter(max_retries=retry, pool_maxsize=self.MAX_WORKERS)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session
+            return self._session
+
+    def close(self):
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
 
     def get_url(self, resource, resourceid):
         url = '%s%s/%s' % (self.url, resource, resourceid)
         return url
 
-    def get_block(self, block_number):  # currunt block - block_number
-        r = requests.get(self.url + '/blocks/')
-        j = r.json(parse_float=str)
+    def _get_json(self, url):
+        try:
+            r = self.session.get(url, timeout=self.timeout)
+            r.raise_for_status()
+            return r.json(parse_float=str)
+        except (requests.RequestException, ValueError) as e:
+            raise RuntimeError('URL error: %s' % url) from e
+
+    def get_block(self, block_number):
+        """Return (block hash, block height) of the block `block_number` blocks
+        below the current one.
+
+        Results are reused for `block_cache_ttl` seconds, so that all outputs
+        of a transaction refer to the same block with a single lookup.
+        """
+        now = time.monotonic()
+        with self._blocks_lock:
+            cached = self._blocks.get(block_number)
+        if cached is not None and now - cached[0] < self.block_cache_ttl:
+            return cached[1]
+        block = self.fetch_block(block_number)
+        with self._blocks_lock:
+            self._blocks[block_number] = (now, block)
+        return block
+
+    def fetch_block(self, block_number):  # currunt block - block_number
+        j = self._get_json(self.url + '/blocks/')
         block_height = j['blocks'][0]['height']
         block_height -= block_number
-        r = requests.get(self.url + '/block-index/' + str(block_height))
-        j = r.json(parse_float=str)
+        j = self._get_json(self.url + '/block-index/' + str(block_height))
         block_hash = j['blockHash']
         block_hash_flipped = binascii.unhexlify("".join(reversed([block_hash[i:i + 2] for i in range(0, len(block_hash), 2)])))
         return block_hash_flipped, block_height
@@ -49,35 +213,98 @@ class TxApi(object):
         if cache_dir:
             cache_file = '%s/%s_%s_%s.json' % (cache_dir, self.network, resource, resourceid)
             try:  # looking into cache first
-                j = json.load(open(cache_file), parse_float=str)
-                return j
-            except:
+                with open(cache_file) as f:
+                    return json.load(f, parse_float=str)
+            except (OSError, ValueError):
                 pass
 
         if not self.url:
             raise RuntimeError("No URL specified and tx not in cache")
 
-        try:
-            url = self.get_url('/' + resource, resourceid)
-            r = requests.get(url, headers={'User-agent': 'Mozilla/5.0'})
-            j = r.json(parse_float=str)
-        except:
-            raise RuntimeError('URL error: %s' % url)
-        if cache_dir and cache_file:
+        j = self._get_json(self.get_url('/' + resource, resourceid))
+        if cache_dir:
             try:  # saving into cache
-                json.dump(j, open(cache_file, 'w'))
-            except:
+                with open(cache_file, 'w') as f:
+                    json.dump(j, f)
+            except OSError:
                 pass
         return j
 
     def get_tx(self, txhash):
+        """Return previous transaction `txhash` as `TransactionType`.
+
+        Transactions are looked up in `cache`, or the module-level `tx_cache`,
+        before they are fetched.
+        """
+        cache = self.cache if self.cache is not None else tx_cache
+        if cache is not None:
+            tx = cache.get(self.network, txhash)
+            if tx is not None:
+                return tx
+        tx = self.fetch_tx(txhash)
+        if cache is not None:
+            cache.put(self.network, txhash, tx)
+        return tx
+
+    def get_txs(self, txhashes, max_workers=None):
+        """Fetch several transactions concurrently.
+
+        Returns an OrderedDict of txhash to `TransactionType`, in the order
+        of `txhashes`. At most `max_workers` transactions are fetched at once.
+        If a fetch fails, the pending ones are cancelled and the error is raised.
+        """
+        return wait_txs(submit_txs(self.get_tx, txhashes, max_workers or self.MAX_WORKERS))
+
+    def fetch_tx(self, txhash):
         raise NotImplementedError
 
 
+def submit_txs(get_tx, txhashes, max_workers=TxApi.MAX_WORKERS):
+    """Start fetching transactions with `get_tx` in background threads.
+
+    Returns an OrderedDict of txhash to Future, in order of first appearance
+    in `txhashes`. `get_tx` is any callable taking a txhash, e.g. the `get_tx`
+    method of a `TxApi` or a `TxStore`.
+    """
+    futures = OrderedDict.fromkeys(txhashes)
+    if not futures:
+        return futures
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(futures)))
+    for txhash in futures:
+        futures[txhash] = executor.submit(get_tx, txhash)
+    executor.shutdown(wait=False)
+    return futures
+
+
+def wait_txs(futures):
+    """Wait for the Futures returned by `submit_txs`.
+
+    Returns an OrderedDict of txhash to `TransactionType`. If a fetch fails,
+    the pending ones are cancelled and the error is raised.
+    """
+    try:
+        return OrderedDict((txhash, future.result()) for txhash, future in futures.items())
+    except BaseException:
+        for future in futures.values():
+            future.cancel()
+        raise
+
+
+def _set_block_reference(output, bip115):
+    # BIP115 replay protection: <block hash> <block height> OP_CHECKBLOCKATHEIGHT
+    script = output.script_pubkey
+    if bip115 and len(script) == 63 and script[-1:] == b'\xb4':
+        output.block_hash = script[-37:-5]
+        output.block_height = int.from_bytes(script[-4:-1], byteorder='little')
+    else:
+        output.block_hash = None
+        output.block_height = None
+
+
 class TxApiInsight(TxApi):
 
-    def __init__(self, network, url=None, zcash=None, bip115=False):
-        super().__init__(network, url)
+    def __init__(self, network, url=None, zcash=None, bip115=False, cache=None):
+        super().__init__(network, url, cache)
         self.zcash = zcash
         self.bip115 = bip115
         if url:
@@ -86,7 +313,7 @@ class TxApiInsight(TxApi):
                 link, api = link.split('/')
             self.pushtx_url = http_protocol + '://' + link + '/tx/send'
 
-    def get_tx(self, txhash):
+    def fetch_tx(self, txhash):
 
         data = self.fetch_json('tx', txhash)
 
@@ -112,13 +339,7 @@ class TxApiInsight(TxApi):
             o = t._add_bin_outputs()
             o.amount = int(Decimal(vout['value']) * 100000000)
             o.script_pubkey = binascii.unhexlify(vout['scriptPubKey']['hex'])
-            if(self.bip115 and len(o.script_pubkey) == 63 and o.script_pubkey[-1:] == b'\xb4'):
-                o.block_hash = o.script_pubkey[-37:-5]
-                o.block_height = int.from_bytes(o.script_pubkey[-4:-1], byteorder='little')
-
-            else:
-                o.block_hash = None
-                o.block_height = None
+            _set_block_reference(o, self.bip115)
 
         if self.zcash:
             t.overwintered = data.get('fOverwintered', False)
@@ -137,3 +358,139 @@ class TxApiInsight(TxApi):
                     t.extra_data = raw[-extra_data_len:]
 
         return t
+
+
+_U16 = struct.Struct('<H')
+_U32 = struct.Struct('<I')
+_U64 = struct.Struct('<Q')
+_OUTPOINT = struct.Struct('<32sI')
+_DECRED_INPUT = struct.Struct('<32sIBI')
+_DECRED_LOCK = struct.Struct('<II')
+_DECRED_WITNESS = struct.Struct('<QII')
+
+
+class _TxReader(object):
+    # sequential reader of a serialized transaction
+
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.offset = 0
+
+    def unpack(self, fmt):
+        values = fmt.unpack_from(self.data, self.offset)
+        self.offset += fmt.size
+        return values
+
+    def varint(self):
+        n = self.data[self.offset]
+        self.offset += 1
+        if n < 0xfd:
+            return n
+        fmt = _U16 if n == 0xfd else _U32 if n == 0xfe else _U64
+        return self.unpack(fmt)[0]
+
+    def read(self, length=None):
+        if length is None:
+            length = self.varint()
+        end = self.offset + length
+        if end > len(self.data):
+            raise ValueError('Transaction is truncated')
+        data = self.data[self.offset:end].tobytes()
+        self.offset = end
+        return data
+
+    def rest(self):
+        return self.read(len(self.data) - self.offset)
+
+
+def _parse_decred_tx(r, t):
+    header, = r.unpack(_U32)
+    if header >> 16:
+        raise ValueError('Only fully serialized Decred transactions are supported')
+    t.version = header & 0xffff
+    for _ in range(r.varint()):
+        i = t._add_inputs()
+        prev_hash, i.prev_index, i.decred_tree, i.sequence = r.unpack(_DECRED_INPUT)
+        i.prev_hash = prev_hash[::-1]
+    for _ in range(r.varint()):
+        o = t._add_bin_outputs()
+        o.amount, = r.unpack(_U64)
+        o.decred_script_version, = r.unpack(_U16)
+        o.script_pubkey = r.read()
+    t.lock_time, t.expiry = r.unpack(_DECRED_LOCK)
+    if r.varint() != len(t.inputs):
+        raise ValueError('Witness count does not match the number of inputs')
+    for i in t.inputs:
+        r.unpack(_DECRED_WITNESS)  # value in, block height and index
+        i.script_sig = r.read()
+
+
+def parse_tx(data, zcash=False, decred=False, bip115=False) -> proto.TransactionType:
+    """Parse a serialized transaction into the `TransactionType` sent to the device.
+
+    Handles legacy and segwit Bitcoin transactions, Zcash up to overwinter,
+    fully serialized Decred transactions and BIP115 outputs.
+    """
+    r = _TxReader(data)
+    t = proto.TransactionType()
+    try:
+        if decred:
+            _parse_decred_tx(r, t)
+            return t
+
+        header, = r.unpack(_U32)
+        overwintered = zcash and bool(header & 0x80000000)
+        t.version = header & 0x7fffffff if zcash else header
+        if overwintered:
+            r.unpack(_U32)  # version group id
+
+        segwit = not zcash and r.data[r.offset] == 0 and r.data[r.offset + 1] == 1
+        if segwit:
+            r.offset += 2
+
+        for _ in range(r.varint()):
+            i = t._add_inputs()
+            prev_hash, i.prev_index = r.unpack(_OUTPOINT)
+            i.prev_hash = prev_hash[::-1]
+            i.script_sig = r.read()
+            i.sequence, = r.unpack(_U32)
+
+        for _ in range(r.varint()):
+            o = t._add_bin_outputs()
+            o.amount, = r.unpack(_U64)
+            o.script_pubkey = r.read()
+            _set_block_reference(o, bip115)
+
+        if segwit:
+            for _ in t.inputs:
+                for _ in range(r.varint()):
+                    r.read()
+
+        t.lock_time, = r.unpack(_U32)
+        if zcash:
+            t.overwintered = overwintered
+            t.expiry = r.unpack(_U32)[0] if overwintered else 0
+            if t.version >= 2:
+                t.extra_data = r.rest()
+    except (struct.error, IndexError):
+        raise ValueError('Transaction is truncated')
+
+    if r.offset != len(r.data):
+        raise ValueError('Unexpected data after transaction')
+    return t
+
+
+class TxApiRaw(TxApiInsight):
+    """Previous transactions from the Insight `rawtx` resource.
+
+    Only the serialized transaction is downloaded, one request per
+    transaction, and it is parsed locally with `parse_tx`.
+    """
+
+    def __init__(self, network, url=None, zcash=None, bip115=False, decred=False, cache=None):
+        super().__init__(network, url, zcash, bip115, cache)
+        self.decred = decred
+
+    def fetch_tx(self, txhash):
+        raw = binascii.unhexlify(self.fetch_json('rawtx', txhash)['rawtx'])
+        return parse_tx(raw, zcash=self.zcash, decred=self.decred, bip115=self.bip115)
@@ -0,0 +1,170 @@
+# This file is part of the Trezor project.
+#
+# Copyright (C) 2012-2018 SatoshiLabs and contributors
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the License along with this library.
+# If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
+
+'''
+On-disk store of previous transactions for signing.
+
+Every transaction is kept in its own file, which is memory-mapped on load.
+Inputs and outputs are decoded one at a time when the device asks for them,
+so memory usage does not depend on the size of the referenced transactions.
+
+File layout (all integers little-endian):
+
+    magic           4 bytes, b'TXS1'
+    meta_len        uint32
+    inputs_count    uint32
+    outputs_count   uint32
+    meta            TransactionType without inputs and outputs (protobuf)
+    offsets         (inputs_count + outputs_count + 1) * uint64
+    items           serialized TxInputType and TxOutputBinType messages
+
+Offsets are relative to the start of the items section. Item `i` spans
+from `offsets[i]` to `offsets[i + 1]`, inputs come before outputs.
+'''
+
+import mmap
+import os
+import struct
+import tempfile
+from collections.abc import Sequence
+from io import BytesIO
+
+from . import messages as proto
+from . import protobuf
+
+MAGIC = b'TXS1'
+_HEADER = struct.Struct('<4sIII')
+_OFFSET = struct.Struct('<Q')
+
+
+class _LazyItems(Sequence):
+    # Read-only sequence of protobuf messages decoded on access
+
+    def __init__(self, data, offsets_start, items_start, first, count, msg_type):
+        self.data = data
+        self.offsets_start = offsets_start
+        self.items_start = items_start
+        self.first = first
+        self.count = count
+        self.msg_type = msg_type
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('item index out of range')
+
+        pos = self.offsets_start + (self.first + index) * _OFFSET.size
+        start, = _OFFSET.unpack_from(self.data, pos)
+        end, = _OFFSET.unpack_from(self.data, pos + _OFFSET.size)
+        item = self.data[self.items_start + start:self.items_start + end]
+        return protobuf.load_message(BytesIO(item), self.msg_type)
+
+
+def dump_tx(fp, tx: proto.TransactionType) -> None:
+    """Write `tx` to the binary file object `fp` in the indexed format."""
+    meta = proto.TransactionType()
+    meta.CopyFrom(tx)
+    meta.inputs = []
+    meta.bin_outputs = []
+    meta.outputs = []
+    meta_data = BytesIO()
+    protobuf.dump_message(meta_data, meta)
+    meta_data = meta_data.getvalue()
+
+    items = BytesIO()
+    offsets = [0]
+    for item in list(tx.inputs) + list(tx.bin_outputs):
+        protobuf.dump_message(items, item)
+        offsets.append(items.tell())
+
+    fp.write(_HEADER.pack(MAGIC, len(meta_data), len(tx.inputs), len(tx.bin_outputs)))
+    fp.write(meta_data)
+    fp.write(b''.join(_OFFSET.pack(offset) for offset in offsets))
+    fp.write(items.getvalue())
+
+
+def load_tx(data) -> proto.TransactionType:
+    """Load a transaction from a buffer in the indexed format.
+
+    Only the scalar fields are decoded. `inputs` and `bin_outputs` are
+    read-only sequences decoding items from `data` on access.
+    """
+    magic, meta_len, inputs_count, outputs_count = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError('Not a stored transaction')
+
+    meta_start = _HEADER.size
+    offsets_start = meta_start + meta_len
+    items_start = offsets_start + (inputs_count + outputs_count + 1) * _OFFSET.size
+
+    tx = protobuf.load_message(BytesIO(data[meta_start:offsets_start]), proto.TransactionType)
+    tx.inputs = _LazyItems(data, offsets_start, items_start,
+                           0, inputs_count, proto.TxInputType)
+    tx.bin_outputs = _LazyItems(data, offsets_start, items_start,
+                                inputs_count, outputs_count, proto.TxOutputBinType)
+    return tx
+
+
+class TxStore(object):
+    """Directory of previous transactions in the indexed format.
+
+    Can be used in place of a `TxApi`: transactions missing from the store
+    are fetched through `tx_api`, written to disk, and then served from
+    the memory-mapped file.
+
+    >>> client.set_tx_api(TxStore('/var/cache/txstore', coins.tx_api['Bitcoin']))
+    """
+
+    def __init__(self, directory, tx_api=None):
+        self.directory = directory
+        self.tx_api = tx_api
+        os.makedirs(directory, exist_ok=True)
+
+    def get_path(self, txhash):
+        return os.path.join(self.directory, '%s.tx' % txhash)
+
+    def __contains__(self, txhash):
+        return os.path.exists(self.get_path(txhash))
+
+    def save(self, txhash, tx):
+        path = self.get_path(txhash)
+        # unique name, so that concurrent writers of one txhash do not collide
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with open(fd, 'wb') as f:
+                dump_tx(f, tx)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def load(self, txhash):
+        with open(self.get_path(txhash), 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return load_tx(data)
+
+    def get_tx(self, txhash):
+        if txhash not in self:
+            if self.tx_api is None:
+                raise RuntimeError('Transaction %s not in store' % txhash)
+            self.save(txhash, self.tx_api.get_tx(txhash))
+        return self.load(txhash)
@@ -0,0 +1,203 @@
+# This file is part of the Trezor project.
+#
+# Copyright (C) 2012-2018 SatoshiLabs and contributors
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License version 3
+# as published by the Free Software Foundation.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the License along with this library.
+# If not, see <https://www.gnu.org/licenses/lgpl-3.0.html>.
+
+'''
+Host-side verification of signed messages.
+
+The functions accept the same arguments as `verify_message`,
+`ethereum_verify_message` and `lisk_verify_message` of the client and
+return the same result, without talking to a device.
+'''
+
+import binascii
+import hashlib
+import multiprocessing
+import struct
+from typing import Callable, Iterable, List
+
+from . import _ed25519
+from . import _secp256k1 as secp256k1
+from . import messages as proto
+from .bip32 import public_key_to_address
+from .client import normalize_nfc
+from .coins import by_name as coins_by_name
+
+
+def _ser_length(length):
+    if length < 253:
+        return struct.pack('<B', length)
+    if length < 0x10000:
+        return struct.pack('<BH', 253, length)
+    return struct.pack('<BI', 254, length)
+
+
+def _recover(digest, signature, recid):
+    # public key point that signed `digest`, or None
+    r = int.from_bytes(signature[:32], 'big')
+    s = int.from_bytes(signature[32:64], 'big')
+    if not (0 < r < secp256k1.N and 0 < s < secp256k1.N):
+        return None
+    x = r + (recid >> 1) * secp256k1.N
+    if x >= secp256k1.P:
+        return None
+    try:
+        R = secp256k1.decompress(bytes((2 + (recid & 1),)) + x.to_bytes(32, 'big'))
+    except ValueError:
+        return None
+    e = int.from_bytes(digest, 'big')
+    r_inv = secp256k1.inv(r, secp256k1.N)
+    Q = secp256k1.mul_add_g(-e * r_inv % secp256k1.N, R, s * r_inv % secp256k1.N)
+    if not Q[2]:
+        return None
+    return secp256k1.to_affine(Q)
+
+
+# Keccak-256 as used by Ethereum, which differs from hashlib.sha3_256 in padding
+
+_KECCAK_RC = (
+    0x0000000000000001, 0x0000000000008082, 0x800000000000808A, 0x8000000080008000,
+    0x000000000000808B, 0x0000000080000001, 0x8000000080008081, 0x8000000000008009,
+    0x000000000000008A, 0x0000000000000088, 0x0000000080008009, 0x000000008000000A,
+    0x000000008000808B, 0x800000000000008B, 0x8000000000008089, 0x8000000000008003,
+    0x8000000000008002, 0x8000000000000080, 0x000000000000800A, 0x800000008000000A,
+    0x8000000080008081, 0x8000000000008080, 0x0000000080000001, 0x8000000080008008,
+)
+# rotation offsets and destination lane of the rho and pi steps, by lane x + 5 * y
+_KECCAK_ROT = (0, 1, 62, 28, 27, 36, 44, 6, 55, 20, 3, 10, 43, 25, 39, 41, 45, 15, 21, 8, 18, 2, 61, 56, 14)
+_KECCAK_PI = tuple(y + 5 * ((2 * x + 3 * y) % 5) for y in range(5) for x in range(5))
+_MASK64 = (1 << 64) - 1
+
+
+def _keccak_f(A):
+    for rc in _KECCAK_RC:
+        C = [A[x] ^ A[x + 5] ^ A[x + 10] ^ A[x + 15] ^ A[x + 20] for x in range(5)]
+        D = [C[x - 1] ^ (((C[(x + 1) % 5] << 1) | (C[(x + 1) % 5] >> 63)) & _MASK64) for x in range(5)]
+        B = [0] * 25
+        for i in range(25):
+            lane = A[i] ^ D[i % 5]
+            rot = _KECCAK_ROT[i]
+            B[_KECCAK_PI[i]] = ((lane << rot) | (lane >> (64 - rot))) & _MASK64
+        A = [B[i] ^ (~B[i - i % 5 + (i + 1) % 5] & B[i - i % 5 + (i + 2) % 5]) for i in range(25)]
+        A[0] ^= rc
+    return A
+
+
+def keccak_256(data: bytes) -> bytes:
+    rate = 136
+    padded = bytearray(data)
+    padded.append(0x01)
+    padded.extend(b'\x00' * (-len(padded) % rate))
+    padded[-1] |= 0x80
+    state = [0] * 25
+    for offset in range(0, len(padded), rate):
+        block = struct.unpack_from('<17Q', padded, offset)
+        for i in range(17):
+            state[i] ^= block[i]
+        state = _keccak_f(state)
+    return struct.pack('<4Q', *state[:4])
+
+
+def verify_message(coin_name: str, address: str, signature: bytes, message) -> bool:
+    """Verify a message signed with `sign_message`.
+
+    Raises ValueError for coins whose addresses cannot be checked here.
+    """
+    coin = coins_by_name[coin_name]
+    if coin['curve_name'] != 'secp256k1' or coin['decred']:
+        raise ValueError("Message verification not supported for {}".format(coin_name))
+    if coin['cashaddr_prefix']:
+        raise ValueError("Cashaddr addresses are not supported")
+    if len(signature) != 65:
+        return False
+    header = signature[0]
+    if 27 <= header <= 34:
+        script_type = proto.InputScriptType.SPENDADDRESS
+    elif 35 <= header <= 38:
+        script_type = proto.InputScriptType.SPENDP2SHWITNESS
+    elif 39 <= header <= 42:
+        script_type = proto.InputScriptType.SPENDWITNESS
+    else:
+        return False
+    recid = (header - 27) & 3
+    compressed = header >= 31
+
+    message = normalize_nfc(message)
+    prefix = coin['signed_message_header'].encode()
+    data = _ser_length(len(prefix)) + prefix + _ser_length(len(message)) + message
+    digest = hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+    point = _recover(digest, signature[1:], recid)
+    if point is None:
+        return False
+    if compressed:
+        public_key = secp256k1.compress(point)
+    else:
+        public_key = b'\x04' + point[0].to_bytes(32, 'big') + point[1].to_bytes(32, 'big')
+    try:
+        return public_key_to_address(public_key, coin_name, script_type) == address
+    except ValueError:
+        return False
+
+
+def ethereum_verify_message(address, signature: bytes, message) -> bool:
+    """Verify a message signed with `ethereum_sign_message`.
+
+    `address` is 20 raw bytes or a hex string, with or without 0x prefix.
+    """
+    if isinstance(address, str):
+        address = binascii.unhexlify(address[2:] if address.startswith('0x') else address)
+    if len(signature) != 65 or signature[64] not in (27, 28):
+        return False
+
+    message = normalize_nfc(message)
+    digest = keccak_256(b'\x19Ethereum Signed Message:\n' + str(len(message)).encode() + message)
+    point = _recover(digest, signature[:64], signature[64] - 27)
+    if point is None:
+        return False
+    public_key = point[0].to_bytes(32, 'big') + point[1].to_bytes(32, 'big')
+    return keccak_256(public_key)[12:] == address
+
+
+def lisk_verify_message(pubkey: bytes, signature: bytes, message) -> bool:
+    """Verify a message signed with `lisk_sign_message`."""
+    message = normalize_nfc(message)
+    prefix = b'Lisk Signed Message:\n'
+    data = _ser_length(len(prefix)) + prefix + _ser_length(len(message)) + message
+    digest = hashlib.sha256(hashlib.sha256(data).digest()).digest()
+    try:
+        _ed25519.checkvalid(signature, digest, pubkey)
+    except Exception:
+        return False
+    return True
+
+
+def _star(args):
+    func, item = args
+    return func(*item)
+
+
+def verify_batch(func: Callable[..., bool], items: Iterable[tuple], processes: int = None, chunksize: int = 256) -> List[bool]:
+    """Verify many messages with one of the verifiers of this module.
+
+    Every item is a tuple of arguments of `func`. With `processes`,
+    verification is spread over that many worker processes.
+
+    >>> verify_batch(verify_message, [('Bitcoin', address, signature, message), ...], processes=4)
+    """
+    if not processes:
+        return [func(*item) for item in items]
+    with multiprocessing.Pool(processes) as pool:
+        return pool.map(_star, ((func, item) for item in items), chunksize)